@@ -1,18 +1,20 @@
 import streamlit as st
-import pyrebase
-import json
 import time
 import pandas as pd
-from pathlib import Path
 from datetime import datetime
 from streamlit_mic_recorder import mic_recorder
 
 # Modules
-from modules.pdf_processor import extract_text_from_pdf
-from modules.data_handler import save_result_to_cloud, load_history_from_cloud
-from modules.llm_handler import explain_with_emotion, simplify_concept, generate_quick_activity, simplify_previous_answer
-from modules.voice_handler import listen_to_user, text_to_audio_file
-from modules.quiz_generator import generate_quiz
+from modules.ingest import IngestJob
+from modules.data_handler import get_firebase, get_profile, save_profile, invalidate_profile, save_result_to_cloud, load_history_from_cloud, load_history_summary, load_recent_history, resume_pending_writes, unsynced_results
+from modules.llm_handler import explain_with_emotion, simplify_concept, generate_quick_activity, simplify_previous_answer, prefetch_simplified_answer, LLMError
+from modules.voice_handler import listen_to_user, text_to_audio_bytes
+from modules.tts_pipeline import SpeechStream
+from modules.quiz_generator import stream_quiz_from_index, normalize_question
+from modules.quiz_bank import get_quiz_bank
+from modules.document_store import get_document_store
+from modules.audio_cache import audio_mime
+from modules.metrics import start_exporters
 
 # ==========================
 # 1. PAGE CONFIG
@@ -24,6 +26,9 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Latency/size metrics export (only when AURALEARN_METRICS=1)
+start_exporters()
+
 # ==========================
 # 2. THEME & CSS ENGINE
 # ==========================
@@ -113,52 +118,18 @@ def inject_css():
 
 
 
-import os # Ensure this is imported at the top
-
-# ... (Your CSS and Imports remain the same)
-
 # ==========================
 # 3. FIREBASE SETUP (Universal: Cloud + Local)
 # ==========================
-import os
-
-firebaseConfig = None
-
-# 1. Try Environment Variables (Render)
-if os.getenv("FIREBASE_API_KEY"):
-    firebaseConfig = {
-        "apiKey": os.getenv("FIREBASE_API_KEY"),
-        "authDomain": os.getenv("FIREBASE_AUTH_DOMAIN"),
-        "databaseURL": os.getenv("FIREBASE_DATABASE_URL"),
-        "projectId": os.getenv("FIREBASE_PROJECT_ID"),
-        "storageBucket": os.getenv("FIREBASE_STORAGE_BUCKET"),
-        "messagingSenderId": os.getenv("FIREBASE_MESSAGING_SENDER_ID"),
-        "appId": os.getenv("FIREBASE_APP_ID")
-    }
-
-# 2. Try Streamlit Secrets (Streamlit Cloud) - Wrapped in try/except to prevent crash
-if not firebaseConfig:
-    try:
-        if "firebase" in st.secrets:
-            firebaseConfig = dict(st.secrets["firebase"])
-    except: pass # File not found, ignore
-
-# 3. Try Local File (Localhost)
-if not firebaseConfig:
-    config_path = Path("config/firebase_config.json")
-    if config_path.exists():
-        with open(config_path) as f:
-            firebaseConfig = json.load(f)
-
-# Initialize
-if firebaseConfig:
-    try:
-        firebase = pyrebase.initialize_app(firebaseConfig)
-        auth = firebase.auth()
-        db = firebase.database()
-    except Exception as e:
-        st.error(f"Firebase Init Error: {e}")
-        st.stop()
+# The app and its HTTP session are shared by every rerun and session (see data_handler.get_firebase)
+try:
+    firebase = get_firebase()
+except Exception as e:
+    st.error(f"Firebase Init Error: {e}")
+    st.stop()
+
+if firebase:
+    auth = firebase.auth()
 else:
     st.error("❌ Configuration missing. Please set Environment Variables in Render.")
     st.stop()
@@ -169,19 +140,27 @@ else:
 if "user" not in st.session_state: st.session_state.user = None
 if isinstance(st.session_state.user, str): st.session_state.user = None
 
-if "extracted_text" not in st.session_state: st.session_state.extracted_text = ""
+# Handle into the shared document store (the text itself is never copied into the session)
+if "doc" not in st.session_state: st.session_state.doc = None
+if "ingest_job" not in st.session_state: st.session_state.ingest_job = None
+if "ingest_version" not in st.session_state: st.session_state.ingest_version = -1
 if "current_mood" not in st.session_state: st.session_state.current_mood = "neutral"
 if "tutor_message" not in st.session_state: st.session_state.tutor_message = ""
 
 # AUDIO (Independent channels)
-if "chat_audio_path" not in st.session_state: st.session_state.chat_audio_path = None
-if "tutor_audio_path" not in st.session_state: st.session_state.tutor_audio_path = None
+if "chat_audio" not in st.session_state: st.session_state.chat_audio = None
+if "tutor_audio" not in st.session_state: st.session_state.tutor_audio = None
+# Seconds already played while streaming, so the full clip resumes instead of restarting
+if "chat_audio_start" not in st.session_state: st.session_state.chat_audio_start = 0.0
+if "tutor_audio_start" not in st.session_state: st.session_state.tutor_audio_start = 0.0
 
 if "quiz_data" not in st.session_state: st.session_state.quiz_data = []
 if "quiz_submitted" not in st.session_state: st.session_state.quiz_submitted = False
 if "quiz_ref" not in st.session_state: st.session_state.quiz_ref = 0 
+if "quiz_seen" not in st.session_state: st.session_state.quiz_seen = {}  # doc key -> normalized questions served
 if "last_bot_answer" not in st.session_state: st.session_state.last_bot_answer = ""
 if "last_user_question" not in st.session_state: st.session_state.last_user_question = ""
+if "simplified_prefetch" not in st.session_state: st.session_state.simplified_prefetch = None
 if "username_display" not in st.session_state: st.session_state.username_display = ""
 
 # ==========================
@@ -216,9 +195,12 @@ def auth_screen():
                     # 2. Handle Result (OUTSIDE try/except to allow rerun)
                     if user_obj:
                         st.session_state.user = user_obj
+                        # Results journaled under an old (expired) session can be sent now
+                        resume_pending_writes(user_obj['localId'], user_obj['idToken'])
                         try:
                             uid = user_obj['localId']
-                            profile = db.child("users").child(uid).child("profile").get().val()
+                            # Fetched once here; later reruns read the cached copy
+                            profile = get_profile(uid, token=user_obj['idToken'], refresh=True)
                             st.session_state.username_display = profile['username'] if profile else email.split('@')[0]
                         except:
                             st.session_state.username_display = email.split('@')[0]
@@ -250,7 +232,7 @@ def auth_screen():
                             token = user['idToken'] # <--- GRAB THE TOKEN HERE
                             
                             # 2. Save Profile WITH Token
-                            db.child("users").child(uid).child("profile").set({"username": new_username}, token=token)
+                            save_profile(uid, {"username": new_username}, token=token)
                             
                             st.success("Account created! Please login.")
                         except Exception as e: 
@@ -274,26 +256,97 @@ def auth_screen():
 # ==========================
 # 6. MAIN APPLICATION
 # ==========================
+def get_doc_index():
+    # Shared with every session on the same document; built once on first use
+    doc = st.session_state.doc
+    return doc.index if doc else None
+
+def set_document(handle):
+    # Swap the session's document handle, releasing the previous one
+    old = st.session_state.doc
+    st.session_state.doc = handle
+    if old is not None:
+        old.release()
+
+def await_text(future):
+    # Lets a prefetched reply be rendered through st.write_stream
+    yield future.result()
+
+def speak_while_streaming(speech, deltas, player):
+    # Plays each finished stretch of speech in `player` while the rest of the reply streams
+    for delta in speech.tee(deltas):
+        clip = speech.next_clip()
+        if clip:
+            player.audio(clip, format=audio_mime(clip), autoplay=True)
+        yield delta
+
+def ingest_grown(job, doc):
+    # A new snapshot is taken once the extracted text has grown by a quarter, so total
+    # indexing work stays linear in the document size
+    if doc is None:
+        return True
+    return (job.chunk_bytes if job.large else job.chars) >= doc.chars * 1.25
+
+def sync_ingest():
+    # Pull newly extracted sections from the background upload job
+    job = st.session_state.ingest_job
+    if job is None:
+        return
+    done = job.done
+    version = job.version
+    doc = st.session_state.doc
+    if job.large:
+        # Large uploads are served from their chunk file while it grows, then as the finished file
+        store = get_document_store()
+        if done and version != st.session_state.ingest_version:
+            snapshot = job.snapshot()
+            if job.chunk_file:
+                set_document(store.intern_chunks(job.chunk_key, job.chunk_file))
+            elif snapshot:
+                # Extraction stopped early: keep what was read (it is not cached)
+                set_document(store.intern_snapshot(*snapshot, partial=False))
+            else:
+                set_document(store.intern(job.text))
+            st.session_state.ingest_version = version
+        elif not done and version != st.session_state.ingest_version:
+            if ingest_grown(job, doc):
+                snapshot = job.snapshot()
+                if snapshot:
+                    set_document(store.intern_snapshot(*snapshot))
+                st.session_state.ingest_version = version
+    elif version != st.session_state.ingest_version or (done and doc is not None and doc.partial):
+        # The finished text always replaces the last snapshot
+        if done or ingest_grown(job, doc):
+            set_document(get_document_store().intern(job.text, partial=not done))
+            st.session_state.ingest_version = version
+    if done and version == st.session_state.ingest_version:
+        st.session_state.ingest_job = None
+
+@st.fragment(run_every=1.0)
+def ingest_progress():
+    job = st.session_state.ingest_job
+    if job is None:
+        return
+    st.caption(f"⏳ Still reading {job.name}... {job.sections} sections ready")
+    # Rerun the whole app only when sync_ingest has something to publish
+    if job.done or (job.version != st.session_state.ingest_version and ingest_grown(job, st.session_state.doc)):
+        st.rerun()
+
 def main_app():
 
     inject_css()
     try:
         user_id = st.session_state.user['localId']
         
-        # Always try to fetch the fresh profile name from DB
-        # This ensures we show the custom username, not just the email
-        try:
-            token = st.session_state.user['idToken']
-            profile = db.child("users").child(user_id).child("profile").get(token=token).val()
-            
-            if profile and 'username' in profile:
-                st.session_state.username_display = profile['username']
-            else:
-                # Fallback if DB read fails or username key missing
-                st.session_state.username_display = st.session_state.user['email'].split('@')[0]
-        except:
-             # Fallback if connection fails
-             st.session_state.username_display = st.session_state.user['email'].split('@')[0]
+        # Profile comes from the per-user cache filled at login (no DB read per rerun)
+        token = st.session_state.user['idToken']
+        profile = get_profile(user_id, token=token)
+        
+        if profile and 'username' in profile:
+            st.session_state.username_display = profile['username']
+        else:
+            # Fallback if DB read fails or username key missing
+            st.session_state.username_display = st.session_state.user['email'].split('@')[0]
 
     except:
         st.session_state.user = None
@@ -309,12 +362,13 @@ def main_app():
         st.divider()
         
         if st.button("Logout"):
+            invalidate_profile(user_id)
             st.session_state.clear()
             st.rerun()
 
     # AUDIO STOP LOGIC (Pause if leaving Classroom)
     if nav != "Classroom":
-        st.session_state.tutor_audio_path = None
+        st.session_state.tutor_audio = None
 
     # -------------------------
     # PAGE: CLASSROOM
@@ -322,6 +376,7 @@ def main_app():
     
     if nav == "Classroom":
         st.title("Interactive Classroom")
+        sync_ingest()
 
         # FIX: Reset quiz state if returning from another page
         if "last_nav" not in st.session_state or st.session_state.last_nav != "Classroom":
@@ -335,44 +390,74 @@ def main_app():
         col1, col2, col3, col4 = st.columns(4)
         
         def trigger_mood(mood):
+            # Returns (header, token stream, speak header?, spinner text) when the tutor has something to say
             st.session_state.current_mood = mood
             st.session_state.tutor_message = "" 
-            st.session_state.tutor_audio_path = None 
+            st.session_state.tutor_audio = None 
             
             # === FIX: STOP PREVIOUS AUDIO ===
             # This line wipes the explanation audio so it doesn't overlap
-            # st.session_state.chat_audio_path = None 
+            # st.session_state.chat_audio = None 
             
             if mood == "confused":
-                with st.spinner("👩🏻 Teacher is simplifying..."):
-                    if st.session_state.last_bot_answer:
-                        simplified = simplify_previous_answer(st.session_state.last_bot_answer, st.session_state.last_user_question)
-                        st.session_state.tutor_message = f"**Let me rephrase that:**\n\n{simplified}"
-                    elif st.session_state.extracted_text:
-                        simplified = simplify_concept(st.session_state.extracted_text)
-                        st.session_state.tutor_message = f"**Topic Simplification:**\n\n{simplified}"
+                if st.session_state.last_bot_answer:
+                    # Use the version prefetched alongside the answer if it matches and is ready;
+                    # one still waiting for spare rate-limit capacity is dropped for a live call
+                    prefetch = st.session_state.simplified_prefetch
+                    st.session_state.simplified_prefetch = None
+                    ready = (prefetch and prefetch[0] == st.session_state.last_bot_answer
+                             and prefetch[1].done() and not prefetch[1].cancelled() and prefetch[1].exception() is None)
+                    if ready:
+                        chunks = await_text(prefetch[1])
                     else:
-                        st.session_state.tutor_message = "Please upload notes first!"
-
-                    if st.session_state.tutor_message:
-                        st.session_state.tutor_audio_path = text_to_audio_file(st.session_state.tutor_message.replace("*", ""))
-                        st.session_state.force_autoplay = True
-            
-            elif mood == "sleepy" and st.session_state.extracted_text:
-                with st.spinner("Generating Energy Booster..."):
-                    act = generate_quick_activity(st.session_state.extracted_text)
-                    st.session_state.tutor_message = f"⚡ ENERGY BOOST :\n\n{act}"
-                    st.session_state.tutor_audio_path = text_to_audio_file(act)
+                        if prefetch:
+                            prefetch[1].cancel()
+                        chunks = simplify_previous_answer(st.session_state.last_bot_answer, st.session_state.last_user_question, stream=True)
+                    return ("**Let me rephrase that:**", chunks, True, "👩🏻 Teacher is simplifying...")
+                elif st.session_state.doc:
+                    chunks = simplify_concept(get_doc_index().overview(), stream=True)
+                    return ("**Topic Simplification:**", chunks, True, "👩🏻 Teacher is simplifying...")
+                else:
+                    st.session_state.tutor_message = "Please upload notes first!"
+                    st.session_state.tutor_audio = text_to_audio_bytes(st.session_state.tutor_message)
+                    st.session_state.tutor_audio_start = 0.0
                     st.session_state.force_autoplay = True
-                    # st.session_state.tutor_audio_key = time.time()
+            
+            elif mood == "sleepy" and st.session_state.doc:
+                chunks = generate_quick_activity(get_doc_index().overview(token_budget=100), stream=True)
+                return ("⚡ ENERGY BOOST :", chunks, False, "Generating Energy Booster...")
+            return None
+
+        tutor_stream = None
         with col1: 
-            if st.button("🙂 Ready", use_container_width=True): trigger_mood("neutral")
+            if st.button("🙂 Ready", use_container_width=True): tutor_stream = trigger_mood("neutral")
         with col2: 
-            if st.button("🤔 Confused", use_container_width=True): trigger_mood("confused")
+            if st.button("🤔 Confused", use_container_width=True): tutor_stream = trigger_mood("confused")
         with col3: 
-            if st.button("🥱 Sleepy", use_container_width=True): trigger_mood("sleepy")
+            if st.button("🥱 Sleepy", use_container_width=True): tutor_stream = trigger_mood("sleepy")
         with col4: 
-            if st.button("😃 Happy", use_container_width=True): trigger_mood("happy")
+            if st.button("😃 Happy", use_container_width=True): tutor_stream = trigger_mood("happy")
+
+        # Render the tutor reply token by token, then speak it
+        if tutor_stream:
+            header, chunks, speak_header, spinner_text = tutor_stream
+            with st.spinner(spinner_text):
+                try:
+                    # Sentences are synthesized while the rest of the reply is still streaming
+                    speech = SpeechStream()
+                    if speak_header:
+                        speech.feed(f"{header}\n\n")
+                    player = st.empty()
+                    with st.container(border=True):
+                        st.markdown(header)
+                        body = st.write_stream(speak_while_streaming(speech, chunks, player))
+                    st.session_state.tutor_message = f"{header}\n\n{body}"
+                    st.session_state.tutor_audio = speech.audio()
+                    st.session_state.tutor_audio_start = speech.position()
+                    st.session_state.force_autoplay = True
+                except LLMError as e:
+                    st.session_state.tutor_message = f"⚠️ Tutor is unavailable right now: {e}"
+            st.rerun()
 
         # 2. TUTOR MESSAGE (WAKE UP / CONFUSED)
         if st.session_state.tutor_message:
@@ -380,12 +465,13 @@ def main_app():
             st.markdown(f"<div class='{style}'>{st.session_state.tutor_message}</div>", unsafe_allow_html=True)
             
             # TUTOR AUDIO (No key to avoid crash on old Streamlit)
-            if st.session_state.tutor_audio_path:
+            if st.session_state.tutor_audio:
                 # Try to use autoplay if supported, else just show
                 try:
-                    st.audio(st.session_state.tutor_audio_path, format="audio/mp3", autoplay=True)
+                    st.audio(st.session_state.tutor_audio, format=audio_mime(st.session_state.tutor_audio), autoplay=True,
+                             start_time=st.session_state.tutor_audio_start)
                 except:
-                    st.audio(st.session_state.tutor_audio_path, format="audio/mp3")
+                    st.audio(st.session_state.tutor_audio, format=audio_mime(st.session_state.tutor_audio))
 
         # 3. LEARNING AREA
         t1, t2 = st.tabs(["📚 Study Material", "📝 Quiz"])
@@ -395,10 +481,16 @@ def main_app():
             
             with c_upload:
                 st.subheader("Source")
-                if st.session_state.extracted_text:
+                if st.session_state.doc or st.session_state.ingest_job:
                     st.success("✅ Notes Active")
+                    ingest_progress()
                     if st.button("Clear & Upload New"):
-                        st.session_state.extracted_text = ""
+                        set_document(None)
+                        # Stop the background extraction instead of letting it parse to the end
+                        if st.session_state.ingest_job:
+                            st.session_state.ingest_job.cancel()
+                        st.session_state.ingest_job = None
+                        st.session_state.ingest_version = -1
                         st.session_state.quiz_data = []
                         st.session_state.quiz_submitted = False
                         st.rerun()
@@ -406,8 +498,12 @@ def main_app():
                     uploaded_file = st.file_uploader("Upload File", type=["pdf","txt","md","docx","pptx","xlsx","csv"])
                     if uploaded_file:
                         with st.spinner("Processing..."):
-                            text = extract_text_from_pdf(uploaded_file)
-                            st.session_state.extracted_text = text
+                            set_document(None)
+                            st.session_state.ingest_job = IngestJob(uploaded_file)
+                            st.session_state.ingest_version = -1
+                            # Small files finish here; big ones keep streaming in the background
+                            st.session_state.ingest_job.wait(timeout=2.0)
+                            sync_ingest()
                             st.session_state.quiz_data = []
                             st.session_state.quiz_submitted = False
                             st.rerun()
@@ -419,12 +515,13 @@ def main_app():
                 if st.session_state.last_bot_answer:
                     st.markdown(f"<div class='ai-response'><b>🔥 Aura:</b> {st.session_state.last_bot_answer}</div>", unsafe_allow_html=True)
                     
-                    if st.session_state.chat_audio_path:
+                    if st.session_state.chat_audio:
                         st.markdown("**Audio Explanation:**")
                         try:
-                            st.audio(st.session_state.chat_audio_path, format="audio/mp3", autoplay=st.session_state.force_autoplay)
+                            st.audio(st.session_state.chat_audio, format=audio_mime(st.session_state.chat_audio), autoplay=st.session_state.force_autoplay,
+                                     start_time=st.session_state.chat_audio_start)
                         except:
-                            st.audio(st.session_state.chat_audio_path, format="audio/mp3")
+                            st.audio(st.session_state.chat_audio, format=audio_mime(st.session_state.chat_audio))
                         # Reset flag so it doesn't keep replaying on every interaction
                         st.session_state.force_autoplay = False
 
@@ -453,7 +550,7 @@ def main_app():
                     # Transcribe (This might take a second, show a spinner)
                     if "last_audio_bytes" not in st.session_state or st.session_state.last_audio_bytes != audio_data['bytes']:
                          with st.spinner("Transcribing..."):
-                            text = transcribe_audio_bytes(audio_data['bytes'])
+                            text = transcribe_audio_bytes(audio_data['bytes'], st.session_state)
                             if text:
                                 # Update the session state used by the text input
                                 st.session_state.user_query_input = text
@@ -473,22 +570,35 @@ def main_app():
 
                 # 3. Explain Button
                 if st.button("✨ Explain It", type="primary", use_container_width=True):
-                    if st.session_state.extracted_text and user_q:
+                    if st.session_state.doc and user_q:
                         st.session_state.last_user_question = user_q
                         # Clear tutor message
                         st.session_state.tutor_message = ""
                         
-                        with st.spinner("Thinking..."):
-                            ans = explain_with_emotion(st.session_state.extracted_text[:3000], user_q, st.session_state.current_mood)
-                            st.session_state.last_bot_answer = ans
-                            st.session_state.chat_audio_path = text_to_audio_file(ans.replace("*", ""))
-                            st.session_state.force_autoplay = True
-                            st.rerun()
+                        context = get_doc_index().retrieve(user_q)
+                        speech = SpeechStream()
+                        player = st.empty()
+                        try:
+                            with st.container(border=True):
+                                ans = st.write_stream(speak_while_streaming(
+                                    speech, explain_with_emotion(context, user_q, st.session_state.current_mood, stream=True), player))
+                        except LLMError as e:
+                            ans = None
+                            st.error(f"⚠️ Couldn't get an answer right now: {e}")
+                        if ans:
+                            with st.spinner("Preparing audio..."):
+                                st.session_state.last_bot_answer = ans
+                                # Prefetch the "Confused" rephrasing while the last sentences are synthesized
+                                st.session_state.simplified_prefetch = (ans, prefetch_simplified_answer(ans, user_q))
+                                st.session_state.chat_audio = speech.audio()
+                                st.session_state.chat_audio_start = speech.position()
+                                st.session_state.force_autoplay = True
+                                st.rerun()
                     else:
                         st.warning("Please upload notes and then enter your Query.")
 
         with t2:
-            if st.session_state.extracted_text:
+            if st.session_state.doc:
                 # 1. GENERATE SETTINGS (If no quiz exists)
                 if not st.session_state.quiz_data:
                     st.subheader("Generate Quiz")
@@ -501,8 +611,32 @@ def main_app():
                         diff = st.selectbox("Difficulty", ["Easy", "Medium", "Hard"], index=1) # Index 1 = Medium default
                     
                     if st.button("Generate Quiz", type="primary"):
+                        # Show questions as they arrive; the answerable form appears once all are in
+                        questions = []
+                        preview = st.container()
                         with st.spinner(f"Creating {diff} Quiz..."):
-                            st.session_state.quiz_data = generate_quiz(st.session_state.extracted_text, num_q, diff)
+                            # Serve unseen questions from the shared bank first, generate only the shortfall
+                            bank = get_quiz_bank()
+                            doc = st.session_state.doc
+                            if doc.partial or doc.is_error:
+                                bank = None
+                            seen = st.session_state.quiz_seen.setdefault(doc.key, set())
+                            if bank:
+                                questions = bank.take(doc.key, diff, num_q, doc.index, exclude=seen)
+                            from_bank = len(questions)
+                            if len(questions) < num_q:
+                                for q in stream_quiz_from_index(get_doc_index(), num_q - len(questions), diff, avoid=questions[:from_bank]):
+                                    questions.append(q)
+                                    with preview:
+                                        st.markdown(f"**{len(questions)}. {q['question']}**")
+                                        st.caption(" · ".join(q['options']))
+                                if bank:
+                                    bank.add(doc.key, diff, questions[from_bank:])
+                            seen.update(normalize_question(q["question"]) for q in questions)
+                            if len(questions) < num_q:
+                                # Batches are sized to the LLM rate limit; a big request can come back short
+                                st.toast(f"⚠️ Only {len(questions)} of {num_q} questions could be generated right now. Try again in a minute for more.")
+                            st.session_state.quiz_data = questions
                             st.session_state.quiz_submitted = False
                             st.session_state.quiz_ref += 1
                             st.rerun()
@@ -525,20 +659,22 @@ def main_app():
                                     score += 1
                             
                             # --- FIX: PASS TOKEN TO SAVE ---
+                            # Queued write-behind: returns immediately, uploads in the background
                             try:
                                 token = st.session_state.user['idToken'] # Get Token
-                                save_result_to_cloud(
+                                if save_result_to_cloud(
                                     user_id, 
                                     score, 
                                     len(st.session_state.quiz_data), 
                                     st.session_state.current_mood,
                                     token # <--- Passed here
-                                )
-                                st.success("✅ Score Successfully Saved!")
+                                ):
+                                    st.toast("✅ Score Saved!")
+                                else:
+                                    st.toast("⚠️ Score could not be saved.")
                             except Exception as e:
-                                st.error(f"Save Failed: {e}")
+                                st.toast(f"Save Failed: {e}")
                             
-                            time.sleep(1)
                             st.rerun()
 
                 # 3. RESULTS (Show AFTER submission)
@@ -580,55 +716,71 @@ def main_app():
         st.session_state.quiz_submitted = False
         st.session_state.quiz_data = []
         
-        # 1. Load Data with Token
-        history = []
+        # 1. Sync new results only; totals come from the running aggregates
+        summary = None
+        history = None
         try:
             token = st.session_state.user['idToken'] # Get Token
-            history = load_history_from_cloud(user_id, token)
+            summary = load_history_summary(user_id, token)
         except Exception as e:
             st.warning(f"Syncing... {e}")
+        lost = unsynced_results(user_id)
+        if lost:
+            st.warning(f"⚠️ {lost} quiz result(s) could not be saved to the cloud after repeated attempts. They are kept on this server.")
         
-        if history:
-            df = pd.DataFrame(history)
-            if 'timestamp' in df.columns:
-                df['timestamp'] = pd.to_datetime(df['timestamp'])
-                total_sessions = len(df)
-                avg_score = df['percentage'].mean()
-                perfect_scores = len(df[df['percentage'] == 100])
-                
-                st.subheader("🎖️ Badges Earned")
-                c1, c2, c3 = st.columns(3)
-                with c1:
-                    if total_sessions >= 1: st.success("🎓 **Novice**\n\n1st Session")
-                    else: st.info("🔒 **Novice**\n\nComplete 1 session")
-                with c2:
-                    if total_sessions >= 10: st.success("🚀 **Scholar**\n\n5 Sessions")
-                    else: st.info(f"🔒 **Scholar**\n\n{5-total_sessions} to go")
-                with c3:
-                    if total_sessions >= 100: st.success("👑 **Master**\n\n10 Sessions")
-                    else: st.info(f"🔒 **Master**\n\n{10-total_sessions} to go")
-                
-                st.write("")
-                c4, c5, c6 = st.columns(3)
-                with c4:
-                    if avg_score >= 90: st.success("🧠 **Genius**\n\nAvg > 90%")
-                    else: st.info("🔒 **Genius**\n\nGet >90% Avg")
-                with c5:
-                    if perfect_scores >= 5: st.success("🎯 **Sharpshooter**\n\n100% Score")
-                    else: st.info("🔒 **Sharpshooter**\n\nGet 100% once")
-                with c6:
-                    if total_sessions >= 200: st.success("🔥 **Unstoppable**\n\n20 Sessions")
-                    else: st.info("🔒 **Unstoppable**\n\nKeep going!")
-
-                st.divider()
-                st.subheader("📅 Weekly Activity")
-                if not df.empty:
-                    df['date'] = df['timestamp'].dt.date
-                    st.bar_chart(df['date'].value_counts())
-                    with st.expander("View Full History"):
-                        st.dataframe(df.sort_values(by='timestamp', ascending=False))
-            # except Exception as e:
-                # st.error(f"Data Format Error: {e}")
+        if summary is None:
+            # No local store available: aggregate a full download instead
+            history = load_history_from_cloud(user_id, token)
+            if history:
+                df = pd.DataFrame(history)
+                summary = {
+                    "count": len(df),
+                    "avg": df['percentage'].mean(),
+                    "perfect": int((df['percentage'] == 100).sum()),
+                    "daily": df['timestamp'].astype(str).str[:10].value_counts().sort_index().to_dict(),
+                }
+        
+        if summary and summary["count"]:
+            total_sessions = summary["count"]
+            avg_score = summary["avg"]
+            perfect_scores = summary["perfect"]
+            
+            st.subheader("🎖️ Badges Earned")
+            c1, c2, c3 = st.columns(3)
+            with c1:
+                if total_sessions >= 1: st.success("🎓 **Novice**\n\n1st Session")
+                else: st.info("🔒 **Novice**\n\nComplete 1 session")
+            with c2:
+                if total_sessions >= 10: st.success("🚀 **Scholar**\n\n5 Sessions")
+                else: st.info(f"🔒 **Scholar**\n\n{5-total_sessions} to go")
+            with c3:
+                if total_sessions >= 100: st.success("👑 **Master**\n\n10 Sessions")
+                else: st.info(f"🔒 **Master**\n\n{10-total_sessions} to go")
+            
+            st.write("")
+            c4, c5, c6 = st.columns(3)
+            with c4:
+                if avg_score >= 90: st.success("🧠 **Genius**\n\nAvg > 90%")
+                else: st.info("🔒 **Genius**\n\nGet >90% Avg")
+            with c5:
+                if perfect_scores >= 5: st.success("🎯 **Sharpshooter**\n\n100% Score")
+                else: st.info("🔒 **Sharpshooter**\n\nGet 100% once")
+            with c6:
+                if total_sessions >= 200: st.success("🔥 **Unstoppable**\n\n20 Sessions")
+                else: st.info("🔒 **Unstoppable**\n\nKeep going!")
+
+            st.divider()
+            st.subheader("📅 Weekly Activity")
+            daily = pd.Series(summary["daily"], dtype="int64")
+            daily.index = pd.to_datetime(daily.index).date
+            st.bar_chart(daily)
+            with st.expander("View Full History"):
+                # Only the most recent rows, read from the local store (no second sync)
+                recent = history if history is not None else load_recent_history(user_id, limit=500)
+                df = pd.DataFrame(recent)
+                if 'timestamp' in df.columns:
+                    df['timestamp'] = pd.to_datetime(df['timestamp'])
+                st.dataframe(df)
         else:
             st.info("Start learning to earn badges! (No data found)")
 
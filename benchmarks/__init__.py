@@ -0,0 +1 @@
+"""Offline benchmarks with local stand-ins for Groq, Firebase and TTS (see run.py)."""
@@ -0,0 +1,116 @@
+"""
+Generated benchmark documents (PDF, DOCX, PPTX, CSV) of increasing size.
+Content is deterministic for a given seed, so results are comparable between runs.
+"""
+import random
+from pathlib import Path
+
+_TOPICS = (
+    "Photosynthesis converts light energy into chemical energy stored in glucose.",
+    "Chlorophyll in the thylakoid membranes absorbs red and blue light.",
+    "The Calvin cycle fixes carbon dioxide using ATP and NADPH.",
+    "Cellular respiration releases energy by oxidising glucose in the mitochondria.",
+    "Enzymes lower the activation energy of reactions without being consumed.",
+    "Osmosis moves water across a membrane towards higher solute concentration.",
+    "DNA replication is semi-conservative; each new helix keeps one old strand.",
+    "Natural selection favours heritable traits that improve reproductive success.",
+)
+
+# name -> pages (PDF), paragraphs per page for the other formats scale the same way
+SIZES = {"small": 5, "medium": 50, "large": 200}
+
+
+def _lines(rng, count):
+    return [f"{rng.choice(_TOPICS)} Note {rng.randrange(10_000)}." for _ in range(count)]
+
+
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path, pages, lines_per_page=40, seed=0):
+    """Minimal text PDF (Helvetica, one content stream per page), no extra dependencies."""
+    rng = random.Random(seed)
+    objects = []
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(None)
+    pages_obj = add(None)
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    kids = []
+    for p in range(pages):
+        text = "\n".join(f"({_pdf_escape(line)}) '" for line in _lines(rng, lines_per_page))
+        stream = f"BT /F1 10 Tf 14 TL 40 800 Td (Page {p + 1}) Tj\n{text}\nET".encode("latin-1")
+        content = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        kids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>" % (pages_obj, font, content)
+        ))
+    objects[catalog - 1] = b"<< /Type /Catalog /Pages %d 0 R >>" % pages_obj
+    objects[pages_obj - 1] = (
+        b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % k for k in kids) + b"] /Count %d >>" % len(kids)
+    )
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % i + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % off for off in offsets)
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref)
+    Path(path).write_bytes(bytes(out))
+
+
+def write_docx(path, pages, seed=0):
+    import docx
+    rng = random.Random(seed)
+    document = docx.Document()
+    for p in range(pages):
+        document.add_heading(f"Section {p + 1}", level=2)
+        for line in _lines(rng, 10):
+            document.add_paragraph(line)
+    document.save(path)
+
+
+def write_pptx(path, pages, seed=0):
+    from pptx import Presentation
+    rng = random.Random(seed)
+    prs = Presentation()
+    for p in range(pages):
+        slide = prs.slides.add_slide(prs.slide_layouts[1])
+        slide.shapes.title.text = f"Slide {p + 1}"
+        slide.placeholders[1].text = "\n".join(_lines(rng, 6))
+    prs.save(path)
+
+
+def write_csv(path, pages, seed=0):
+    import pandas as pd
+    rng = random.Random(seed)
+    rows = pages * 40
+    pd.DataFrame({
+        "term": [rng.choice(_TOPICS).split()[0] for _ in range(rows)],
+        "definition": _lines(rng, rows),
+        "score": [rng.randrange(100) for _ in range(rows)],
+    }).to_csv(path, index=False)
+
+
+WRITERS = {"pdf": write_pdf, "docx": write_docx, "pptx": write_pptx, "csv": write_csv}
+
+
+def build_corpus(directory, sizes=("small", "medium"), formats=tuple(WRITERS), seed=0):
+    """Writes every format at every size (reusing existing files). Returns {(fmt, size): path}."""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    corpus = {}
+    for size in sizes:
+        for fmt in formats:
+            path = directory / f"{size}.{fmt}"
+            if not path.exists():
+                WRITERS[fmt](path, SIZES[size], seed=seed)
+            corpus[(fmt, size)] = path
+    return corpus
@@ -0,0 +1,420 @@
+"""
+Local stand-ins for the external services, so benchmarks run offline and repeatably.
+"""
+import io
+import os
+import re
+import json
+import time
+import wave
+import random
+import threading
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# ==========================
+# Groq (OpenAI-compatible HTTP)
+# ==========================
+
+_WORDS = (
+    "energy cells light plants convert chemical process water carbon dioxide oxygen "
+    "glucose chlorophyll leaves sunlight reaction stage cycle molecule enzyme membrane"
+).split()
+
+
+def _prose(tokens, rng):
+    words = [rng.choice(_WORDS) for _ in range(tokens)]
+    for i in range(11, len(words), 12):
+        words[i] += "."
+    return " ".join(words).capitalize() + "."
+
+
+def _quiz(n, rng):
+    return json.dumps([
+        {
+            "question": f"Question {i + 1}: what does {rng.choice(_WORDS)} do with {rng.choice(_WORDS)} in stage {i}?",
+            "options": [f"{rng.choice(_WORDS)} {i}-{j}" for j in range(4)],
+            "answer": rng.randrange(4),
+        }
+        for i in range(n)
+    ], indent=2)
+
+
+class FakeGroqServer:
+    """
+    Serves POST /openai/v1/chat/completions like Groq does, including SSE streaming.
+    `latency` is the time to first byte; `tokens_per_second` paces the reply.
+    Quiz prompts ("Create exactly N multiple-choice questions") get a JSON quiz,
+    everything else gets `reply_tokens` words of prose.
+    """
+
+    def __init__(self, latency=0.2, tokens_per_second=400.0, reply_tokens=120, seed=0):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.reply_tokens = reply_tokens
+        self.requests = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def reply_for(self, body):
+        prompt = " ".join(m.get("content", "") for m in body.get("messages", []))
+        with self._lock:
+            self.requests += 1
+            match = re.search(r"Create exactly (\d+) multiple-choice", prompt)
+            if match:
+                return _quiz(int(match.group(1)), self._rng)
+            return _prose(self.reply_tokens, self._rng)
+
+    def start(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                text = fake.reply_for(body)
+                pieces = re.findall(r"\S+\s*", text)
+                usage = {
+                    "prompt_tokens": length // 4,
+                    "completion_tokens": len(pieces),
+                    "total_tokens": length // 4 + len(pieces),
+                }
+                time.sleep(fake.latency)
+                if body.get("stream"):
+                    self._stream(body, pieces, usage)
+                else:
+                    time.sleep(len(pieces) / fake.tokens_per_second)
+                    self._json({
+                        "id": "chatcmpl-bench", "object": "chat.completion", "created": int(time.time()),
+                        "model": body.get("model", "bench"),
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                        "usage": usage,
+                    })
+
+            def _headers(self):
+                self.send_header("x-ratelimit-remaining-requests", "100000")
+                self.send_header("x-ratelimit-remaining-tokens", "10000000")
+
+            def _json(self, payload):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self._headers()
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, body, pieces, usage):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self._headers()
+                self.end_headers()
+                base = {"id": "chatcmpl-bench", "object": "chat.completion.chunk",
+                        "created": int(time.time()), "model": body.get("model", "bench")}
+                step = 4
+                for i in range(0, len(pieces), step):
+                    delta = "".join(pieces[i:i + step])
+                    time.sleep(min(step, len(pieces) - i) / fake.tokens_per_second)
+                    self._event({**base, "choices": [{"index": 0, "delta": {"content": delta}, "finish_reason": None}]})
+                self._event({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                             "x_groq": {"usage": usage}})
+                self._chunk(b"data: [DONE]\n\n")
+                self._chunk(b"")
+
+            def _event(self, payload):
+                self._chunk(b"data: " + json.dumps(payload).encode("utf-8") + b"\n\n")
+
+            def _chunk(self, data):
+                self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="fake-groq", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+# ==========================
+# pyrebase
+# ==========================
+
+class _Pyre:
+    def __init__(self, key, value):
+        self._key, self._value = key, value
+
+    def key(self):
+        return self._key
+
+    def val(self):
+        return self._value
+
+
+class _Response:
+    def __init__(self, value, items=None):
+        self._value = value
+        self._items = items
+
+    def val(self):
+        return self._value
+
+    def each(self):
+        return self._items
+
+
+class FakeDatabase:
+    """The subset of pyrebase's Database used by the app, backed by a shared dict."""
+
+    def __init__(self, firebase):
+        self._fb = firebase
+        self.path = []
+        self.query = {}
+
+    def child(self, *args):
+        for arg in args:
+            self.path.extend(p for p in str(arg).split("/") if p)
+        return self
+
+    def order_by_key(self):
+        self.query["orderBy"] = "$key"
+        return self
+
+    def start_at(self, value):
+        self.query["startAt"] = value
+        return self
+
+    def limit_to_first(self, n):
+        self.query["limitToFirst"] = n
+        return self
+
+    def generate_key(self):
+        return self._fb.next_key()
+
+    def _take(self):
+        path, query = self.path, self.query
+        self.path, self.query = [], {}
+        self._fb.wait()
+        return path, query
+
+    def get(self, token=None):
+        path, query = self._take()
+        with self._fb.lock:
+            node = self._fb.node(path)
+            if not query:
+                return _Response(json.loads(json.dumps(node)) if node is not None else None)
+            items = sorted((node or {}).items())
+            if "startAt" in query:
+                items = [(k, v) for k, v in items if k >= query["startAt"]]
+            if "limitToFirst" in query:
+                items = items[:query["limitToFirst"]]
+            items = [(k, json.loads(json.dumps(v))) for k, v in items]
+        return _Response(dict(items) or None, [_Pyre(k, v) for k, v in items])
+
+    def set(self, data, token=None):
+        path, _ = self._take()
+        with self._fb.lock:
+            self._fb.node(path[:-1], create=True)[path[-1]] = data
+        return data
+
+    def push(self, data, token=None):
+        path, _ = self._take()
+        key = self._fb.next_key()
+        with self._fb.lock:
+            self._fb.node(path, create=True)[key] = data
+        return {"name": key}
+
+    def update(self, data, token=None):
+        path, _ = self._take()
+        with self._fb.lock:
+            for sub, value in data.items():
+                full = path + [p for p in sub.split("/") if p]
+                self._fb.node(full[:-1], create=True)[full[-1]] = value
+        return data
+
+
+class FakeAuth:
+    def __init__(self, firebase):
+        self._fb = firebase
+
+    def sign_in_with_email_and_password(self, email, password):
+        self._fb.wait()
+        uid = self._fb.users.get(email)
+        if uid is None:
+            raise ValueError("INVALID_LOGIN_CREDENTIALS")
+        return {"localId": uid, "idToken": f"token-{uid}", "email": email}
+
+    def create_user_with_email_and_password(self, email, password):
+        self._fb.wait()
+        if email in self._fb.users:
+            raise ValueError("EMAIL_EXISTS")
+        uid = f"uid{len(self._fb.users):05d}"
+        self._fb.users[email] = uid
+        return {"localId": uid, "idToken": f"token-{uid}", "email": email}
+
+    def send_password_reset_email(self, email):
+        self._fb.wait()
+        return {"email": email}
+
+
+class FakeFirebase:
+    """
+    In-process replacement for a pyrebase app (auth() and database()).
+    Every database/auth call sleeps for `latency` seconds to model the round trip.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.data = {}
+        self.users = {}
+        self.lock = threading.Lock()
+        self.calls = 0
+        self._key = 0
+
+    def wait(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def next_key(self):
+        with self.lock:
+            self._key += 1
+            # Chronological and lexicographically sortable, like push keys
+            return f"-B{time.time_ns():020d}{self._key:06d}"
+
+    def node(self, path, create=False):
+        node = self.data
+        for part in path:
+            if not isinstance(node, dict):
+                return None
+            if part not in node:
+                if not create:
+                    return None
+                node[part] = {}
+            node = node[part]
+        return node
+
+    def auth(self):
+        return FakeAuth(self)
+
+    def database(self):
+        return FakeDatabase(self)
+
+    def add_user(self, email, uid, username=None, history=0, seed=0):
+        """Registers a user with a profile and `history` generated quiz results."""
+        rng = random.Random(seed)
+        self.users[email] = uid
+        user = self.node(["users", uid], create=True)
+        user["profile"] = {"username": username or email.split("@")[0]}
+        results = user.setdefault("history", {})
+        start = time.time() - history * 3600
+        for i in range(history):
+            total = rng.choice((5, 10))
+            score = rng.randint(0, total)
+            results[f"-A{i:012d}"] = {
+                "timestamp": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(start + i * 3600)),
+                "score": score, "total": total, "mood": rng.choice(("happy", "neutral", "confused")),
+                "percentage": round(score / total * 100, 1),
+            }
+
+
+# ==========================
+# TTS / STT
+# ==========================
+
+def make_wav(seconds=0.5, rate=16000, tone=None, pad=0.0):
+    """
+    Mono 16-bit WAV: silence, or a sine tone when `tone` (Hz) is given.
+    `pad` adds that many seconds of faint room noise before and after, like a mic recording.
+    """
+    import numpy as np
+    samples = np.zeros(int(seconds * rate), dtype=np.int16)
+    if tone:
+        t = np.arange(len(samples)) / rate
+        samples = (np.sin(2 * np.pi * tone * t) * 8000).astype(np.int16)
+    if pad:
+        noise = np.random.default_rng(0).normal(0, 40, (2, int(pad * rate))).astype(np.int16)
+        samples = np.concatenate([noise[0], samples, noise[1]])
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(samples.tobytes())
+    return buf.getvalue()
+
+
+class StubTTS:
+    """Voice engine TTS backend that returns silent WAV after a fixed delay per character."""
+    name = "stub"
+
+    def __init__(self, seconds_per_char=0.0005):
+        self.seconds_per_char = seconds_per_char
+
+    def available(self):
+        return True
+
+    def synthesize(self, text, lang="en", slow=False):
+        time.sleep(len(text) * self.seconds_per_char)
+        return make_wav(seconds=min(len(text) / 15, 10), rate=8000)
+
+
+class StubSTT:
+    """Voice engine STT backend that 'recognizes' a fixed sentence."""
+    name = "stub"
+
+    def __init__(self, text="what is photosynthesis", delay=0.05):
+        self.text = text
+        self.delay = delay
+
+    def available(self):
+        return True
+
+    def transcribe(self, recognizer, audio):
+        time.sleep(self.delay)
+        return self.text
+
+
+# ==========================
+# Wiring
+# ==========================
+
+def install_fakes(work, llm_latency=0.2, llm_tps=400.0, db_latency=0.03):
+    """
+    Starts a FakeGroqServer, points the app's configuration at it (cache under `work`)
+    and swaps the Firebase app and voice engine for the stand-ins.
+    Must run before the app modules are first imported: they read their settings then.
+    Returns (groq_server, firebase).
+    """
+    groq = FakeGroqServer(latency=llm_latency, tokens_per_second=llm_tps).start()
+    os.environ.update({
+        "AURALEARN_CACHE_DIR": str(Path(work) / "cache"),
+        "GROQ_API_KEY": "bench",
+        "GROQ_BASE_URL": groq.base_url,
+        "LLM_CACHE_BACKEND": "off",
+        "LLM_REQUESTS_PER_MINUTE": "1000000",
+        "LLM_TOKENS_PER_MINUTE": "1000000000",
+        "WRITE_FLUSH_INTERVAL": "0.2",
+    })
+    from modules import voice_engine, data_handler
+
+    voice_engine._engine = voice_engine.VoiceEngine([StubTTS()], [StubSTT()])
+    firebase = FakeFirebase(latency=db_latency)
+    data_handler.get_firebase = lambda: firebase
+    return groq, firebase
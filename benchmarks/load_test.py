@@ -0,0 +1,448 @@
+"""
+Concurrent-user load test for app.py.
+
+    python -m benchmarks.load_test --users 20 --ramp 10 --out load-results.json
+    python -m benchmarks.load_test --users 50 --sessions 3 --think 2 --llm-latency 0.5
+
+Each virtual user drives its own Streamlit AppTest session through a scripted
+visit (login, upload, several Explain It questions, a quiz, the progress page)
+against the stand-ins in benchmarks/fakes.py. All sessions share one process,
+the way they share a pod, so module caches, the document store and the GIL are
+contended just as in production.
+
+Reported: reruns per second, rerun latency per step (p50/p95/p99/max) and
+resident memory per live session.
+"""
+import gc
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
+import statistics
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fakes import install_fakes
+from benchmarks.corpus import WRITERS
+
+APP_PATH = Path(__file__).resolve().parent.parent / "app.py"
+
+QUESTIONS = (
+    "How does chlorophyll help the Calvin cycle?",
+    "What is the difference between osmosis and diffusion?",
+    "Why is DNA replication called semi-conservative?",
+    "Where does cellular respiration happen?",
+    "How do enzymes speed up reactions?",
+)
+
+MIME = {
+    "pdf": "application/pdf",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "pptx": "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+    "csv": "text/csv",
+}
+
+# allow_concurrent_sessions() patches Streamlit internals that were checked against these
+# releases only (minimum inclusive, maximum exclusive); re-check them before raising the cap
+# here and in benchmarks/requirements.txt
+STREAMLIT_SUPPORTED = ((1, 65), (1, 66))
+
+
+def rss_bytes():
+    """Resident set size of this process (Linux /proc, else peak RSS from getrusage)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def distribution(values):
+    values = sorted(values)
+    if not values:
+        return {"count": 0}
+
+    def pct(q):
+        return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+    return {
+        "count": len(values),
+        "mean": statistics.fmean(values),
+        "p50": pct(0.50),
+        "p95": pct(0.95),
+        "p99": pct(0.99),
+        "max": values[-1],
+    }
+
+
+def allow_concurrent_sessions():
+    """
+    AppTest assumes one session per process. Make several safe to run at once:
+    - each run installs a mock Runtime and clears the class-wide reference when
+      it ends, so keep serving the most recent mock (they are interchangeable);
+    - each run toggles the global.appTest option, so set it for the whole process;
+    - each run recompiles app.py, which the server does once (and concurrent
+      compiles trip CPython's parser), so share one script cache.
+    Raises RuntimeError on a Streamlit outside STREAMLIT_SUPPORTED or without those internals.
+    """
+    import streamlit
+    from streamlit import config
+    from streamlit.runtime.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    version = tuple(int(part) for part in streamlit.__version__.split(".")[:2] if part.isdigit())
+    low, high = STREAMLIT_SUPPORTED
+    if not low <= version < high:
+        raise RuntimeError(
+            f"load_test supports Streamlit >={'.'.join(map(str, low))},<{'.'.join(map(str, high))}, "
+            f"found {streamlit.__version__}; check allow_concurrent_sessions() against it and update "
+            "STREAMLIT_SUPPORTED"
+        )
+    probe = ScriptCache()
+    missing = [name for owner, name in (
+        (Runtime, "_instance"), (Runtime, "instance"), (Runtime, "exists"),
+        (probe, "_cache"), (probe, "_lock"),
+    ) if not hasattr(owner, name)]
+    try:
+        config.get_option("global.appTest")
+    except RuntimeError:
+        missing.append("global.appTest option")
+    if missing:
+        raise RuntimeError(
+            f"Streamlit {streamlit.__version__} no longer has {', '.join(missing)}; "
+            "allow_concurrent_sessions() needs updating"
+        )
+    last = []
+
+    def instance(cls):
+        if cls._instance is not None:
+            last[:] = [cls._instance]
+            return cls._instance
+        if last:
+            return last[0]
+        raise RuntimeError("Runtime hasn't been created!")
+
+    def exists(cls):
+        return cls._instance is not None or bool(last)
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(exists)
+
+    config.set_option("global.appTest", True)
+
+    shared = ScriptCache()
+
+    def init(self):
+        self._cache = shared._cache
+        self._lock = shared._lock
+
+    ScriptCache.__init__ = init
+
+
+# ==========================
+# Virtual user
+# ==========================
+
+class StepFailed(Exception):
+    pass
+
+
+class VirtualUser:
+    """One browser session: an AppTest plus the timings of every rerun it caused."""
+
+    def __init__(self, index, email, document, questions, think, timeout, seed):
+        from streamlit.testing.v1 import AppTest
+        self.index = index
+        self.email = email
+        self.document = document
+        self.questions = questions
+        self.think = think
+        self.rng = random.Random(seed)
+        self.app = AppTest.from_file(str(APP_PATH), default_timeout=timeout)
+        self.timings = []  # (step, seconds, ok)
+        self.errors = []
+
+    def _pause(self):
+        if self.think:
+            time.sleep(self.think * self.rng.uniform(0.5, 1.5))
+
+    def step(self, name, action):
+        """Runs one interaction (widget change + rerun), timing the rerun."""
+        start = time.perf_counter()
+        ok = True
+        try:
+            action()
+            if self.app.exception:
+                raise StepFailed(self.app.exception[0].message)
+        except Exception as e:
+            ok = False
+            self.errors.append(f"{name}: {type(e).__name__}: {str(e)[:200]}")
+        self.timings.append((name, time.perf_counter() - start, ok))
+        self._pause()
+        return ok
+
+    def _button(self, label):
+        for button in self.app.button:
+            if button.label == label:
+                return button
+        raise StepFailed(f"no button {label!r} on the page")
+
+    def _text_input(self, label):
+        for widget in self.app.text_input:
+            if widget.label == label:
+                return widget
+        raise StepFailed(f"no text input {label!r} on the page")
+
+    def login(self):
+        def sign_in():
+            # The Login tab comes first, so its fields are the first matches
+            self._text_input("Email").set_value(self.email)
+            self._text_input("Password").set_value("password")
+            self._button("Sign In").click().run()
+            if not self.app.session_state["user"]:
+                raise StepFailed("login rejected")
+
+        return self.step("open", self.app.run) and self.step("login", sign_in)
+
+    def upload(self):
+        name, data = self.document
+
+        def send():
+            self.app.file_uploader[0].set_value((name, data, MIME[name.rsplit(".", 1)[-1]])).run()
+            # Big files keep extracting in the background; poll like the progress fragment does
+            deadline = time.monotonic() + 60
+            while self.app.session_state["ingest_job"] is not None and time.monotonic() < deadline:
+                time.sleep(0.2)
+                self.app.run()
+            if not self.app.session_state["doc"]:
+                raise StepFailed("document did not load")
+
+        return self.step("upload", send)
+
+    def explain(self, question):
+        def ask():
+            self.app.text_input(key="user_query_input").set_value(question)
+            self._button("✨ Explain It").click().run()
+            if not self.app.session_state["last_bot_answer"]:
+                raise StepFailed("no answer")
+
+        return self.step("explain", ask)
+
+    def quiz(self):
+        def generate():
+            self._button("Generate Quiz").click().run()
+            if not self.app.session_state["quiz_data"]:
+                raise StepFailed("no questions")
+
+        def submit():
+            ref = self.app.session_state["quiz_ref"]
+            for i, q in enumerate(self.app.session_state["quiz_data"]):
+                self.app.radio(key=f"q{i}_{ref}").set_value(self.rng.choice(q["options"]))
+            self._button("Submit & Save").click().run()
+            if not self.app.session_state["quiz_submitted"]:
+                raise StepFailed("quiz not submitted")
+
+        return self.step("quiz_generate", generate) and self.step("quiz_submit", submit)
+
+    def progress(self):
+        def open_page():
+            self.app.sidebar.radio[0].set_value("Progress & Badges").run()
+
+        def back():
+            self.app.sidebar.radio[0].set_value("Classroom").run()
+
+        return self.step("progress", open_page) and self.step("classroom", back)
+
+    def visit(self):
+        """One scripted session; stops at the first failed step."""
+        if not (self.login() and self.upload()):
+            return False
+        for question in self.rng.sample(QUESTIONS, min(self.questions, len(QUESTIONS))):
+            if not self.explain(question):
+                return False
+        if not self.quiz():
+            return False
+        return self.progress()
+
+    def logout(self):
+        def click():
+            self.app.sidebar.button[0].click().run()
+
+        return self.step("logout", click)
+
+
+# ==========================
+# Driver
+# ==========================
+
+def drain_background_work():
+    """Waits for queued score uploads and quiz bank refills, so their calls are counted."""
+    from modules.data_handler import get_db
+    from modules.quiz_bank import get_quiz_bank
+    from modules.write_queue import get_write_queue
+    queue = get_write_queue(get_db)
+    if queue:
+        queue.flush(timeout=30)
+    bank = get_quiz_bank()
+    if bank:
+        bank.drain()
+
+
+def make_documents(directory, count, fmt, pages):
+    """`count` distinct documents (different seeds), so the shared store sees several keys."""
+    directory.mkdir(parents=True, exist_ok=True)
+    documents = []
+    for i in range(count):
+        path = directory / f"notes{i}.{fmt}"
+        WRITERS[fmt](path, pages, seed=i)
+        documents.append((path.name, path.read_bytes()))
+    return documents
+
+
+def run_user(i, args, documents, live, live_lock, ready):
+    """Runs `args.sessions` visits for one virtual user and keeps its last session alive."""
+    time.sleep(args.ramp * i / max(args.users, 1))
+    timings, errors, completed = [], [], 0
+    user = None
+    for s in range(args.sessions):
+        user = VirtualUser(i, f"user{i}@example.com", documents[i % len(documents)],
+                           args.questions, args.think, args.timeout, seed=args.seed * 1000 + i * 10 + s)
+        ok = user.visit()
+        completed += ok
+        if s < args.sessions - 1:
+            user.logout()
+        timings.extend(user.timings)
+        errors.extend(user.errors)
+    # Hold the final session open until every user is done, so memory is measured with all of them live
+    with live_lock:
+        live.append(user)
+    ready.wait()
+    return timings, errors, completed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AuraLearn concurrent-user load test")
+    parser.add_argument("--users", type=int, default=10, help="concurrent virtual users")
+    parser.add_argument("--sessions", type=int, default=1, help="visits per user (log out in between)")
+    parser.add_argument("--ramp", type=float, default=5.0, help="seconds over which users start")
+    parser.add_argument("--think", type=float, default=1.0, help="mean pause between interactions (s)")
+    parser.add_argument("--questions", type=int, default=3, help="Explain It calls per visit")
+    parser.add_argument("--documents", type=int, default=3, help="distinct uploads shared among users")
+    parser.add_argument("--format", default="pdf", choices=sorted(WRITERS))
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--history", type=int, default=200, help="quiz results already stored per user")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="fake Groq time to first byte (s)")
+    parser.add_argument("--llm-tps", type=float, default=400.0, help="fake Groq tokens per second")
+    parser.add_argument("--db-latency", type=float, default=0.03, help="fake Firebase round trip (s)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="per-rerun timeout (s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="load-results.json", help="JSON results file")
+    args = parser.parse_args(argv)
+
+    work = Path(tempfile.mkdtemp(prefix="auralearn-load-"))
+    groq, firebase = install_fakes(work, args.llm_latency, args.llm_tps, args.db_latency)
+    for i in range(args.users):
+        firebase.add_user(f"user{i}@example.com", f"uid{i:05d}", username=f"student{i}",
+                          history=args.history, seed=i)
+    documents = make_documents(work / "docs", args.documents, args.format, args.pages)
+
+    # Warm imports and module singletons so the first user doesn't pay for them
+    from streamlit.testing.v1 import AppTest
+    allow_concurrent_sessions()
+    AppTest.from_file(str(APP_PATH), default_timeout=args.timeout).run()
+    gc.collect()
+    rss_start = rss_bytes()
+    rss_peak = rss_start
+    stop_sampling = threading.Event()
+
+    def sample_rss():
+        nonlocal rss_peak
+        while not stop_sampling.wait(0.25):
+            rss_peak = max(rss_peak, rss_bytes())
+
+    print(f"{args.users} users x {args.sessions} sessions, ramp {args.ramp}s, think {args.think}s ...")
+    sampler = threading.Thread(target=sample_rss, daemon=True)
+    sampler.start()
+    live, live_lock, ready = [], threading.Lock(), threading.Event()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.users) as pool:
+        futures = [pool.submit(run_user, i, args, documents, live, live_lock, ready) for i in range(args.users)]
+        while len(live) < args.users and not any(f.done() and f.exception() for f in futures):
+            time.sleep(0.1)
+        wall = time.perf_counter() - start
+        gc.collect()
+        rss_live = rss_bytes()
+        ready.set()
+        outcomes = [f.result() for f in futures]
+    stop_sampling.set()
+    sampler.join()
+    drain_background_work()
+    groq.stop()
+
+    timings = [t for o in outcomes for t in o[0]]
+    errors = [e for o in outcomes for e in o[1]]
+    completed = sum(o[2] for o in outcomes)
+    busy = sum(t for _, t, _ in timings)
+    steps = {}
+    for name, seconds, ok in timings:
+        steps.setdefault(name, []).append(seconds)
+
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": vars(args),
+            "fake_groq_requests": groq.requests,
+            "fake_firebase_calls": firebase.calls,
+        },
+        "wall_seconds": wall,
+        "sessions": {"started": args.users * args.sessions, "completed": completed},
+        "throughput": {
+            "reruns_per_second": len(timings) / wall if wall else 0.0,
+            "sessions_per_minute": completed / wall * 60 if wall else 0.0,
+            # Share of the wall time each user spent waiting on a rerun (vs. thinking)
+            "busy_fraction": busy / (wall * args.users) if wall else 0.0,
+        },
+        "latency": {"all": distribution([t for _, t, _ in timings]),
+                    **{name: distribution(v) for name, v in steps.items()}},
+        "memory": {
+            "rss_start_mb": rss_start / 2**20,
+            "rss_peak_mb": rss_peak / 2**20,
+            "rss_live_mb": rss_live / 2**20,
+            "per_live_session_mb": (rss_live - rss_start) / 2**20 / max(len(live), 1),
+        },
+        "errors": {"count": len(errors), "sample": errors[:20]},
+    }
+    del live
+
+    print(f"\n{completed}/{args.users * args.sessions} sessions completed in {wall:.1f}s, "
+          f"{report['throughput']['reruns_per_second']:.2f} reruns/s, {len(errors)} errors")
+    print(f"  {'step':<16}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, d in report["latency"].items():
+        if d["count"]:
+            print(f"  {name:<16}{d['count']:>7}{d['p50'] * 1000:>10.0f}{d['p95'] * 1000:>10.0f}"
+                  f"{d['p99'] * 1000:>10.0f}{d['max'] * 1000:>10.0f}")
+    memory = report["memory"]
+    print(f"  memory: {memory['rss_start_mb']:.0f} MB idle, {memory['rss_live_mb']:.0f} MB with "
+          f"{args.users} live sessions ({memory['per_live_session_mb']:.2f} MB/session), "
+          f"peak {memory['rss_peak_mb']:.0f} MB")
+    for e in errors[:5]:
+        print(f"  ! {e}")
+
+    Path(args.out).write_text(json.dumps(report, indent=2))
+    print(f"\nWrote {args.out}")
+    shutil.rmtree(work, ignore_errors=True)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
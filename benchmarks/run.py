@@ -0,0 +1,351 @@
+"""
+Offline benchmark runner.
+
+    python -m benchmarks.run --out results.json
+    python -m benchmarks.run --only extract,quiz --sizes small,medium,large
+    python -m benchmarks.run --compare last-release.json --fail-on-regression
+
+Groq, Firebase and gTTS are replaced by the stand-ins in benchmarks/fakes.py,
+so numbers depend only on this code and the configured fake latencies.
+"""
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from pathlib import Path
+
+from benchmarks.fakes import install_fakes, make_wav
+from benchmarks.corpus import build_corpus, WRITERS, SIZES
+
+
+def measure(name, fn, repeat, warmup=1, setup=None, **params):
+    """Runs fn `warmup + repeat` times (setup is untimed) and summarises the timed runs."""
+    for _ in range(warmup):
+        if setup:
+            setup()
+        fn()
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    result = {
+        "name": name,
+        "params": params,
+        "runs": repeat,
+        "mean": statistics.fmean(times),
+        "median": statistics.median(times),
+        "p95": times[min(len(times) - 1, int(round(0.95 * (len(times) - 1))))],
+        "min": times[0],
+        "max": times[-1],
+        "stdev": statistics.stdev(times) if len(times) > 1 else 0.0,
+    }
+    print(f"  {name:<40} mean {result['mean'] * 1000:9.2f} ms   p95 {result['p95'] * 1000:9.2f} ms")
+    return result
+
+
+# ==========================
+# Benchmarks
+# ==========================
+
+def bench_extract(ctx):
+    from modules import pdf_processor
+    results = []
+    real_cache = pdf_processor.get_text_cache
+    for (fmt, size), path in ctx["corpus"].items():
+        data = path.read_bytes()
+
+        def run():
+            f = io.BytesIO(data)
+            f.name = path.name
+            pdf_processor.extract_text_from_pdf(f)
+
+        pdf_processor.get_text_cache = lambda: None
+        try:
+            results.append(measure(f"extract.{fmt}.{size}.cold", run, ctx["repeat"],
+                                   format=fmt, size=size, bytes=len(data)))
+        finally:
+            pdf_processor.get_text_cache = real_cache
+        results.append(measure(f"extract.{fmt}.{size}.cached", run, ctx["repeat"],
+                               format=fmt, size=size, bytes=len(data)))
+    return results
+
+
+def bench_quiz(ctx):
+    from benchmarks.fakes import _quiz
+    from modules.quiz_generator import _parse_quiz, iter_quiz_stream, generate_quiz
+    import random
+    results = []
+    for n in (10, 50):
+        text = _quiz(n, random.Random(n))
+        deltas = [text[i:i + 16] for i in range(0, len(text), 16)]
+        results.append(measure(f"quiz.parse.{n}", lambda: _parse_quiz(text), ctx["repeat"], questions=n))
+        results.append(measure(f"quiz.stream_parse.{n}", lambda: list(iter_quiz_stream(deltas)),
+                               ctx["repeat"], questions=n, deltas=len(deltas)))
+    context = ctx["context"]
+    results.append(measure("quiz.generate.10", lambda: generate_quiz(context, 10, "Medium"), ctx["repeat"],
+                           questions=10, llm_latency=ctx["llm_latency"]))
+    return results
+
+
+def bench_explain(ctx):
+    from modules.llm_handler import explain_with_emotion
+    from modules.tts_pipeline import SpeechStream
+    index = ctx["index"]
+    question = "How does chlorophyll help the Calvin cycle?"
+
+    def round_trip():
+        context = index.retrieve(question)
+        speech = SpeechStream()
+        for _ in speech.tee(explain_with_emotion(context, question, "neutral", stream=True)):
+            pass
+        return speech.audio()
+
+    return [
+        measure("explain.retrieve", lambda: index.retrieve(question), ctx["repeat"], chunks=len(index)),
+        measure("explain.round_trip", round_trip, ctx["repeat"],
+                llm_latency=ctx["llm_latency"], llm_tps=ctx["llm_tps"]),
+    ]
+
+
+def bench_voice(ctx):
+    from modules.voice_handler import transcribe_audio_bytes
+    # Speech-like clip with silence on both sides, so decoding, trimming and recognition all run
+    clip = make_wav(seconds=3, rate=48000, tone=440, pad=1.0)
+    session = {}
+
+    def transcribe():
+        if transcribe_audio_bytes(clip, session) is None:
+            raise AssertionError("voice.transcribe: clip was rejected as silence")
+
+    return [measure("voice.transcribe", transcribe, ctx["repeat"], input_bytes=len(clip))]
+
+
+def bench_limits(ctx):
+    """
+    LLM paths under the real Groq quota (30 RPM / 12000 TPM by default) instead of the
+    fakes' unlimited one, so admission, batching and priority regressions show up.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from modules import llm_handler
+    from modules.llm_scheduler import RequestScheduler
+    from modules.llm_handler import explain_with_emotion
+    from modules.quiz_generator import generate_quiz_from_index
+    index = ctx["index"]
+    limits = {"rpm": ctx["limit_rpm"], "tpm": ctx["limit_tpm"]}
+    # Each run takes seconds to minutes at these limits
+    repeat = max(1, ctx["repeat"] // 5)
+    real = llm_handler.scheduler
+
+    def fresh():
+        llm_handler.scheduler = RequestScheduler(ctx["limit_rpm"], ctx["limit_tpm"])
+
+    def quiz(n):
+        got = len(generate_quiz_from_index(index, n, "Medium"))
+        if got < n:
+            raise AssertionError(f"limits.quiz.{n}: only {got} questions within the rate limit")
+
+    question = "How does chlorophyll help the Calvin cycle?"
+    pool = ThreadPoolExecutor(max_workers=1)
+    fills = []
+
+    def start_fill():
+        # A quiz bank refill (low priority) is already running when the user asks
+        for fill in fills:
+            fill.result()
+        fresh()
+        fills.append(pool.submit(generate_quiz_from_index, index, 40, "Medium", True))
+        time.sleep(0.5)
+
+    def explain():
+        for _ in explain_with_emotion(index.retrieve(question), question, "neutral", stream=True):
+            pass
+
+    results = []
+    try:
+        for n in (10, 40):
+            results.append(measure(f"limits.quiz.{n}", lambda: quiz(n), repeat, warmup=0, setup=fresh,
+                                   questions=n, **limits))
+        results.append(measure("limits.explain_during_bank_fill", explain, repeat, warmup=0, setup=start_fill,
+                               **limits))
+        for fill in fills:
+            fill.result()
+    finally:
+        pool.shutdown(wait=True)
+        llm_handler.scheduler = real
+    return results
+
+
+def bench_progress(ctx):
+    import pandas as pd
+    from modules import data_handler
+    from modules.history_store import get_history_store
+    fake = ctx["firebase"]
+    store = get_history_store()
+    results = []
+    for n in ctx["history"]:
+        uid = f"bench{n}"
+        fake.add_user(f"{uid}@example.com", uid, history=n)
+
+        def full_download():
+            # What the Progress page did before incremental sync
+            history = fake.database().child("users").child(uid).child("history").get().val()
+            df = pd.DataFrame(list(history.values()))
+            df['timestamp'] = pd.to_datetime(df['timestamp'])
+            df['percentage'].mean(), len(df[df['percentage'] == 100])
+            df['timestamp'].dt.date.value_counts()
+
+        results.append(measure(f"progress.full_download.{n}", full_download, ctx["repeat"], records=n))
+        results.append(measure(f"progress.sync_cold.{n}", lambda: data_handler.load_history_summary(uid),
+                               ctx["repeat"], setup=lambda: store.clear(uid), records=n))
+
+        def new_results():
+            for _ in range(5):
+                fake.database().child("users").child(uid).child("history").push(
+                    {"timestamp": time.strftime("%Y-%m-%d %H:%M:%S"), "score": 5, "total": 5,
+                     "mood": "happy", "percentage": 100.0})
+
+        results.append(measure(f"progress.sync_incremental.{n}", lambda: data_handler.load_history_summary(uid),
+                               ctx["repeat"], setup=new_results, records=n, new=5))
+    results.append(measure("progress.save_result", lambda: data_handler.save_result_to_cloud(
+        "bench-save", 4, 5, "happy", "token"), ctx["repeat"], db_latency=ctx["db_latency"]))
+    return results
+
+
+BENCHMARKS = {
+    "extract": bench_extract,
+    "quiz": bench_quiz,
+    "explain": bench_explain,
+    "voice": bench_voice,
+    "progress": bench_progress,
+    "limits": bench_limits,
+}
+
+
+# ==========================
+# Setup and reporting
+# ==========================
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).resolve().parent, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(results, baseline_path, threshold):
+    """Prints mean-time ratios against a previous results file; returns the regressed names."""
+    baseline = {r["name"]: r for r in json.loads(Path(baseline_path).read_text())["results"]}
+    regressions = []
+    print(f"\nCompared with {baseline_path} (regression threshold +{threshold:.0%}):")
+    for r in results:
+        old = baseline.get(r["name"])
+        if not old or not old["mean"]:
+            continue
+        ratio = r["mean"] / old["mean"]
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  <-- slower"
+            regressions.append(r["name"])
+        print(f"  {r['name']:<40} {old['mean'] * 1000:9.2f} -> {r['mean'] * 1000:9.2f} ms  x{ratio:5.2f}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AuraLearn offline benchmarks")
+    parser.add_argument("--out", default="benchmark-results.json", help="JSON results file")
+    parser.add_argument("--only", default=",".join(BENCHMARKS), help="comma-separated groups: " + ", ".join(BENCHMARKS))
+    parser.add_argument("--sizes", default="small,medium", help="corpus sizes: " + ", ".join(SIZES))
+    parser.add_argument("--formats", default=",".join(WRITERS), help="corpus formats")
+    parser.add_argument("--history", default="1000,5000", help="history sizes for the progress benchmarks")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="fake Groq time to first byte (s)")
+    parser.add_argument("--llm-tps", type=float, default=400.0, help="fake Groq tokens per second")
+    parser.add_argument("--db-latency", type=float, default=0.03, help="fake Firebase round trip (s)")
+    parser.add_argument("--limit-rpm", type=float, default=30.0, help="requests/min for the limits benchmarks")
+    parser.add_argument("--limit-tpm", type=float, default=12000.0, help="tokens/min for the limits benchmarks")
+    parser.add_argument("--corpus-dir", help="keep generated documents here (default: temp dir)")
+    parser.add_argument("--compare", help="previous results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative slowdown counted as regression")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args(argv)
+
+    work = Path(tempfile.mkdtemp(prefix="auralearn-bench-"))
+    groq, firebase = install_fakes(work, args.llm_latency, args.llm_tps, args.db_latency)
+    from modules.pdf_processor import extract_text_from_pdf
+    from modules.retriever import build_index
+
+    sizes = [s for s in args.sizes.split(",") if s]
+    formats = [f for f in args.formats.split(",") if f]
+    corpus_dir = Path(args.corpus_dir) if args.corpus_dir else work / "corpus"
+    print(f"Building corpus in {corpus_dir} ...")
+    corpus = build_corpus(corpus_dir, sizes, formats)
+
+    # Shared context document for the LLM benchmarks
+    sample = corpus_dir / "medium.pdf"
+    if not sample.exists():
+        WRITERS["pdf"](sample, SIZES["medium"])
+    f = io.BytesIO(sample.read_bytes())
+    f.name = sample.name
+    text = extract_text_from_pdf(f)
+    index = build_index(text)
+
+    ctx = {
+        "corpus": corpus,
+        "repeat": args.repeat,
+        "index": index,
+        "context": index.overview(),
+        "firebase": firebase,
+        "history": [int(n) for n in args.history.split(",") if n],
+        "llm_latency": args.llm_latency,
+        "llm_tps": args.llm_tps,
+        "db_latency": args.db_latency,
+        "limit_rpm": args.limit_rpm,
+        "limit_tpm": args.limit_tpm,
+    }
+
+    results = []
+    try:
+        for group in [g for g in args.only.split(",") if g]:
+            print(f"[{group}]")
+            results.extend(BENCHMARKS[group](ctx))
+    finally:
+        groq.stop()
+
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "revision": _git_revision(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": vars(args),
+            "fake_groq_requests": groq.requests,
+            "fake_firebase_calls": firebase.calls,
+        },
+        "results": results,
+    }
+    Path(args.out).write_text(json.dumps(report, indent=2))
+    print(f"\nWrote {len(results)} results to {args.out}")
+
+    regressions = compare(results, args.compare, args.threshold) if args.compare else []
+    if not args.corpus_dir:
+        shutil.rmtree(work, ignore_errors=True)
+    if regressions and args.fail_on_regression:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+import os
+import time
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from modules.text_cache import CACHE_DIR
+
+# Content-addressed store of synthesized speech
+AUDIO_CACHE_MAX_MB = int(os.getenv("AUDIO_CACHE_MAX_MB", "256"))
+# Files used more recently than this are never evicted: this grace window is what keeps a path
+# handed to a session valid while it plays (every get_path/put refreshes the file's mtime)
+AUDIO_CACHE_GRACE_SECONDS = float(os.getenv("AUDIO_CACHE_GRACE_SECONDS", "300"))
+
+
+def audio_mime(data: bytes) -> str:
+    """MIME type from the file header (local engines produce WAV, gTTS produces MP3)."""
+    return "audio/wav" if data[:4] == b"RIFF" else "audio/mp3"
+
+
+def audio_key(text: str, lang: str, slow: bool, engine="gtts") -> str:
+    payload = "\0".join([engine, lang, "slow" if slow else "normal", text.strip()])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AudioCache:
+    """
+    MP3/WAV files sharded by hash prefix with a byte budget and LRU eviction.
+    Eviction skips anything used within the grace period, so a path handed out
+    to a session stays valid while it is being played.
+    """
+
+    def __init__(self, root=None, max_bytes=AUDIO_CACHE_MAX_MB * 1024 * 1024, grace=AUDIO_CACHE_GRACE_SECONDS):
+        self.root = Path(root) if root else CACHE_DIR / "audio"
+        self.max_bytes = max_bytes
+        self.grace = grace
+        self._lock = threading.Lock()
+        self._files = OrderedDict()  # path -> size, least recently used first
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.root.mkdir(parents=True, exist_ok=True)
+
+        existing = []
+        for path in [*self.root.glob("*/*.mp3"), *self.root.glob("*/*.wav")]:
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            existing.append((st.st_mtime, str(path), st.st_size))
+        for _, path, size in sorted(existing):
+            self._files[path] = size
+            self.total_bytes += size
+
+    def _path(self, key, ext=".mp3"):
+        return self.root / key[:2] / f"{key}{ext}"
+
+    def get_path(self, key):
+        with self._lock:
+            path = next((p for p in (self._path(key, ".mp3"), self._path(key, ".wav")) if p.exists()), None)
+            if path is None:
+                self.misses += 1
+                return None
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            if str(path) in self._files:
+                self._files.move_to_end(str(path))
+            else:
+                self._files[str(path)] = path.stat().st_size
+                self.total_bytes += self._files[str(path)]
+            self.hits += 1
+        return str(path)
+
+    def get_bytes(self, key):
+        path = self.get_path(key)
+        if path is None:
+            return None
+        try:
+            return Path(path).read_bytes()
+        except OSError:
+            return None
+
+    def put(self, key, data: bytes):
+        path = self._path(key, ".wav" if audio_mime(data) == "audio/wav" else ".mp3")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write then rename so readers never see a half-written file
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".part")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            old = self._files.pop(str(path), 0)
+            self._files[str(path)] = len(data)
+            self.total_bytes += len(data) - old
+            self._evict()
+        return str(path)
+
+    def _evict(self):
+        if self.total_bytes <= self.max_bytes:
+            return
+        now = time.time()
+        for path in list(self._files):
+            if self.total_bytes <= self.max_bytes:
+                break
+            try:
+                if now - os.path.getmtime(path) < self.grace:
+                    continue
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                continue
+            self.total_bytes -= self._files.pop(path)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "files": len(self._files), "bytes": self.total_bytes}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_audio_cache():
+    """Process-wide audio cache (None if the cache dir is not writable)."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            try:
+                _cache = AudioCache()
+            except Exception as e:
+                print(f"Audio cache disabled: {e}")
+                return None
+    return _cache
@@ -0,0 +1,163 @@
+import os
+import mmap
+import struct
+import threading
+from collections.abc import Sequence
+from pathlib import Path
+import numpy as np
+from modules.text_cache import CACHE_DIR
+
+# Uploads at least this big are extracted straight to an on-disk chunk file
+LARGE_DOC_BYTES = int(os.getenv("LARGE_DOC_MB", "16")) * 1024 * 1024
+CHUNK_DIR = CACHE_DIR / "chunks"
+# Finished chunk files double as the large-document extraction cache; least recently used go first
+CHUNK_CACHE_MAX_BYTES = int(os.getenv("CHUNK_CACHE_MAX_MB", "2048")) * 1024 * 1024
+
+# File layout:
+#   records:  [u32 length][length bytes of UTF-8] ...
+#   index:    u64 offset of every record, little endian
+#   trailer:  u64 index offset, u64 record count, 8-byte magic
+_MAGIC = b"ALCHUNK1"
+_TRAILER = struct.Struct("<QQ8s")
+_LENGTH = struct.Struct("<I")
+
+
+def chunk_path(key) -> Path:
+    return CHUNK_DIR / f"{key}.chunks"
+
+
+def touch_chunk_file(path):
+    """Marks a chunk file as recently used (its mtime is the LRU clock)."""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def evict_chunk_files(max_bytes=CHUNK_CACHE_MAX_BYTES, keep=None, root=None):
+    """
+    Deletes least recently used chunk files until the directory fits in max_bytes.
+    Files still mapped by a document stay readable until it is dropped.
+    """
+    files = []
+    for path in Path(root or CHUNK_DIR).glob("*.chunks"):
+        try:
+            st = path.stat()
+        except OSError:
+            continue
+        files.append((st.st_mtime, st.st_size, path))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files, key=lambda f: f[0]):
+        if total <= max_bytes:
+            break
+        if keep is not None and path == Path(keep):
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+
+
+class ChunkWriter:
+    """
+    Appends chunks to a new chunk file. The file only appears under its final
+    name after close(), so a crash never leaves a truncated file behind.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._tmp = self.path.with_suffix(f".part{threading.get_ident()}")
+        self._f = open(self._tmp, "wb")
+        self._offsets = []
+        self._pos = 0
+
+    def append(self, text):
+        data = text.encode("utf-8")
+        self._offsets.append(self._pos)
+        self._f.write(_LENGTH.pack(len(data)))
+        self._f.write(data)
+        self._pos += _LENGTH.size + len(data)
+
+    def __len__(self):
+        return len(self._offsets)
+
+    @property
+    def nbytes(self):
+        return self._pos
+
+    def snapshot(self):
+        """Read-only ChunkFile over the records written so far (the file keeps growing)."""
+        self._f.flush()
+        return ChunkFile.from_records(self._tmp, self._offsets)
+
+    def close(self):
+        self._f.write(np.asarray(self._offsets, dtype="<u8").tobytes())
+        self._f.write(_TRAILER.pack(self._pos, len(self._offsets), _MAGIC))
+        self._f.close()
+        os.replace(self._tmp, self.path)
+        return self.path
+
+    def abort(self):
+        self._f.close()
+        try:
+            os.remove(self._tmp)
+        except OSError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class ChunkFile(Sequence):
+    """
+    Read-only, memory-mapped chunk file.
+    Indexing returns a str decoded from just that record; view() returns a
+    zero-copy memoryview of the UTF-8 bytes. Pages that are never read are
+    never loaded.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mm) < _TRAILER.size:
+            raise ValueError(f"Not a chunk file: {self.path}")
+        index_at, count, magic = _TRAILER.unpack_from(self._mm, len(self._mm) - _TRAILER.size)
+        if magic != _MAGIC:
+            raise ValueError(f"Not a chunk file: {self.path}")
+        self._offsets = np.frombuffer(self._mm, dtype="<u8", count=count, offset=index_at)
+        self.nbytes = index_at
+
+    @classmethod
+    def from_records(cls, path, offsets):
+        """Maps a file that has records but no index/trailer yet, using known record offsets."""
+        self = cls.__new__(cls)
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._offsets = np.asarray(offsets, dtype="<u8")
+        self.nbytes = len(self._mm)
+        return self
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def view(self, i):
+        start = int(self._offsets[i])
+        (length,) = _LENGTH.unpack_from(self._mm, start)
+        start += _LENGTH.size
+        return memoryview(self._mm)[start:start + length]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        with self.view(i) as data:
+            return str(data, "utf-8")
@@ -1,15 +1,44 @@
 import pyrebase
 import json
 import os
+import time
+import threading
+from collections import OrderedDict
 from datetime import datetime
 from pathlib import Path
+from requests.adapters import HTTPAdapter
 import streamlit as st
+from modules.history_store import get_history_store
+from modules.write_queue import get_write_queue
+from modules.metrics import timed, observe
 
-def get_firebase():
+# One pooled HTTP session for every Firebase call in the process
+FIREBASE_POOL_SIZE = int(os.getenv("FIREBASE_POOL_SIZE", "20"))
+# Connection-level retries, as pyrebase's own adapter has always done
+FIREBASE_MAX_RETRIES = int(os.getenv("FIREBASE_MAX_RETRIES", "3"))
+FIREBASE_CONFIG_PATH = Path("config/firebase_config.json")
+
+_file_config = (None, None)  # (mtime, parsed config)
+
+
+def _read_config_file():
+    """Parses the local config file again only when its mtime changes."""
+    global _file_config
+    try:
+        mtime = FIREBASE_CONFIG_PATH.stat().st_mtime
+    except OSError:
+        return None
+    if _file_config[0] != mtime:
+        with open(FIREBASE_CONFIG_PATH) as f:
+            _file_config = (mtime, json.load(f))
+    return _file_config[1]
+
+
+def load_firebase_config():
     # 1. Try Environment Variables (Render / Universal Cloud)
     # This checks if the keys you added in Render Dashboard exist
     if os.getenv("FIREBASE_API_KEY"):
-        config = {
+        return {
             "apiKey": os.getenv("FIREBASE_API_KEY"),
             "authDomain": os.getenv("FIREBASE_AUTH_DOMAIN"),
             "databaseURL": os.getenv("FIREBASE_DATABASE_URL"),
@@ -18,32 +47,121 @@ def get_firebase():
             "messagingSenderId": os.getenv("FIREBASE_MESSAGING_SENDER_ID"),
             "appId": os.getenv("FIREBASE_APP_ID")
         }
-        return pyrebase.initialize_app(config)
 
     # 2. Try Streamlit Secrets (Streamlit Cloud)
     # We wrap this in try/except so it doesn't crash if the secrets file is missing
     try:
         if "firebase" in st.secrets:
-            config = dict(st.secrets["firebase"])
-            return pyrebase.initialize_app(config)
-    except:
+            return dict(st.secrets["firebase"])
+    except Exception:
         pass
 
     # 3. Try Local File (Localhost)
-    config_path = Path("config/firebase_config.json")
-    if config_path.exists():
-        with open(config_path) as f:
-            config = json.load(f)
-        return pyrebase.initialize_app(config)
-    
-    return None
+    return _read_config_file()
 
-def save_result_to_cloud(user_id, score, total, mood, token=None):
-    """Saves data using the User's Auth Token."""
+
+@st.cache_resource(show_spinner=False)
+def _firebase_app(config_json):
+    """Built once per distinct config; keyed by the serialized config."""
+    firebase = pyrebase.initialize_app(json.loads(config_json))
+    adapter = HTTPAdapter(pool_connections=FIREBASE_POOL_SIZE, pool_maxsize=FIREBASE_POOL_SIZE,
+                          max_retries=FIREBASE_MAX_RETRIES)
+    for scheme in ('http://', 'https://'):
+        firebase.requests.mount(scheme, adapter)
+    return firebase
+
+
+def get_firebase():
+    """
+    Process-wide Firebase app (None if not configured).
+    Reuses one keep-alive HTTP session; a new app is built only if the config changes.
+    """
+    config = load_firebase_config()
+    if not config:
+        return None
+    return _firebase_app(json.dumps(config, sort_keys=True))
+
+
+def get_db():
+    """
+    Fresh Database handle on the shared session.
+    pyrebase keeps the child() path on the handle, so handles are never shared between calls.
+    """
     firebase = get_firebase()
-    if not firebase: return False
-    
-    db = firebase.database()
+    return firebase.database() if firebase else None
+
+# Results fetched per request when syncing history
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "200"))
+
+# ==========================
+# Profile cache
+# ==========================
+# Profiles change only through save_profile, so a long TTL is safe
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "900"))
+# Least recently used profiles are dropped past this many users
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "1000"))
+# A failed read is remembered briefly so a database outage isn't hit on every rerun
+PROFILE_FAILURE_TTL = float(os.getenv("PROFILE_FAILURE_TTL", "10"))
+
+_profiles = OrderedDict()  # user_id -> (expires_at, profile), least recently used first
+_profiles_lock = threading.Lock()
+_LOAD_FAILED = object()
+
+
+def cache_profile(user_id, profile, ttl=PROFILE_CACHE_TTL):
+    with _profiles_lock:
+        _profiles[user_id] = (time.monotonic() + ttl, profile)
+        _profiles.move_to_end(user_id)
+        while len(_profiles) > PROFILE_CACHE_SIZE:
+            _profiles.popitem(last=False)
+
+
+def invalidate_profile(user_id):
+    with _profiles_lock:
+        _profiles.pop(user_id, None)
+
+
+def get_profile(user_id, token=None, refresh=False):
+    """
+    Profile dict for a user, read from the database at most once per TTL.
+    After a failed read, None is returned without retrying for PROFILE_FAILURE_TTL.
+    """
+    if not refresh:
+        with _profiles_lock:
+            entry = _profiles.get(user_id)
+            if entry and entry[0] > time.monotonic():
+                _profiles.move_to_end(user_id)
+                return None if entry[1] is _LOAD_FAILED else entry[1]
+
+    db = get_db()
+    if not db: return None
+    try:
+        profile = db.child("users").child(user_id).child("profile").get(token=token).val()
+    except Exception as e:
+        print(f"Profile Load Error: {e}")
+        cache_profile(user_id, _LOAD_FAILED, PROFILE_FAILURE_TTL)
+        return None
+    cache_profile(user_id, profile)
+    return profile
+
+
+def save_profile(user_id, profile, token=None):
+    """Writes the profile and refreshes the cached copy."""
+    db = get_db()
+    if not db: return False
+    invalidate_profile(user_id)
+    db.child("users").child(user_id).child("profile").set(profile, token=token)
+    cache_profile(user_id, profile)
+    return True
+
+
+@timed("db_save_seconds")
+def save_result_to_cloud(user_id, score, total, mood, token=None):
+    """
+    Saves data using the User's Auth Token.
+    The write goes through the write-behind queue, so this returns without
+    waiting on the network; a synchronous push is only the fallback.
+    """
     data = {
         "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
         "score": score,
@@ -51,23 +169,110 @@ def save_result_to_cloud(user_id, score, total, mood, token=None):
         "mood": mood,
         "percentage": round((score/total)*100, 1)
     }
-    
-    try:
-        if token:
-            db.child("users").child(user_id).child("history").push(data, token=token)
+
+    observe("db_save_payload_bytes", len(json.dumps(data)))
+    queue = get_write_queue(get_db)
+    key = queue.new_key() if queue else None
+    if key:
+        queue.enqueue(user_id, f"history/{key}", data, token)
+    else:
+        db = get_db()
+        if not db: return False
+        try:
+            if token:
+                result = db.child("users").child(user_id).child("history").push(data, token=token)
+            else:
+                result = db.child("users").child(user_id).child("history").push(data)
+        except Exception as e:
+            print(f"Save Error: {e}")
+            return False
+        key = result.get("name") if isinstance(result, dict) else None
+
+    # Record it locally too; the sync cursor is left alone so results
+    # pushed from other devices in the meantime are still fetched
+    store = get_history_store()
+    if store and key:
+        store.add(user_id, [(key, data)])
+    return True
+
+def resume_pending_writes(user_id, token):
+    """Hands a fresh sign-in token to the write queue so journaled results can be sent."""
+    queue = get_write_queue(get_db)
+    if queue:
+        queue.authorize(user_id, token)
+
+def unsynced_results(user_id):
+    """Results the write queue gave up on for this user (still kept locally)."""
+    queue = get_write_queue(get_db)
+    return queue.failed(user_id) if queue else 0
+
+def fetch_history_pages(user_id, token=None, start_key=None, page_size=HISTORY_PAGE_SIZE):
+    """
+    Yields lists of (key, record) in key order, starting after start_key.
+    Push keys sort chronologically, so this walks only results newer than the cursor.
+    """
+    while True:
+        db = get_db()
+        if not db: return
+        query = db.child("users").child(user_id).child("history").order_by_key()
+        if start_key is not None:
+            # startAt is inclusive: fetch one extra and drop the cursor row
+            query = query.start_at(str(start_key)).limit_to_first(page_size + 1)
         else:
-            db.child("users").child(user_id).child("history").push(data)
-        return True
+            query = query.limit_to_first(page_size)
+        items = [(str(p.key()), p.val()) for p in (query.get(token=token).each() or [])]
+        if start_key is not None:
+            items = [(k, v) for k, v in items if k != str(start_key)]
+        if not items:
+            return
+        yield items
+        if len(items) < page_size:
+            return
+        start_key = items[-1][0]
+
+def sync_history(user_id, token=None):
+    """
+    Pulls only results newer than the stored cursor into the local store.
+    Returns the number of new records (0 when already up to date).
+    """
+    store = get_history_store()
+    if not store: return 0
+    added = 0
+    for page in fetch_history_pages(user_id, token, store.cursor(user_id)):
+        observe("db_history_page_records", len(page))
+        added += store.add(user_id, page, cursor=page[-1][0])
+    return added
+
+@timed("db_load_seconds", fn="summary")
+def load_history_summary(user_id, token=None):
+    """Syncs incrementally, then returns the running aggregates (see HistoryStore.summary)."""
+    store = get_history_store()
+    if not store: return None
+    try:
+        sync_history(user_id, token)
     except Exception as e:
-        print(f"Save Error: {e}")
-        return False
+        print(f"Sync Error: {e}")
+    return store.summary(user_id)
+
+def load_recent_history(user_id, limit=None):
+    """Locally stored results, newest first (no network)."""
+    store = get_history_store()
+    return store.records(user_id, limit) if store else []
 
+@timed("db_load_seconds", fn="history")
 def load_history_from_cloud(user_id, token=None):
-    """Loads data using the User's Auth Token."""
-    firebase = get_firebase()
-    if not firebase: return []
-    
-    db = firebase.database()
+    """Loads data using the User's Auth Token (incrementally, via the local store)."""
+    store = get_history_store()
+    if store:
+        try:
+            sync_history(user_id, token)
+        except Exception as e:
+            print(f"Sync Error: {e}")
+        return store.records(user_id)
+
+    # No local store: full download
+    db = get_db()
+    if not db: return []
     try:
         if token:
             history = db.child("users").child(user_id).child("history").get(token=token).val()
@@ -76,6 +281,7 @@ def load_history_from_cloud(user_id, token=None):
         
         if not history: return []
             
+        observe("db_history_page_records", len(history))
         if isinstance(history, dict):
             return list(history.values())
         if isinstance(history, list):
@@ -84,4 +290,4 @@ def load_history_from_cloud(user_id, token=None):
         return []
     except Exception as e:
         print(f"Load Error: {e}")
-        return []
\ No newline at end of file
+        return []
@@ -0,0 +1,190 @@
+import os
+import time
+import hashlib
+import weakref
+import threading
+from modules.retriever import build_index_utf8, DocumentIndex
+from modules.chunk_store import ChunkFile, touch_chunk_file
+
+# Unreferenced documents stay this long so a re-upload (or the next class) reuses them
+DOC_IDLE_SECONDS = float(os.getenv("DOC_IDLE_SECONDS", "600"))
+
+_ERROR_PREFIX = "⚠️".encode("utf-8")
+
+
+def document_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class Document:
+    """
+    One extracted document, shared by every session that uploaded it.
+    The text is kept as immutable UTF-8 bytes, or for large uploads as a
+    memory-mapped ChunkFile. The retrieval index is built once, on first
+    use, by whichever session asks first, and reads its chunks from that storage.
+    """
+
+    def __init__(self, key, text=None, partial=False, chunks=None):
+        self.key = key
+        self.chunks = chunks
+        self.data = text.encode("utf-8") if text is not None else b""
+        self.chars = len(text) if text is not None else chunks.nbytes
+        self.partial = partial
+        self.refs = 0
+        self.idle_since = time.monotonic()
+        self._index = None
+        self._lock = threading.Lock()
+
+    @property
+    def text(self):
+        if self.chunks is not None:
+            # Overlapping chunks, so only for display/debugging; retrieval uses the index
+            return "\n\n".join(self.chunks)
+        return self.data.decode("utf-8")
+
+    @property
+    def is_error(self):
+        return self.data.startswith(_ERROR_PREFIX)
+
+    @property
+    def index(self):
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    if self.chunks is not None:
+                        self._index = DocumentIndex(self.chunks)
+                    else:
+                        # Chunks are offsets into self.data, so the text isn't held twice
+                        self._index = build_index_utf8(self.data)
+        return self._index
+
+
+class DocumentHandle:
+    """
+    What a session keeps instead of the text. Releases its reference when
+    release() is called or when the session state holding it is collected.
+    """
+
+    def __init__(self, store, doc):
+        self._doc = doc
+        self._release = weakref.finalize(self, store._release, doc.key)
+
+    @property
+    def key(self):
+        return self._doc.key
+
+    @property
+    def partial(self):
+        return self._doc.partial
+
+    @property
+    def chars(self):
+        return self._doc.chars
+
+    @property
+    def is_error(self):
+        return self._doc.is_error
+
+    @property
+    def text(self):
+        return self._doc.text
+
+    @property
+    def index(self):
+        return self._doc.index
+
+    def release(self):
+        self._release()
+
+
+class DocumentStore:
+    """
+    Process-wide, content-addressed documents with reference counting.
+    Identical uploads share one Document; documents with no handles left are
+    dropped after DOC_IDLE_SECONDS (partial ingest snapshots right away).
+    """
+
+    def __init__(self, idle_seconds=DOC_IDLE_SECONDS):
+        self.idle_seconds = idle_seconds
+        self._docs = {}
+        self._lock = threading.Lock()
+
+    def intern(self, text, partial=False):
+        key = document_key(text)
+        with self._lock:
+            self._sweep()
+            doc = self._docs.get(key)
+            if doc is None:
+                doc = self._docs[key] = Document(key, text, partial)
+            elif not partial:
+                doc.partial = False
+            doc.refs += 1
+        return DocumentHandle(self, doc)
+
+    def intern_chunks(self, key, path):
+        """Handle on a large document stored as a chunk file (mapped once per process)."""
+        with self._lock:
+            self._sweep()
+            doc = self._docs.get(key)
+            if doc is None:
+                touch_chunk_file(path)
+                doc = self._docs[key] = Document(key, chunks=ChunkFile(path))
+            doc.refs += 1
+        return DocumentHandle(self, doc)
+
+    def intern_snapshot(self, key, chunks, partial=True):
+        """Handle on chunks that are not (yet) a cached chunk file: an ingest in progress or cut short."""
+        with self._lock:
+            self._sweep()
+            doc = self._docs.get(key)
+            if doc is None:
+                doc = self._docs[key] = Document(key, chunks=chunks, partial=partial)
+            doc.refs += 1
+        return DocumentHandle(self, doc)
+
+    def get(self, key):
+        """New handle on an already stored document (None if unknown or evicted)."""
+        with self._lock:
+            doc = self._docs.get(key)
+            if doc is None:
+                return None
+            doc.refs += 1
+        return DocumentHandle(self, doc)
+
+    def _release(self, key):
+        with self._lock:
+            doc = self._docs.get(key)
+            if doc is None:
+                return
+            doc.refs -= 1
+            if doc.refs <= 0:
+                doc.idle_since = time.monotonic()
+                if doc.partial:
+                    del self._docs[key]
+            self._sweep()
+
+    def _sweep(self):
+        cutoff = time.monotonic() - self.idle_seconds
+        for key in [k for k, d in self._docs.items() if d.refs <= 0 and d.idle_since < cutoff]:
+            del self._docs[key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "documents": len(self._docs),
+                "bytes": sum(len(d.data) for d in self._docs.values()),
+                "mapped_bytes": sum(d.chunks.nbytes for d in self._docs.values() if d.chunks is not None),
+                "refs": sum(d.refs for d in self._docs.values()),
+            }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_document_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = DocumentStore()
+    return _store
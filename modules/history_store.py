@@ -0,0 +1,122 @@
+import json
+import threading
+from pathlib import Path
+from modules.text_cache import CACHE_DIR, sqlite_connection
+
+
+class HistoryStore:
+    """
+    Local per-user copy of quiz history plus running aggregates.
+    Records are keyed by their Firebase push key, so re-fetching or locally
+    appending the same result twice never double counts. Aggregates
+    (count, percentage sum, perfect scores, results per day) are updated on
+    insert, so reading a summary never scans the records.
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else CACHE_DIR / "history.sqlite3"
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(
+                "CREATE TABLE IF NOT EXISTS records ("
+                " user_id TEXT NOT NULL, key TEXT NOT NULL, timestamp TEXT, data TEXT NOT NULL,"
+                " PRIMARY KEY (user_id, key));"
+                "CREATE INDEX IF NOT EXISTS records_by_time ON records (user_id, timestamp);"
+                "CREATE TABLE IF NOT EXISTS cursors (user_id TEXT PRIMARY KEY, last_key TEXT);"
+                "CREATE TABLE IF NOT EXISTS totals ("
+                " user_id TEXT PRIMARY KEY, count INTEGER NOT NULL, pct_sum REAL NOT NULL, perfect INTEGER NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS daily ("
+                " user_id TEXT NOT NULL, day TEXT NOT NULL, count INTEGER NOT NULL,"
+                " PRIMARY KEY (user_id, day));"
+            )
+
+    def _connect(self):
+        return sqlite_connection(self.path)
+
+    def cursor(self, user_id):
+        """Last Firebase key fetched by a sync (None before the first sync)."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT last_key FROM cursors WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else None
+
+    def add(self, user_id, items, cursor=None):
+        """
+        Stores (key, record) pairs and folds the new ones into the aggregates.
+        Moves the sync cursor to `cursor` when given. Returns how many were new.
+        """
+        added = 0
+        with self._lock, self._connect() as conn:
+            for key, record in items:
+                if not isinstance(record, dict):
+                    continue
+                timestamp = str(record.get("timestamp", ""))
+                inserted = conn.execute(
+                    "INSERT OR IGNORE INTO records VALUES (?, ?, ?, ?)",
+                    (user_id, str(key), timestamp, json.dumps(record)),
+                ).rowcount
+                if not inserted:
+                    continue
+                added += 1
+                pct = float(record.get("percentage") or 0)
+                conn.execute(
+                    "INSERT INTO totals VALUES (?, 1, ?, ?) ON CONFLICT(user_id) DO UPDATE SET"
+                    " count = count + 1, pct_sum = pct_sum + excluded.pct_sum, perfect = perfect + excluded.perfect",
+                    (user_id, pct, int(pct == 100)),
+                )
+                if timestamp:
+                    conn.execute(
+                        "INSERT INTO daily VALUES (?, ?, 1) ON CONFLICT(user_id, day) DO UPDATE SET count = count + 1",
+                        (user_id, timestamp[:10]),
+                    )
+            if cursor is not None:
+                conn.execute(
+                    "INSERT INTO cursors VALUES (?, ?) ON CONFLICT(user_id) DO UPDATE SET last_key = excluded.last_key",
+                    (user_id, str(cursor)),
+                )
+        return added
+
+    def summary(self, user_id):
+        """{'count', 'avg', 'perfect', 'daily': {YYYY-MM-DD: n}} from the running aggregates."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT count, pct_sum, perfect FROM totals WHERE user_id = ?", (user_id,)).fetchone()
+            daily = conn.execute("SELECT day, count FROM daily WHERE user_id = ? ORDER BY day", (user_id,)).fetchall()
+        count, pct_sum, perfect = row if row else (0, 0.0, 0)
+        return {
+            "count": count,
+            "avg": pct_sum / count if count else 0.0,
+            "perfect": perfect,
+            "daily": dict(daily),
+        }
+
+    def records(self, user_id, limit=None):
+        """Stored records, newest first."""
+        query = "SELECT data FROM records WHERE user_id = ? ORDER BY timestamp DESC, key DESC"
+        params = [user_id]
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self._connect() as conn:
+            return [json.loads(data) for (data,) in conn.execute(query, params)]
+
+    def clear(self, user_id):
+        with self._lock, self._connect() as conn:
+            for table in ("records", "cursors", "totals", "daily"):
+                conn.execute(f"DELETE FROM {table} WHERE user_id = ?", (user_id,))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_history_store():
+    """Process-wide history store (None if the cache dir is not writable)."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            try:
+                _store = HistoryStore()
+            except Exception as e:
+                print(f"History store disabled: {e}")
+                return None
+    return _store
@@ -0,0 +1,208 @@
+import io
+import os
+import shutil
+import time
+import tempfile
+import threading
+from modules.pdf_processor import (
+    iter_document_text, iter_document_file, ExtractionCancelled, ExtractionIncomplete, EXTRACTOR_VERSION,
+)
+from modules.chunk_store import LARGE_DOC_BYTES, ChunkWriter, chunk_path, touch_chunk_file, evict_chunk_files
+from modules.retriever import iter_chunks
+from modules.text_cache import file_content_key
+from modules.metrics import observe, count
+
+
+class IngestJob:
+    """
+    Extracts an upload on a background thread.
+    Sections become readable as soon as they are extracted, so the app can
+    answer questions about the first pages while the rest is still parsing.
+
+    Uploads of LARGE_DOC_BYTES or more take the large-document path instead:
+    the upload is spooled to disk, pages are chunked as they are extracted and
+    written to a chunk file, and no full-text string is ever built. snapshot()
+    maps the chunks written so far; the result is available as
+    `chunk_key`/`chunk_file` once the job is done. If extraction stopped early,
+    the chunk file is discarded (never cached) and snapshot() holds the result.
+    """
+
+    def __init__(self, uploaded_file, large_threshold=LARGE_DOC_BYTES):
+        self.name = uploaded_file.name
+        self._sections = []
+        self._chars = 0
+        self._lock = threading.Lock()
+        self.version = 0
+        self.done = False
+        self.error = None
+        self.chunk_key = None
+        self.chunk_file = None
+        self._page_count = 0
+        self._cancel = threading.Event()
+        self._key = None
+        self._writer = None
+        self._final = None
+        self.incomplete = False
+        self._format = os.path.splitext(uploaded_file.name)[1].lower().lstrip(".")
+        self._started = time.perf_counter()
+        self._first_at = None
+        self.large = getattr(uploaded_file, "size", 0) >= large_threshold
+        if self.large:
+            # Spool to disk so the job doesn't keep a second in-memory copy
+            ext = os.path.splitext(uploaded_file.name)[1]
+            with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as spool:
+                uploaded_file.seek(0)
+                shutil.copyfileobj(uploaded_file, spool, 1 << 20)
+                self._path = spool.name
+            self._file = None
+        else:
+            # Copy the upload so the job doesn't depend on the widget staying alive
+            self._file = io.BytesIO(uploaded_file.getvalue())
+            self._file.name = uploaded_file.name
+        self._thread = threading.Thread(target=self._run_large if self.large else self._run, daemon=True)
+        self._thread.start()
+
+    def _mark_first(self):
+        if self._first_at is None:
+            self._first_at = time.perf_counter()
+
+    def _record(self, mode, failed):
+        """Upload-to-finished (and upload-to-first-section) latency; cancelled jobs are skipped."""
+        labels = {"format": self._format, "mode": mode}
+        if failed:
+            count("extract_errors_total", **labels)
+        elif not self._cancel.is_set():
+            observe("extract_seconds", time.perf_counter() - self._started, **labels)
+            if self._first_at is not None:
+                observe("extract_first_section_seconds", self._first_at - self._started, **labels)
+
+    def _run(self):
+        failed = False
+        try:
+            for section in iter_document_text(self._file, cancel=self._cancel):
+                self._mark_first()
+                with self._lock:
+                    self._chars += len(section) + (1 if self._sections else 0)
+                    self._sections.append(section)
+                    self.version += 1
+            # Extraction errors arrive as a single "⚠️ ..." section
+            failed = len(self._sections) == 1 and self._sections[0].startswith("⚠️")
+        except Exception as e:
+            print(f"Ingest Error: {e}")
+            self.error = str(e)
+            failed = True
+        finally:
+            self._file = None
+            self._record("stream", failed)
+            self.done = True
+
+    def _pages(self):
+        """Extracted sections, counted for progress but not kept."""
+        try:
+            for section in iter_document_file(self._path, self.name, cancel=self._cancel):
+                if section.startswith("⚠️"):
+                    raise ValueError(section[2:].strip())
+                self._page_count += 1
+                yield section
+        except ExtractionIncomplete as e:
+            # Returning normally lets iter_chunks flush the last buffered chunk
+            print(f"PDF extraction stopped early: {e}")
+            self.incomplete = True
+
+    def _run_large(self):
+        failed = False
+        try:
+            ext = self._format
+            observe("extract_input_bytes", os.path.getsize(self._path), format=ext)
+            key = file_content_key(self._path, ext, EXTRACTOR_VERSION)
+            path = chunk_path(key)
+            # The chunk file doubles as the extraction cache for large uploads
+            if path.exists():
+                touch_chunk_file(path)
+            else:
+                self._key = key
+                writer = ChunkWriter(path)
+                with self._lock:
+                    self._writer = writer
+                try:
+                    for chunk in iter_chunks(self._pages()):
+                        self._mark_first()
+                        with self._lock:
+                            writer.append(chunk)
+                            self.version += 1
+                    with self._lock:
+                        if self.incomplete and len(writer):
+                            # Serve what was read, but never cache it under the content key
+                            self._final = (f"{key}:incomplete", writer.snapshot())
+                        self._writer = None
+                except BaseException:
+                    with self._lock:
+                        self._writer = None
+                    writer.abort()
+                    raise
+                if self.incomplete:
+                    writer.abort()
+                    return
+                writer.close()
+                evict_chunk_files(keep=path)
+            self.chunk_key, self.chunk_file = key, path
+        except ExtractionCancelled:
+            pass
+        except Exception as e:
+            print(f"Ingest Error: {e}")
+            self.error = str(e)
+            failed = True
+        finally:
+            try:
+                os.remove(self._path)
+            except OSError:
+                pass
+            self._record("large", failed)
+            self.version += 1
+            self.done = True
+
+    def snapshot(self):
+        """
+        Large-document mode: (key, ChunkFile) over the chunks extracted so far, or None.
+        After an incomplete extraction this is the final, uncached result.
+        """
+        with self._lock:
+            if self._final is not None or self._writer is None:
+                return self._final
+            if not len(self._writer):
+                return None
+            return f"{self._key}:{len(self._writer)}", self._writer.snapshot()
+
+    @property
+    def chunk_bytes(self):
+        """Bytes of chunk text written so far (large-document mode)."""
+        with self._lock:
+            return self._writer.nbytes if self._writer is not None else 0
+
+    def cancel(self):
+        """Stops extraction at the next page; the worker pool drops queued page ranges."""
+        self._cancel.set()
+
+    @property
+    def sections(self):
+        return self._page_count if self.large else len(self._sections)
+
+    @property
+    def chars(self):
+        """len(self.text) without joining it (streaming mode)."""
+        with self._lock:
+            return self._chars
+
+    @property
+    def text(self):
+        if self.large:
+            return f"⚠️ Error processing file: {self.error}" if self.error else ""
+        with self._lock:
+            text = "\n".join(self._sections)
+        if not text and self.error:
+            return f"⚠️ Error processing file: {self.error}"
+        return text
+
+    def wait(self, timeout=None):
+        self._thread.join(timeout)
+        return self.done
@@ -0,0 +1,336 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from modules.retriever import tokenize
+from modules.text_cache import CACHE_DIR, sqlite_connection
+
+# Response cache for LLM calls
+LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "memory")  # memory | sqlite | off
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000"))
+# Jaccard similarity of question tokens needed for a near-duplicate hit (0 disables)
+LLM_CACHE_NEAR_THRESHOLD = float(os.getenv("LLM_CACHE_NEAR_THRESHOLD", "0.85"))
+# ...and estimated Jaccard similarity of the retrieved context tokens
+LLM_CACHE_CONTEXT_THRESHOLD = float(os.getenv("LLM_CACHE_CONTEXT_THRESHOLD", "0.5"))
+
+_WS_RE = re.compile(r"\s+")
+_WORD_RE = re.compile(r"[a-z0-9]+")
+# Questions only match if they ask the same kind of thing: same wh-word (or the same
+# leading auxiliary for yes/no questions) and the same negation
+_WH_WORDS = {"what", "why", "how", "where", "when", "who", "whom", "whose", "which"}
+_AUXILIARIES = {
+    "do", "does", "did", "is", "are", "was", "were", "can", "could", "should", "would", "will",
+    "has", "have", "had", "may", "might", "must",
+}
+_NEGATIONS = {"not", "no", "never", "nor", "none", "cannot", "without"}
+# Unlike retriever.tokenize's BM25 stopwords, these keep question words and negations
+_QUESTION_FILLER = {"a", "an", "the", "of", "to", "in", "on", "at", "by", "for", "with", "from", "and", "or",
+                    "as", "it", "its", "this", "that", "these", "those", "s", "i", "you", "me", "please"} | _AUXILIARIES
+_QUESTION_SLOT = "\0question\0"
+_CONTEXT_SLOT = "\0context\0"
+# Hashes kept per context signature (bottom-k MinHash)
+_SIGNATURE_SIZE = 64
+
+
+def _normalize(text: str) -> str:
+    return _WS_RE.sub(" ", text).strip()
+
+
+def _digest(obj) -> str:
+    return hashlib.sha256(json.dumps(obj, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def temperature_bucket(temperature: float) -> float:
+    return round(float(temperature), 1)
+
+
+def make_key(model, messages, temperature, max_tokens):
+    """Exact key: normalized model + messages + temperature bucket."""
+    msgs = [(m["role"], _normalize(m["content"])) for m in messages]
+    return _digest([model, msgs, temperature_bucket(temperature), max_tokens])
+
+
+def make_near_key(model, messages, temperature, max_tokens, question, context=None):
+    """
+    Key of the prompt with the question and retrieved context blanked out, or None.
+    The context is compared separately (see context_signature), since retrieval
+    for a reworded question rarely returns exactly the same text.
+    """
+    question = _normalize(question or "")
+    if not question:
+        return None
+    context = _normalize(context or "")
+
+    def blank(text):
+        text = _normalize(text)
+        if context:
+            text = text.replace(context, _CONTEXT_SLOT)
+        return text.replace(question, _QUESTION_SLOT)
+
+    msgs = [(m["role"], blank(m["content"])) for m in messages]
+    return _digest([model, msgs, temperature_bucket(temperature), max_tokens])
+
+
+def context_signature(context):
+    """Bottom-k MinHash of the context's tokens: a small, fixed-size stand-in for the text."""
+    hashes = {
+        int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+        for token in set(tokenize(context or ""))
+    }
+    return sorted(hashes)[:_SIGNATURE_SIZE]
+
+
+def signature_similarity(a, b):
+    """Estimated Jaccard similarity of the token sets behind two signatures."""
+    if not a or not b:
+        return 1.0 if not a and not b else 0.0
+    a, b = set(a), set(b)
+    union = sorted(a | b)[:_SIGNATURE_SIZE]
+    return sum(1 for h in union if h in a and h in b) / len(union)
+
+
+def question_words(question):
+    """Lowercase words of a question, with "n't" spelled out as "not"."""
+    return _WORD_RE.findall(re.sub(r"n['’]t\b", " not", (question or "").lower()))
+
+
+def question_tokens(question):
+    """Content words of a question for near-duplicate matching (keeps wh-words and negations)."""
+    return {w for w in question_words(question) if w not in _QUESTION_FILLER}
+
+
+def question_type(question):
+    """(wh-word or leading auxiliary or "", negated): questions of different types never match."""
+    words = question_words(question)
+    kind = next((w for w in words if w in _WH_WORDS), "")
+    if not kind and words and words[0] in _AUXILIARIES:
+        kind = words[0]
+    return kind, any(w in _NEGATIONS for w in words)
+
+
+def _jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class MemoryBackend:
+    """
+    LRU dict of key -> (value, created, near_key, question, context signature),
+    plus a near_key -> keys index so near-duplicate lookups only see their bucket.
+    """
+
+    def __init__(self, max_entries=LLM_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _unlink(self, key, entry):
+        bucket = self._buckets.get(entry[2])
+        if bucket is not None:
+            bucket.discard(key)
+            if not bucket:
+                del self._buckets[entry[2]]
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            self._data.move_to_end(key)
+            return entry[0], entry[1]
+
+    def set(self, key, value, near_key=None, question=None, context_sig=None):
+        with self._lock:
+            old = self._data.get(key)
+            if old is not None:
+                self._unlink(key, old)
+            self._data[key] = (value, time.time(), near_key, question, context_sig)
+            self._data.move_to_end(key)
+            if near_key:
+                self._buckets.setdefault(near_key, set()).add(key)
+            while len(self._data) > self.max_entries:
+                self._unlink(*self._data.popitem(last=False))
+
+    def delete(self, key):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is not None:
+                self._unlink(key, entry)
+
+    def candidates(self, near_key):
+        """[(question, key, context signature)] of the entries sharing near_key."""
+        with self._lock:
+            return [(self._data[k][3], k, self._data[k][4]) for k in self._buckets.get(near_key, ())]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._buckets.clear()
+
+
+class SQLiteBackend:
+    """On-disk backend shared by every process on the host."""
+
+    def __init__(self, path=None, max_entries=LLM_CACHE_MAX_ENTRIES):
+        self.path = Path(path) if path else CACHE_DIR / "llm_cache.sqlite3"
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " created REAL NOT NULL,"
+                " last_access REAL NOT NULL,"
+                " near_key TEXT,"
+                " question TEXT,"
+                " context_sig TEXT)"
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(responses)")}
+            if "context_sig" not in columns:
+                conn.execute("ALTER TABLE responses ADD COLUMN context_sig TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_access ON responses(last_access)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_near ON responses(near_key)")
+
+    def _connect(self):
+        return sqlite_connection(self.path)
+
+    def get(self, key):
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+        return row[0], row[1]
+
+    def set(self, key, value, near_key=None, question=None, context_sig=None):
+        now = time.time()
+        sig = json.dumps(context_sig) if context_sig is not None else None
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created, last_access, near_key, question, context_sig)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, value, now, now, near_key, question, sig),
+            )
+            count = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            if count > self.max_entries:
+                conn.execute(
+                    "DELETE FROM responses WHERE key IN"
+                    " (SELECT key FROM responses ORDER BY last_access ASC LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+
+    def delete(self, key):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def candidates(self, near_key):
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                "SELECT question, key, context_sig FROM responses WHERE near_key = ?", (near_key,)
+            ).fetchall()
+        return [(q, k, json.loads(sig) if sig else None) for q, k, sig in rows]
+
+    def clear(self):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM responses")
+
+
+class ResponseCache:
+    """
+    Exact-match cache with optional near-duplicate lookup: a similar question
+    of the same type (see question_type) over similar retrieved context (both
+    by token Jaccard similarity).
+    Entries expire after ttl seconds; eviction is LRU inside the backend.
+    """
+
+    def __init__(self, backend, ttl=LLM_CACHE_TTL, near_threshold=LLM_CACHE_NEAR_THRESHOLD,
+                 context_threshold=LLM_CACHE_CONTEXT_THRESHOLD):
+        self.backend = backend
+        self.ttl = ttl
+        self.near_threshold = near_threshold
+        self.context_threshold = context_threshold
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _fresh(self, key):
+        entry = self.backend.get(key)
+        if entry is None:
+            return None
+        value, created = entry
+        if self.ttl and time.time() - created > self.ttl:
+            self.backend.delete(key)
+            return None
+        return value
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get(self, key, near_key=None, question=None, context_sig=None):
+        value = self._fresh(key)
+        if value is not None:
+            self._count("hits")
+            return value
+
+        if near_key and self.near_threshold > 0:
+            wanted, kind = question_tokens(question), question_type(question)
+            best, best_score = None, self.near_threshold
+            for other_question, other_key, other_sig in self.backend.candidates(near_key):
+                if question_type(other_question) != kind:
+                    continue
+                if signature_similarity(context_sig, other_sig) < self.context_threshold:
+                    continue
+                score = _jaccard(wanted, question_tokens(other_question))
+                if score >= best_score:
+                    best, best_score = other_key, score
+            if best is not None:
+                value = self._fresh(best)
+                if value is not None:
+                    self._count("near_hits")
+                    return value
+
+        self._count("misses")
+        return None
+
+    def set(self, key, value, near_key=None, question=None, context_sig=None):
+        self.backend.set(key, value, near_key, _normalize(question) if question else None, context_sig)
+
+    def stats(self):
+        total = self.hits + self.near_hits + self.misses
+        return {
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.near_hits) / total if total else 0.0,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Process-wide response cache, or None when LLM_CACHE_BACKEND=off."""
+    global _cache
+    if LLM_CACHE_BACKEND == "off":
+        return None
+    with _cache_lock:
+        if _cache is None:
+            try:
+                backend = SQLiteBackend() if LLM_CACHE_BACKEND == "sqlite" else MemoryBackend()
+            except Exception as e:
+                print(f"SQLite LLM cache unavailable, using memory: {e}")
+                backend = MemoryBackend()
+            _cache = ResponseCache(backend)
+    return _cache
@@ -1,8 +1,18 @@
 # modules/llm_handler.py
 import os
+import time
+import asyncio
+import threading
+import httpx
 import streamlit as st
-from groq import Groq
+from groq import Groq, AsyncGroq
 from dotenv import load_dotenv
+from modules.llm_cache import get_response_cache, make_key, make_near_key, context_signature
+from modules.metrics import timer, observe, cache_result
+from modules.llm_scheduler import (
+    RequestScheduler, LLMError, LLMConfigError, LLMRateLimitError, LLMTimeoutError, LLMAPIError,
+    estimate_request_tokens,
+)
 
 # Load .env file (for local development)
 load_dotenv()
@@ -24,32 +34,212 @@ if not GROQ_API_KEY:
 # Initialize Client
 client = None
 if GROQ_API_KEY:
-    client = Groq(api_key=GROQ_API_KEY)
+    # Retries are handled by the scheduler, not the SDK
+    client = Groq(api_key=GROQ_API_KEY, max_retries=0)
+
+# Shared by the sync and async paths so both respect the same quota
+scheduler = RequestScheduler()
+
+MISSING_KEY_MESSAGE = "Groq API Key not found. Please configure secrets/env variables."
 
 DEFAULT_MODEL = "llama-3.3-70b-versatile"
 
-def _chat(messages, temperature=0.3, max_tokens=1024, timeout=30.0):
+# Async client: one event loop thread, one pooled keep-alive connection set
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+
+_loop = None
+_loop_lock = threading.Lock()
+async_client = None
+_semaphore = None
+
+def _get_loop():
+    """Starts the background event loop (and async client) on first use."""
+    global _loop, async_client, _semaphore
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="llm-loop", daemon=True).start()
+            if GROQ_API_KEY:
+                http_client = httpx.AsyncClient(
+                    limits=httpx.Limits(
+                        max_connections=LLM_MAX_CONCURRENCY,
+                        max_keepalive_connections=LLM_MAX_CONCURRENCY,
+                        keepalive_expiry=60,
+                    ),
+                    timeout=60.0,
+                )
+                async_client = AsyncGroq(api_key=GROQ_API_KEY, http_client=http_client, max_retries=0)
+            _semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+            _loop = loop
+    return _loop
+
+def _cache_lookup(messages, temperature, max_tokens, question, cache, context=None):
+    """Returns (cache entry, cached reply or None). The entry is None when caching is off."""
+    response_cache = get_response_cache() if cache else None
+    if not response_cache:
+        return None, None
+    key = make_key(DEFAULT_MODEL, messages, temperature, max_tokens)
+    near_key = make_near_key(DEFAULT_MODEL, messages, temperature, max_tokens, question, context)
+    context_sig = context_signature(context) if near_key else None
+    entry = (response_cache, key, near_key, question, context_sig)
+    cached = response_cache.get(key, near_key, question, context_sig)
+    cache_result("llm", cached is not None)
+    return entry, cached
+
+def _cache_store(entry, reply):
+    if entry and reply:
+        response_cache, key, near_key, question, context_sig = entry
+        response_cache.set(key, reply, near_key, question, context_sig)
+
+def _observe_usage(usage):
+    if usage:
+        observe("llm_prompt_tokens", usage.prompt_tokens or 0)
+        observe("llm_completion_tokens", usage.completion_tokens or 0)
+
+def affordable_calls(messages, max_tokens, within):
+    """How many calls like this one the shared rate limits allow to start within `within` seconds."""
+    return scheduler.affordable(estimate_request_tokens(messages, max_tokens), within)
+
+def cache_stats():
+    """Hit/miss counters of the LLM response cache."""
+    response_cache = get_response_cache()
+    return response_cache.stats() if response_cache else {}
+
+def _replay(text):
+    yield text
+
+def _chat(messages, temperature=0.3, max_tokens=1024, timeout=30.0, stream=False, question=None, cache=True,
+          context=None):
+    """
+    Blocking chat completion.
+    With stream=True returns a generator of text deltas instead of the full reply.
+    Replies are served from the response cache when possible; pass the user's
+    question (and the retrieved context embedded in the prompt) to also match
+    near-duplicate wordings of it over similar context.
+    `timeout` is the deadline for the whole call including retries.
+    Raises LLMError subclasses on failure.
+    """
+    entry, cached = _cache_lookup(messages, temperature, max_tokens, question, cache, context)
+    if cached is not None:
+        return _replay(cached) if stream else cached
+    if stream:
+        return _chat_stream(messages, temperature, max_tokens, timeout, entry)
     if not client:
-        return "⚠️ System Error: Groq API Key not found. Please configure secrets/env variables."
-        
-    try:
-        response = client.chat.completions.create(
+        raise LLMConfigError(MISSING_KEY_MESSAGE)
+
+    def send(attempt_timeout):
+        raw = client.chat.completions.with_raw_response.create(
             model=DEFAULT_MODEL,
             messages=messages,
             temperature=temperature,
             max_tokens=max_tokens,
-            timeout=timeout
+            timeout=attempt_timeout
         )
-        return response.choices[0].message.content.strip()
+        return raw.parse(), raw.headers
+
+    with timer("llm_seconds", mode="blocking"):
+        response = scheduler.call(send, messages, max_tokens, timeout)
+    _observe_usage(response.usage)
+    reply = response.choices[0].message.content.strip()
+    _cache_store(entry, reply)
+    return reply
+
+def _chat_stream(messages, temperature=0.3, max_tokens=1024, timeout=30.0, entry=None):
+    if not client:
+        raise LLMConfigError(MISSING_KEY_MESSAGE)
+
+    def send(attempt_timeout):
+        raw = client.chat.completions.with_raw_response.create(
+            model=DEFAULT_MODEL,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            timeout=attempt_timeout,
+            stream=True
+        )
+        return raw.parse(), raw.headers
+
+    # Retries only cover opening the stream; once text is shown we can't replay it
+    start = time.perf_counter()
+    response = scheduler.call(send, messages, max_tokens, timeout)
+    started = False
+    parts = []
+    try:
+        for chunk in response:
+            usage = getattr(getattr(chunk, "x_groq", None), "usage", None)
+            if usage:
+                _observe_usage(usage)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            # Match the non-streaming path, which strips leading whitespace
+            if not started:
+                delta = delta.lstrip()
+                if not delta:
+                    continue
+                started = True
+                observe("llm_first_token_seconds", time.perf_counter() - start)
+            parts.append(delta)
+            yield delta
+    except LLMError:
+        raise
     except Exception as e:
-        return f"⚠️ LLM error: {str(e)}"
+        raise scheduler.classify(e)[0] from e
+    observe("llm_seconds", time.perf_counter() - start, mode="stream")
+    _cache_store(entry, "".join(parts).strip())
+
+async def _achat(messages, temperature=0.3, max_tokens=1024, timeout=30.0, question=None, cache=True,
+                 context=None, background=False):
+    # The cache may hit SQLite; keep that blocking I/O off the event loop
+    entry, cached = await asyncio.to_thread(
+        _cache_lookup, messages, temperature, max_tokens, question, cache, context
+    )
+    if cached is not None:
+        return cached
+    if not async_client:
+        raise LLMConfigError(MISSING_KEY_MESSAGE)
+
+    async def send(attempt_timeout):
+        # Only hold a concurrency slot while actually talking to the API
+        async with _semaphore:
+            raw = await async_client.chat.completions.with_raw_response.create(
+                model=DEFAULT_MODEL,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                timeout=attempt_timeout
+            )
+            return await raw.parse(), raw.headers
+
+    with timer("llm_seconds", mode="async"):
+        response = await scheduler.acall(send, messages, max_tokens, timeout, background=background)
+    _observe_usage(response.usage)
+    reply = response.choices[0].message.content.strip()
+    if entry:
+        await asyncio.to_thread(_cache_store, entry, reply)
+    return reply
+
+def chat_async(messages, temperature=0.3, max_tokens=1024, timeout=30.0, question=None, cache=True, context=None,
+               background=False):
+    """
+    Schedules a chat call on the async client and returns a concurrent.futures.Future.
+    At most LLM_MAX_CONCURRENCY calls are in flight at once.
+    background=True marks low-priority work that waits for spare rate-limit capacity.
+    The future raises LLMError subclasses on failure.
+    """
+    loop = _get_loop()
+    return asyncio.run_coroutine_threadsafe(
+        _achat(messages, temperature, max_tokens, timeout, question, cache, context, background), loop
+    )
 
 # ==========================================
 # 🧠 EXPORTED FUNCTIONS (Used by app.py)
 # ==========================================
 
-def explain_with_emotion(context_text: str, question: str, emotion: str) -> str:
-    """Normal Chat Explanation"""
+def explain_with_emotion(context_text: str, question: str, emotion: str, stream=False):
+    """Normal Chat Explanation (stream=True yields text deltas)"""
     emotion_prompts = {
         "confused": "Use a very simple analogy from daily life. Keep it under 3 sentences.",
         "sleepy": "Be extremely punchy and exciting. Use short bullet points.",
@@ -61,9 +251,9 @@ def explain_with_emotion(context_text: str, question: str, emotion: str) -> str:
         {"role": "system", "content": f"You are AuraLearn, a helpful AI tutor. {style} Use the provided notes context to answer."},
         {"role": "user", "content": f"Context: {context_text}\n\nQuestion: {question}"},
     ]
-    return _chat(messages, temperature=0.5)
+    return _chat(messages, temperature=0.5, stream=stream, question=question, context=context_text)
 
-def simplify_concept(context_text: str):
+def simplify_concept(context_text: str, stream=False):
     """
     Confused Mode: Summarize notes simply.
     ENHANCEMENT: Added persona, strict formatting constraints, and a "core truth" focus.
@@ -89,13 +279,23 @@ def simplify_concept(context_text: str):
     """
     messages = [{"role": "user", "content": prompt}]
     # Lower temp for focus, but high enough for good analogies
-    return _chat(messages, temperature=0.5)
+    return _chat(messages, temperature=0.5, stream=stream)
 
-def simplify_previous_answer(previous_answer: str, question: str):
+def simplify_previous_answer(previous_answer: str, question: str, stream=False):
     """
     Confused Mode: Simplify last answer.
     ENHANCEMENT: Forces the LLM to analyze *why* the previous answer failed (too complex) and fix it.
     """
+    return _chat(_simplify_previous_messages(previous_answer, question), temperature=0.6, stream=stream)
+
+def prefetch_simplified_answer(previous_answer: str, question: str):
+    """
+    Starts simplify_previous_answer in the background; returns a Future.
+    It is a guess, so it only uses spare rate-limit capacity (background priority).
+    """
+    return chat_async(_simplify_previous_messages(previous_answer, question), temperature=0.6, background=True)
+
+def _simplify_previous_messages(previous_answer: str, question: str):
     prompt = f"""
     You are AuraLearn. The student is CONFUSED by your previous explanation because it was likely too technical or dry.
     
@@ -112,10 +312,9 @@ def simplify_previous_answer(previous_answer: str, question: str):
     - Keep it conversational and warm.
     - No bullet points.
     """
-    messages = [{"role": "user", "content": prompt}]
-    return _chat(messages, temperature=0.6)
+    return [{"role": "user", "content": prompt}]
 
-def generate_quick_activity(context_text: str):
+def generate_quick_activity(context_text: str, stream=False):
     """
     Sleepy Mode: Wake up call.
     ENHANCEMENT: Forces variety (somatic, visual, breathing) and high energy to combat boredom.
@@ -141,4 +340,5 @@ def generate_quick_activity(context_text: str):
     Context (Just for topic reference): "{context_text[:100]}..."
     """
     messages = [{"role": "user", "content": prompt}]
-    return _chat(messages, temperature=0.9)
\ No newline at end of file
+    # Not cached: the point is a different activity every time
+    return _chat(messages, temperature=0.9, stream=stream, cache=False)
\ No newline at end of file
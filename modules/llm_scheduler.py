@@ -0,0 +1,303 @@
+import os
+import re
+import time
+import random
+import asyncio
+import threading
+import groq
+
+# Client-side limits (Groq per-key quotas); headers from the API tighten these at runtime
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "30"))
+LLM_TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", "12000"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+# Share of each bucket that background work (quiz bank refills) leaves free for interactive calls
+LLM_BACKGROUND_RESERVE = float(os.getenv("LLM_BACKGROUND_RESERVE", "0.5"))
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 20.0
+
+
+# ==========================================
+# Typed errors (instead of "⚠️ ..." strings)
+# ==========================================
+
+class LLMError(Exception):
+    """Base class for LLM failures."""
+
+
+class LLMConfigError(LLMError):
+    """No API key / client configured."""
+
+
+class LLMRateLimitError(LLMError):
+    """Still rate limited after all retries."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LLMTimeoutError(LLMError):
+    """The per-call deadline expired."""
+
+
+class LLMAPIError(LLMError):
+    """Any other API failure (bad request, auth, server error)."""
+
+
+# ==========================================
+# Rate limiting
+# ==========================================
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled at `rate` units per second.
+    reserve() never blocks: it debits the bucket (possibly below zero) and
+    returns how long the caller must wait, so sync and async callers can share it.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._level = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, cost=1.0):
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            cost = min(cost, self.capacity)
+            self._level -= cost
+            wait = max(0.0, -self._level / self.rate) if self.rate > 0 else 0.0
+            return max(wait, self._paused_until - now)
+
+    def refund(self, cost=1.0):
+        """Returns unused capacity (a negative cost debits extra usage)."""
+        with self._lock:
+            self._level = min(self.capacity, self._level + min(cost, self.capacity))
+
+    def pause(self, seconds):
+        """Blocks new reservations for `seconds` (e.g. after a 429)."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def available(self, within=0.0):
+        """Capacity that could be reserved without waiting longer than `within` seconds."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            usable = max(0.0, within - max(0.0, self._paused_until - now))
+            return self._level + usable * self.rate
+
+    def sync_remaining(self, remaining):
+        """Never believe we have more capacity than the server says we do."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._level = min(self._level, float(remaining))
+
+
+_DURATION_RE = re.compile(r"(?:(\d+(?:\.\d+)?)h)?(?:(\d+(?:\.\d+)?)m(?!s))?(?:(\d+(?:\.\d+)?)s)?(?:(\d+(?:\.\d+)?)ms)?")
+
+
+def parse_duration(value):
+    """Parses Groq reset headers like '2m59.56s', '7.66s', '120ms' or plain seconds."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    match = _DURATION_RE.fullmatch(value)
+    if not match or not any(match.groups()):
+        return None
+    h, m, s, ms = (float(g) if g else 0.0 for g in match.groups())
+    return h * 3600 + m * 60 + s + ms / 1000
+
+
+def estimate_request_tokens(messages, max_tokens):
+    """Prompt tokens plus a typical completion; settled against real usage afterwards."""
+    chars = sum(len(m.get("content") or "") for m in messages)
+    return chars // 4 + max_tokens // 4
+
+
+class RequestScheduler:
+    """
+    Admission control and retries for LLM calls.
+    Requests and tokens each have a bucket; rate-limit headers from responses
+    pause or shrink them, and failures are retried with jittered exponential backoff
+    until the per-call deadline runs out.
+    Background calls are only admitted while both buckets stay above the
+    LLM_BACKGROUND_RESERVE share, so they never starve interactive ones.
+    """
+
+    def __init__(self, requests_per_minute=LLM_REQUESTS_PER_MINUTE,
+                 tokens_per_minute=LLM_TOKENS_PER_MINUTE, max_retries=LLM_MAX_RETRIES):
+        self.requests = TokenBucket(requests_per_minute / 60.0, max(1.0, requests_per_minute / 6))
+        self.tokens = TokenBucket(tokens_per_minute / 60.0, max(1.0, tokens_per_minute / 6))
+        self.max_retries = max_retries
+
+    # --- headers ---
+
+    def observe_headers(self, headers):
+        if not headers:
+            return
+        remaining = headers.get("x-ratelimit-remaining-requests")
+        if remaining is not None:
+            try:
+                self.requests.sync_remaining(float(remaining))
+            except ValueError:
+                pass
+            if remaining == "0":
+                reset = parse_duration(headers.get("x-ratelimit-reset-requests"))
+                if reset:
+                    self.requests.pause(reset)
+        remaining = headers.get("x-ratelimit-remaining-tokens")
+        if remaining is not None:
+            try:
+                self.tokens.sync_remaining(float(remaining))
+            except ValueError:
+                pass
+        retry_after = parse_duration(headers.get("retry-after"))
+        if retry_after:
+            self.requests.pause(retry_after)
+
+    # --- admission ---
+
+    def _admit(self, cost, deadline):
+        """Reserves capacity; returns the wait, or raises if it would blow the deadline."""
+        wait = max(self.requests.reserve(1), self.tokens.reserve(cost))
+        if time.monotonic() + wait > deadline:
+            self.requests.refund(1)
+            self.tokens.refund(cost)
+            raise LLMRateLimitError("Rate limit: no capacity before the request deadline.", retry_after=wait)
+        return wait
+
+    def _headroom_wait(self, cost):
+        """Seconds until a background call fits without dipping into the interactive reserve."""
+        wait = 0.0
+        for bucket, need in ((self.requests, 1.0), (self.tokens, cost)):
+            target = min(bucket.capacity, need + bucket.capacity * LLM_BACKGROUND_RESERVE)
+            short = target - bucket.available()
+            if short > 0 and bucket.rate > 0:
+                wait = max(wait, short / bucket.rate)
+        return wait
+
+    def _background_wait(self, cost, deadline):
+        """Next sleep for a background call (0 once it may be admitted); raises past the deadline."""
+        wait = self._headroom_wait(cost)
+        if wait and time.monotonic() + wait > deadline:
+            raise LLMRateLimitError("Rate limit: no spare capacity for background work.", retry_after=wait)
+        # Re-check at least every second: interactive calls may have used the headroom meanwhile
+        return min(wait, 1.0)
+
+    def _settle(self, cost, result):
+        """Corrects the token bucket once the real usage is known."""
+        usage = getattr(result, "usage", None)
+        total = getattr(usage, "total_tokens", None)
+        if isinstance(total, (int, float)):
+            self.tokens.refund(cost - total)
+
+    def affordable(self, cost, within):
+        """How many calls estimated at `cost` tokens could start within `within` seconds."""
+        cost = min(cost, self.tokens.capacity)
+        calls = min(self.requests.available(within), self.tokens.available(within) / max(cost, 1))
+        return max(0, int(calls))
+
+    # --- error classification ---
+
+    def classify(self, exc):
+        """Returns (typed error, retryable, retry_after)."""
+        if isinstance(exc, groq.RateLimitError):
+            headers = getattr(exc.response, "headers", None) or {}
+            self.observe_headers(headers)
+            retry_after = parse_duration(headers.get("retry-after"))
+            return LLMRateLimitError(f"Rate limited: {exc}", retry_after), True, retry_after
+        if isinstance(exc, groq.APITimeoutError):
+            return LLMTimeoutError(f"Request timed out: {exc}"), True, None
+        if isinstance(exc, groq.APIConnectionError):
+            return LLMAPIError(f"Connection error: {exc}"), True, None
+        if isinstance(exc, groq.APIStatusError):
+            retryable = exc.status_code >= 500 or exc.status_code == 408
+            return LLMAPIError(f"API error {exc.status_code}: {exc}"), retryable, None
+        if isinstance(exc, LLMError):
+            return exc, False, None
+        return LLMAPIError(str(exc)), False, None
+
+    def _backoff(self, attempt, retry_after):
+        delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+        return max(delay, retry_after or 0.0)
+
+    # --- sync / async drivers ---
+
+    def call(self, send, messages, max_tokens, timeout, background=False):
+        """
+        Runs send(attempt_timeout) -> (result, headers) under the scheduler.
+        `timeout` is the deadline for the whole call, retries included.
+        """
+        deadline = time.monotonic() + timeout
+        cost = estimate_request_tokens(messages, max_tokens)
+        attempt = 0
+        while True:
+            while background:
+                pause = self._background_wait(cost, deadline)
+                if not pause:
+                    break
+                time.sleep(pause)
+            wait = self._admit(cost, deadline)
+            if wait:
+                time.sleep(wait)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise LLMTimeoutError("Request deadline expired before sending.")
+            try:
+                result, headers = send(remaining)
+                self._settle(cost, result)
+                self.observe_headers(headers)
+                return result
+            except Exception as e:
+                error, retryable, retry_after = self.classify(e)
+                if error is not e:
+                    error.__cause__ = e
+            attempt += 1
+            delay = self._backoff(attempt, retry_after)
+            if not retryable or attempt > self.max_retries or time.monotonic() + delay >= deadline:
+                raise error
+            time.sleep(delay)
+
+    async def acall(self, send, messages, max_tokens, timeout, background=False):
+        """Async twin of call(); `send` is a coroutine function."""
+        deadline = time.monotonic() + timeout
+        cost = estimate_request_tokens(messages, max_tokens)
+        attempt = 0
+        while True:
+            while background:
+                pause = self._background_wait(cost, deadline)
+                if not pause:
+                    break
+                await asyncio.sleep(pause)
+            wait = self._admit(cost, deadline)
+            if wait:
+                await asyncio.sleep(wait)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise LLMTimeoutError("Request deadline expired before sending.")
+            try:
+                result, headers = await send(remaining)
+                self._settle(cost, result)
+                self.observe_headers(headers)
+                return result
+            except Exception as e:
+                error, retryable, retry_after = self.classify(e)
+                if error is not e:
+                    error.__cause__ = e
+            attempt += 1
+            delay = self._backoff(attempt, retry_after)
+            if not retryable or attempt > self.max_retries or time.monotonic() + delay >= deadline:
+                raise error
+            await asyncio.sleep(delay)
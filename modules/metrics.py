@@ -0,0 +1,276 @@
+import os
+import json
+import time
+import random
+import bisect
+import threading
+import functools
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Instrumentation is off unless AURALEARN_METRICS=1; when off, @timed returns the
+# function unchanged and timer()/observe()/count() are a single flag check
+METRICS_ENABLED = os.getenv("AURALEARN_METRICS", "0").lower() in ("1", "true", "yes")
+# Optional exports: Prometheus text on http://0.0.0.0:<port>/metrics and/or a JSON-lines file
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_FILE = os.getenv("METRICS_FILE", "")
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "60"))
+# Quantiles are computed over a uniform sample of this many observations per series
+METRICS_RESERVOIR = 2048
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Summary:
+    """Count, sum, min/max and a reservoir sample for quantiles."""
+
+    def __init__(self, size=METRICS_RESERVOIR):
+        self.size = size
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+        self._sample = []  # kept sorted
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        if len(self._sample) < self.size:
+            bisect.insort(self._sample, value)
+        else:
+            # Reservoir sampling keeps every observation equally likely to be in the sample
+            slot = random.randrange(self.count)
+            if slot < self.size:
+                del self._sample[random.randrange(self.size)]
+                bisect.insort(self._sample, value)
+
+    def quantile(self, q):
+        if not self._sample:
+            return None
+        pos = q * (len(self._sample) - 1)
+        lo = int(pos)
+        hi = min(lo + 1, len(self._sample) - 1)
+        return self._sample[lo] + (self._sample[hi] - self._sample[lo]) * (pos - lo)
+
+    def to_dict(self):
+        out = {"count": self.count, "sum": self.sum, "min": self.min, "max": self.max}
+        for q in QUANTILES:
+            out[f"p{int(q * 100)}"] = self.quantile(q)
+        return out
+
+
+def _series(name, labels):
+    return (name, tuple(sorted(labels.items()))) if labels else (name, ())
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.summaries = {}
+        self.counters = {}
+
+    def observe(self, name, value, **labels):
+        key = _series(name, labels)
+        with self._lock:
+            summary = self.summaries.get(key)
+            if summary is None:
+                summary = self.summaries[key] = Summary()
+            summary.observe(value)
+
+    def count(self, name, n=1, **labels):
+        key = _series(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    def snapshot(self):
+        """Plain dict of every series, e.g. for JSON export."""
+        with self._lock:
+            return {
+                "time": time.time(),
+                "summaries": [
+                    {"name": name, "labels": dict(labels), **s.to_dict()}
+                    for (name, labels), s in self.summaries.items()
+                ],
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": v}
+                    for (name, labels), v in self.counters.items()
+                ],
+            }
+
+    def hit_rates(self):
+        """{cache: hits / (hits + misses)} from *_cache_hits_total / *_cache_misses_total counters."""
+        totals = {}
+        with self._lock:
+            for (name, _), v in self.counters.items():
+                for kind in ("hits", "misses"):
+                    suffix = f"_cache_{kind}_total"
+                    if name.endswith(suffix):
+                        totals.setdefault(name[: -len(suffix)], {"hits": 0, "misses": 0})[kind] += v
+        return {cache: t["hits"] / (t["hits"] + t["misses"]) for cache, t in totals.items() if t["hits"] + t["misses"]}
+
+    def render_prometheus(self):
+        """Prometheus text exposition format (summaries with p50/p95/p99 quantiles)."""
+        def fmt(labels, extra=()):
+            pairs = [*labels, *extra]
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+        lines = []
+        with self._lock:
+            seen = set()
+            for (name, labels), s in sorted(self.summaries.items()):
+                if name not in seen:
+                    lines.append(f"# TYPE auralearn_{name} summary")
+                    seen.add(name)
+                for q in QUANTILES:
+                    value = s.quantile(q)
+                    if value is not None:
+                        lines.append(f"auralearn_{name}{fmt(labels, [('quantile', q)])} {value}")
+                lines.append(f"auralearn_{name}_sum{fmt(labels)} {s.sum}")
+                lines.append(f"auralearn_{name}_count{fmt(labels)} {s.count}")
+            for (name, labels), v in sorted(self.counters.items()):
+                if name not in seen:
+                    lines.append(f"# TYPE auralearn_{name} counter")
+                    seen.add(name)
+                lines.append(f"auralearn_{name}{fmt(labels)} {v}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+# ==========================
+# Recording API
+# ==========================
+
+def observe(name, value, **labels):
+    if METRICS_ENABLED:
+        registry.observe(name, value, **labels)
+
+
+def count(name, n=1, **labels):
+    if METRICS_ENABLED:
+        registry.count(name, n, **labels)
+
+
+def cache_result(cache, hit):
+    """Counts a hit or miss for the named cache (see Registry.hit_rates)."""
+    if METRICS_ENABLED:
+        registry.count(f"{cache}_cache_{'hits' if hit else 'misses'}_total")
+
+
+class _Timer:
+    __slots__ = ("name", "labels", "start")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        registry.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        if exc_type is not None:
+            registry.count(f"{self.name.removesuffix('_seconds')}_errors_total", **self.labels)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(name, **labels):
+    """Context manager recording the block's wall time in seconds (and errors)."""
+    return _Timer(name, labels) if METRICS_ENABLED else _NULL_TIMER
+
+
+def timed(name, **labels):
+    """Decorator version of timer(). A no-op (returns the function itself) when disabled."""
+    def decorate(func):
+        if not METRICS_ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _Timer(name, labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# ==========================
+# Exporters
+# ==========================
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") == "/metrics":
+            body = registry.render_prometheus().encode("utf-8")
+            content_type = "text/plain; version=0.0.4"
+        elif self.path.rstrip("/") == "/metrics.json":
+            body = json.dumps(registry.snapshot()).encode("utf-8")
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def write_jsonl(path=None):
+    """Appends one snapshot line to the JSON-lines file."""
+    path = path or METRICS_FILE
+    if not path:
+        return
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(registry.snapshot()) + "\n")
+
+
+def _flush_loop():
+    while True:
+        time.sleep(METRICS_FLUSH_SECONDS)
+        try:
+            write_jsonl()
+        except OSError as e:
+            print(f"Metrics export failed: {e}")
+
+
+_started = False
+_start_lock = threading.Lock()
+
+
+def start_exporters(port=None):
+    """Starts the configured exporters once per process (no-op when metrics are disabled)."""
+    global _started
+    port = METRICS_PORT if port is None else port
+    with _start_lock:
+        if _started or not METRICS_ENABLED:
+            return
+        _started = True
+        if port:
+            try:
+                server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+                threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+            except OSError as e:
+                print(f"Metrics endpoint disabled: {e}")
+        if METRICS_FILE:
+            threading.Thread(target=_flush_loop, name="metrics-jsonl", daemon=True).start()
@@ -4,42 +4,256 @@ import pandas as pd
 import docx
 from pptx import Presentation
 import io
+import os
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from modules.text_cache import content_key, get_text_cache
+from modules.metrics import observe, cache_result
+
+# Bump whenever extraction output changes so stale cache entries are ignored
+EXTRACTOR_VERSION = 2
+
+# Parallel PDF extraction (page ranges are fanned out to worker processes)
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))
+PDF_BATCH_SIZE = int(os.getenv("PDF_BATCH_SIZE", "16"))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "32"))
+# Workers are never forked straight from the app: its server, LLM and queue threads may hold locks
+PDF_START_METHOD = os.getenv("PDF_START_METHOD", "forkserver")
+
+# A page's PyPDF2 text needs at least this many characters before we trust it
+MIN_PAGE_CHARS = 20
+
+class ExtractionCancelled(Exception):
+    """Raised inside the page loop once the caller's cancel event is set."""
+
+class ExtractionIncomplete(Exception):
+    """Raised after the last readable page when extraction stopped early."""
 
 def extract_text_from_pdf(uploaded_file):
     """
     Extracts text based on file extension (PDF, DOCX, PPTX, CSV, XLSX, XML, TXT).
-    Uses file extensions instead of MIME types for better reliability.
+    Results are cached on disk by content hash, so repeat uploads skip parsing.
+    """
+    return "\n".join(iter_document_text(uploaded_file))
+
+def iter_document_text(uploaded_file, cancel=None):
+    """
+    Streaming version of extract_text_from_pdf.
+    Yields text sections (one per PDF page, or the whole file for other formats)
+    as soon as they are extracted. Errors are yielded as a single "⚠️ ..." section.
+    Setting `cancel` (a threading.Event) stops PDF parsing at the next page.
+    Only complete extractions are cached.
     """
-    text = ""
     # Convert filename to lowercase to handle .PDF or .pdf
     filename = uploaded_file.name.lower()
+    ext = filename.rsplit(".", 1)[-1]
+
+    uploaded_file.seek(0)
+    data = uploaded_file.read()
+    key = content_key(data, ext, EXTRACTOR_VERSION)
+    uploaded_file.seek(0)
+    observe("extract_input_bytes", len(data), format=ext)
+
+    cache = get_text_cache()
+    if cache:
+        try:
+            cached = cache.get(key)
+            cache_result("text", cached is not None)
+            if cached is not None:
+                yield cached
+                return
+        except Exception as e:
+            print(f"Text cache read failed: {e}")
+
+    complete = True
+    if filename.endswith(".pdf"):
+        parts = []
+        try:
+            for content in iter_pdf_pages(data, cancel=cancel):
+                if content:
+                    parts.append(content)
+                    yield content
+        except ExtractionCancelled:
+            return
+        except Exception as e:
+            if not parts:
+                yield f"⚠️ Error reading PDF: {e}"
+                return
+            # Keep what we already have rather than discarding it, but don't cache it
+            print(f"PDF extraction stopped early: {e}")
+            complete = False
+        if not parts:
+            yield "⚠️ PDF scanned or empty."
+            return
+        text = "\n".join(parts)
+    else:
+        text = _extract_text(uploaded_file, filename)
+        yield text
+
+    observe("extract_output_chars", len(text), format=ext)
+    # Never cache error messages or partial text, they may be transient
+    if cache and complete and not text.startswith("⚠️"):
+        try:
+            cache.put(key, text)
+        except Exception as e:
+            print(f"Text cache write failed: {e}")
+
+def iter_document_file(path, filename, cancel=None):
+    """
+    iter_document_text for an upload spooled to disk (large-document mode).
+    PDF workers open the file themselves instead of receiving its bytes, and
+    nothing is cached here; the caller stores the result as a chunk file.
+    ExtractionCancelled propagates so the caller can discard partial output, and
+    ExtractionIncomplete is raised once the pages read before a failure are yielded,
+    so a partial result is never stored as if it were complete.
+    """
+    filename = filename.lower()
+    if filename.endswith(".pdf"):
+        found = False
+        try:
+            for content in iter_pdf_pages(str(path), cancel=cancel):
+                if content:
+                    found = True
+                    yield content
+        except ExtractionCancelled:
+            raise
+        except Exception as e:
+            if not found:
+                yield f"⚠️ Error reading PDF: {e}"
+                return
+            raise ExtractionIncomplete(str(e)) from e
+        if not found:
+            yield "⚠️ PDF scanned or empty."
+        return
+    with open(path, "rb") as f:
+        yield _extract_text(f, filename)
+
+def _pdf_source(source):
+    """PDF bytes are wrapped for the readers; a path is passed through so they read from disk."""
+    return io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source
+
+def _page_text_ok(text):
+    """
+    Cheap quality check for a page's text layer.
+    Rejects near-empty pages and garbled output (unmapped glyphs, symbol soup).
+    """
+    if not text:
+        return False
+    stripped = text.strip()
+    if len(stripped) < MIN_PAGE_CHARS:
+        return False
+    if stripped.count("(cid:") * 5 + stripped.count("\ufffd") > len(stripped) * 0.05:
+        return False
+    visible = [c for c in stripped if not c.isspace()]
+    alnum = sum(c.isalnum() for c in visible)
+    return alnum >= len(visible) * 0.5
 
+def _iter_page_range(data, start: int, stop: int):
+    """
+    Extracts pages [start, stop), yielding each page's text.
+    Tries PyPDF2's text layer first and only falls back to pdfplumber's
+    layout analysis for pages where that looks unusable.
+    A failing page yields "" so one bad page doesn't lose the document.
+    """
+    reader = PyPDF2.PdfReader(_pdf_source(data))
+    plumber = None
     try:
-        # 1. Handle PDF
-        if filename.endswith(".pdf"):
-            # Try with pdfplumber first
+        for i in range(start, stop):
+            content = ""
             try:
-                with pdfplumber.open(uploaded_file) as pdf:
-                    for page in pdf.pages:
-                        content = page.extract_text()
-                        if content:
-                            text += content + "\n"
+                content = reader.pages[i].extract_text() or ""
             except Exception as e:
-                print(f"pdfplumber failed: {e}")
+                print(f"PyPDF2 failed on page {i + 1}: {e}")
+
+            if not _page_text_ok(content):
+                try:
+                    if plumber is None:
+                        plumber = pdfplumber.open(_pdf_source(data))
+                    page = plumber.pages[i]
+                    fallback = page.extract_text() or ""
+                    page.flush_cache()
+                    # Keep whichever extractor produced more usable text
+                    if _page_text_ok(fallback) or len(fallback.strip()) > len(content.strip()):
+                        content = fallback
+                except Exception as e:
+                    print(f"pdfplumber failed on page {i + 1}: {e}")
+            yield content.strip()
+    finally:
+        if plumber is not None:
+            plumber.close()
+
+def _extract_page_range(path, start: int, stop: int):
+    """Worker: extracts pages [start, stop) of the PDF at `path` in a pool process."""
+    return list(_iter_page_range(path, start, stop))
+
+def iter_pdf_pages(data, workers=None, batch_size=None, cancel=None):
+    """
+    Yields the text of every page, in order. `data` is the PDF bytes or a file path.
+    Large PDFs are split into page ranges and extracted in a process pool;
+    each range is yielded as soon as it (and every range before it) is done.
+    Workers read the PDF from disk (bytes are spooled to a temp file once), so
+    the document is never pickled per range.
+    Raises ExtractionCancelled once `cancel` is set (queued ranges are dropped),
+    and RuntimeError at the end if any range failed (its pages were yielded as "").
+    """
+    workers = workers or PDF_WORKERS
+    batch_size = batch_size or PDF_BATCH_SIZE
+    num_pages = len(PyPDF2.PdfReader(_pdf_source(data)).pages)
 
-            # Fallback to PyPDF2 if text seems too short or empty
-            if len(text.strip()) < 200:
+    def cancelled():
+        return cancel is not None and cancel.is_set()
+
+    if workers <= 1 or num_pages < PDF_PARALLEL_MIN_PAGES:
+        for content in _iter_page_range(data, 0, num_pages):
+            if cancelled():
+                raise ExtractionCancelled()
+            yield content
+        return
+
+    ranges = [(start, min(start + batch_size, num_pages)) for start in range(0, num_pages, batch_size)]
+    failed = 0
+    spool = None
+    if isinstance(data, (bytes, bytearray)):
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as f:
+            f.write(data)
+            spool = f.name
+    path = spool or str(data)
+    context = multiprocessing.get_context(PDF_START_METHOD)
+    try:
+        with ProcessPoolExecutor(max_workers=min(workers, len(ranges)), mp_context=context) as pool:
+            futures = [pool.submit(_extract_page_range, path, start, stop) for start, stop in ranges]
+            # Collect in submission order so pages are reassembled correctly
+            for (start, stop), future in zip(ranges, futures):
+                while cancel is not None and not future.done() and not cancel.wait(0.1):
+                    pass
+                if cancelled():
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    raise ExtractionCancelled()
                 try:
-                    uploaded_file.seek(0)  # Reset file pointer
-                    reader = PyPDF2.PdfReader(uploaded_file)
-                    for page in reader.pages:
-                        content = page.extract_text()
-                        if content:
-                            text += content + "\n"
+                    yield from future.result()
                 except Exception as e:
-                    return f"⚠️ Error reading PDF with fallback: {e}"
-            
-            return text.strip() if text.strip() else "⚠️ PDF scanned or empty."
+                    print(f"PDF worker failed on pages {start + 1}-{stop}: {e}")
+                    failed += 1
+                    yield from [""] * (stop - start)
+    finally:
+        if spool is not None:
+            try:
+                os.remove(spool)
+            except OSError:
+                pass
+    if failed:
+        raise RuntimeError(f"{failed} page range(s) could not be extracted")
+
+def _extract_text(uploaded_file, filename):
+    """
+    Uncached extraction.
+    Uses file extensions instead of MIME types for better reliability.
+    """
+    try:
+        # 1. PDF is handled page by page in iter_document_text
+        if filename.endswith(".pdf"):
+            return "\n".join(iter_document_text(uploaded_file))
 
         # 2. Handle Word (.docx)
         elif filename.endswith(".docx"):
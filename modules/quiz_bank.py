@@ -0,0 +1,142 @@
+import os
+import json
+import random
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, wait
+from modules.quiz_generator import generate_quiz_from_index, is_valid_question, normalize_question
+from modules.text_cache import CACHE_DIR, sqlite_connection
+
+# Pre-generated questions per (document, difficulty), shared by every session
+QUIZ_BANK_TARGET = int(os.getenv("QUIZ_BANK_TARGET", "40"))
+QUIZ_BANK_LOW_WATER = int(os.getenv("QUIZ_BANK_LOW_WATER", "15"))
+# Live top-ups are added to the pool too, up to this many questions
+QUIZ_BANK_MAX = int(os.getenv("QUIZ_BANK_MAX", "200"))
+QUIZ_BANK_WORKERS = int(os.getenv("QUIZ_BANK_WORKERS", "2"))
+DIFFICULTIES = ("Easy", "Medium", "Hard")
+
+
+class QuizBank:
+    """
+    SQLite pool of validated questions keyed by document hash and difficulty.
+    Pools are shared and never consumed: each session passes the questions it has
+    already seen to take(). A pool is filled in the background, at low LLM priority,
+    the first time its difficulty is requested (and again if it is below QUIZ_BANK_LOW_WATER).
+    """
+
+    def __init__(self, path=None, target=QUIZ_BANK_TARGET, low_water=QUIZ_BANK_LOW_WATER, workers=QUIZ_BANK_WORKERS,
+                 max_size=QUIZ_BANK_MAX):
+        self.path = Path(path) if path else CACHE_DIR / "quiz_bank.sqlite3"
+        self.target = target
+        self.low_water = low_water
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._refilling = set()
+        self._futures = set()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="quiz-bank")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS questions ("
+                " doc_key TEXT NOT NULL,"
+                " difficulty TEXT NOT NULL,"
+                " norm TEXT NOT NULL,"
+                " data TEXT NOT NULL,"
+                " PRIMARY KEY (doc_key, difficulty, norm))"
+            )
+
+    def _connect(self):
+        return sqlite_connection(self.path)
+
+    def count(self, doc_key, difficulty):
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM questions WHERE doc_key = ? AND difficulty = ?", (doc_key, difficulty)
+            ).fetchone()[0]
+
+    def add(self, doc_key, difficulty, questions):
+        """Stores valid questions, skipping duplicates; the pool never grows past max_size."""
+        rows = [
+            (doc_key, difficulty, normalize_question(q["question"]), json.dumps(q))
+            for q in questions if is_valid_question(q)
+        ]
+        with self._lock, self._connect() as conn:
+            size = conn.execute(
+                "SELECT COUNT(*) FROM questions WHERE doc_key = ? AND difficulty = ?", (doc_key, difficulty)
+            ).fetchone()[0]
+            for row in rows:
+                if size >= self.max_size:
+                    break
+                size += conn.execute("INSERT OR IGNORE INTO questions VALUES (?, ?, ?, ?)", row).rowcount
+
+    def take(self, doc_key, difficulty, n, doc_index=None, exclude=()):
+        """
+        Returns up to n random questions from the pool, skipping the normalized
+        question texts in `exclude` (what this session has already been served).
+        The pool itself is left intact. Schedules a fill of this difficulty if the
+        pool is low and doc_index is given.
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT norm, data FROM questions WHERE doc_key = ? AND difficulty = ?", (doc_key, difficulty)
+            ).fetchall()
+        if doc_index is not None and len(rows) < self.low_water:
+            self.ensure(doc_key, doc_index, [difficulty])
+        fresh = [data for norm, data in rows if norm not in exclude]
+        return [json.loads(data) for data in random.sample(fresh, min(n, len(fresh)))]
+
+    def ensure(self, doc_key, doc_index, difficulties=DIFFICULTIES):
+        """Starts background fills for every given pool below the low-water mark."""
+        for difficulty in difficulties:
+            job = (doc_key, difficulty)
+            with self._lock:
+                if job in self._refilling:
+                    continue
+                self._refilling.add(job)
+            if self.count(doc_key, difficulty) >= self.low_water:
+                with self._lock:
+                    self._refilling.discard(job)
+                continue
+            future = self._executor.submit(self._refill, doc_key, difficulty, doc_index)
+            with self._lock:
+                self._futures.add(future)
+            future.add_done_callback(self._forget)
+
+    def _forget(self, future):
+        with self._lock:
+            self._futures.discard(future)
+
+    def drain(self, timeout=None):
+        """Waits for in-flight fills to finish (e.g. before deleting the cache dir)."""
+        with self._lock:
+            pending = list(self._futures)
+        wait(pending, timeout=timeout)
+
+    def _refill(self, doc_key, difficulty, doc_index):
+        try:
+            missing = self.target - self.count(doc_key, difficulty)
+            if missing > 0:
+                questions = generate_quiz_from_index(doc_index, missing, difficulty, background=True)
+                self.add(doc_key, difficulty, questions)
+        except Exception as e:
+            print(f"Quiz bank refill failed: {e}")
+        finally:
+            with self._lock:
+                self._refilling.discard((doc_key, difficulty))
+
+
+_bank = None
+_bank_lock = threading.Lock()
+
+
+def get_quiz_bank():
+    """Process-wide quiz bank (None if the cache dir is not writable)."""
+    global _bank
+    with _bank_lock:
+        if _bank is None:
+            try:
+                _bank = QuizBank()
+            except Exception as e:
+                print(f"Quiz bank disabled: {e}")
+                return None
+    return _bank
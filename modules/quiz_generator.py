@@ -1,18 +1,39 @@
-from modules.llm_handler import _chat
+from modules.llm_handler import _chat, chat_async, affordable_calls, LLMError, LLM_MAX_CONCURRENCY
+from modules.retriever import tokenize
+from concurrent.futures import ThreadPoolExecutor
 import json
+import math
+import queue
 import re
 
-def generate_quiz(context_text: str, num_questions=5, difficulty="Medium"):
-    """
-    Generates specific number of MCQs at a specific difficulty.
-    """
+# Large quizzes are split into batches generated concurrently over different parts of the notes
+QUIZ_BATCH_SIZE = 10
+QUIZ_BATCH_TOKEN_BUDGET = 875
+QUIZ_TOP_UP_ROUNDS = 2
+QUIZ_BATCH_TIMEOUT = 60.0
+# Background batches (quiz bank refills) only use spare rate-limit capacity, so they may wait longer
+QUIZ_BACKGROUND_TIMEOUT = 600.0
+# When the rate limit can't start enough batches before their deadline, batches grow up to this
+# size instead; past that the quiz comes back short rather than failing
+QUIZ_MAX_BATCH_SIZE = 25
+QUIZ_TOKENS_PER_QUESTION = 180
+QUIZ_CONTEXT_CHARS = 3500
+# Questions whose word sets overlap at least this much count as duplicates
+QUIZ_DUPLICATE_THRESHOLD = 0.8
+
+def _quiz_messages(context_text: str, num_questions, difficulty, avoid=None):
+    avoid_block = ""
+    if avoid:
+        listed = "\n".join(f"- {q}" for q in avoid[:20])
+        avoid_block = f"\n    Do NOT repeat or rephrase any of these existing questions:\n{listed}\n"
+
     prompt = f"""
     Create exactly {num_questions} multiple-choice questions based on these notes.
     Difficulty Level: {difficulty}.
-    
-    Return ONLY valid JSON array. 
+
+    Return ONLY valid JSON array.
     IMPORTANT: The 'answer' field must be the INTEGER INDEX (0, 1, 2, or 3) of the correct option.
-    
+    {avoid_block}
     Example format:
     [
         {{
@@ -21,20 +42,302 @@ def generate_quiz(context_text: str, num_questions=5, difficulty="Medium"):
             "answer": 0
         }}
     ]
-    
+
     NOTES:
-    {context_text[:3500]}
-    """
-    
-    messages = [{"role": "user", "content": prompt}]
-    response = _chat(messages, temperature=0.3, max_tokens=4096)
-    
-    # Clean up markdown if present
-    clean_response = re.sub(r'```json|```', '', response).strip()
-    
-    try:
-        quiz_data = json.loads(clean_response)
-        return quiz_data
-    except json.JSONDecodeError:
+    {context_text[:QUIZ_CONTEXT_CHARS]}
+    """
+    return [{"role": "user", "content": prompt}]
+
+# A question object opening: where the parser resynchronises after a malformed item
+_ITEM_START_RE = re.compile(r'\{\s*"question"\s*:$')
+_ITEM_START_WINDOW = 64
+
+class QuizStreamParser:
+    """
+    Incremental, tolerant parser for a JSON array of question objects.
+    Tracks brace depth (ignoring braces inside strings) and decodes each
+    top-level object as soon as it closes. Whenever a new `{"question":`
+    starts inside an unfinished object (an unescaped quote, a missing `}` or a
+    stray `{` in the chatter before the array), the parser drops what it had
+    and restarts at that object, so one bad item only costs itself.
+    """
+
+    def __init__(self):
+        self._buf = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self.rejected = 0
+
+    def feed(self, text):
+        """Consumes more text; returns the valid questions completed by it."""
+        done = []
+        for ch in text:
+            if self._depth == 0:
+                if ch == "{":
+                    self._depth = 1
+                    self._buf = [ch]
+                continue
+
+            self._buf.append(ch)
+            if ch == ":" and self._restart():
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    q = self._decode("".join(self._buf))
+                    if q is not None:
+                        done.append(q)
+        return done
+
+    def _restart(self):
+        """
+        If the buffer ends with the start of a new item that isn't the current
+        object's own, discards everything before it and resets depth and string state.
+        """
+        tail = "".join(self._buf[-_ITEM_START_WINDOW:])
+        match = _ITEM_START_RE.search(tail)
+        if match is None:
+            return False
+        start = len(self._buf) - len(tail) + match.start()
+        if start == 0:
+            return False
+        if '"question"' in "".join(self._buf[:start]):
+            self.rejected += 1
+        self._buf = self._buf[start:]
+        self._depth = 1
+        self._in_string = False
+        self._escape = False
+        return True
+
+    def _decode(self, raw):
+        try:
+            q = json.loads(raw)
+        except json.JSONDecodeError:
+            self.rejected += 1
+            return None
+        if not is_valid_question(q):
+            self.rejected += 1
+            return None
+        return q
+
+def iter_quiz_stream(chunks):
+    """Yields validated questions from a stream of text deltas as each one completes."""
+    parser = QuizStreamParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+
+def _parse_quiz(response):
+    questions = list(iter_quiz_stream([response]))
+    if not questions:
         print("JSON Error. Raw response:", response[:100])
-        return []
\ No newline at end of file
+    return questions
+
+def is_valid_question(q):
+    """Schema check: question text, 4 string options, integer answer in range."""
+    if not isinstance(q, dict):
+        return False
+    options = q.get("options")
+    answer = q.get("answer")
+    return (
+        isinstance(q.get("question"), str) and q["question"].strip() != ""
+        and isinstance(options, list) and len(options) == 4
+        and all(isinstance(o, str) for o in options)
+        and isinstance(answer, int) and not isinstance(answer, bool)
+        and 0 <= answer < len(options)
+    )
+
+def generate_quiz(context_text: str, num_questions=5, difficulty="Medium"):
+    """
+    Generates specific number of MCQs at a specific difficulty.
+    """
+    messages = _quiz_messages(context_text, num_questions, difficulty)
+    try:
+        response = _chat(messages, temperature=0.3, max_tokens=4096)
+    except LLMError as e:
+        print(f"Quiz LLM Error: {e}")
+        return []
+    return _parse_quiz(response)
+
+def normalize_question(text):
+    return " ".join(re.sub(r"[^a-z0-9 ]+", " ", text.lower()).split())
+
+class QuestionSet:
+    """
+    Accumulates questions, dropping exact and near-duplicate ones.
+    Questions in `exclude` (e.g. already served from the quiz bank) count as
+    duplicates but are not part of the set.
+    """
+
+    def __init__(self, exclude=None):
+        self.questions = []
+        self.excluded = [q["question"] for q in exclude or []]
+        self._seen = set()
+        self._token_sets = []
+        for text in self.excluded:
+            self._remember(text)
+
+    def _remember(self, text):
+        self._seen.add(normalize_question(text))
+        self._token_sets.append(set(tokenize(text)))
+
+    def add(self, q):
+        norm = normalize_question(q["question"])
+        if norm in self._seen:
+            return False
+        tokens = set(tokenize(q["question"]))
+        for other in self._token_sets:
+            if tokens and other and len(tokens & other) / len(tokens | other) >= QUIZ_DUPLICATE_THRESHOLD:
+                return False
+        self._remember(q["question"])
+        self.questions.append(q)
+        return True
+
+    def known(self):
+        """Every question text a new batch should avoid (excluded ones first)."""
+        return self.excluded + [q["question"] for q in self.questions]
+
+    def __len__(self):
+        return len(self.questions)
+
+def _batch_max_tokens(size):
+    return max(2048, QUIZ_TOKENS_PER_QUESTION * size)
+
+def _run_batches(contexts, sizes, difficulty, avoid, background=False):
+    """Issues one LLM call per context concurrently; failed batches just yield nothing."""
+    timeout = QUIZ_BACKGROUND_TIMEOUT if background else QUIZ_BATCH_TIMEOUT
+    futures = [
+        chat_async(_quiz_messages(ctx, size, difficulty, avoid), temperature=0.3,
+                   max_tokens=_batch_max_tokens(size), timeout=timeout, background=background)
+        for ctx, size in zip(contexts, sizes)
+    ]
+    batches = []
+    for future in futures:
+        try:
+            batches.append(_parse_quiz(future.result()))
+        except LLMError as e:
+            print(f"Quiz batch failed: {e}")
+            batches.append([])
+    return batches
+
+def _affordable_batches(size, difficulty, within=QUIZ_BATCH_TIMEOUT):
+    """Batches of `size` questions the shared LLM rate limit can start before the batch deadline."""
+    messages = _quiz_messages(" " * QUIZ_CONTEXT_CHARS, size, difficulty)
+    return affordable_calls(messages, _batch_max_tokens(size), within)
+
+def _batch_sizes(missing, difficulty="Medium", within=QUIZ_BATCH_TIMEOUT):
+    """
+    Splits `missing` questions into batches of QUIZ_BATCH_SIZE, or into fewer, larger
+    batches (up to QUIZ_MAX_BATCH_SIZE) when the rate limit can't start that many in time.
+    If even that is unaffordable, only the batches that fit are returned (a short quiz).
+    """
+    wanted = math.ceil(missing / QUIZ_BATCH_SIZE)
+    fewest = math.ceil(missing / QUIZ_MAX_BATCH_SIZE)
+    count = fewest
+    for n in range(wanted, fewest - 1, -1):
+        if _affordable_batches(math.ceil(missing / n), difficulty, within) >= n:
+            count = n
+            break
+    else:
+        count = min(fewest, _affordable_batches(QUIZ_MAX_BATCH_SIZE, difficulty, within))
+        missing = min(missing, count * QUIZ_MAX_BATCH_SIZE)
+    if count <= 0:
+        return []
+    size = math.ceil(missing / count)
+    # Ask for one extra per batch to absorb duplicates and invalid items
+    return [min(size, missing - i * size) + 1 for i in range(count) if missing - i * size > 0]
+
+def _top_up(pool, doc_index, num_questions, difficulty, offset, rounds, background=False):
+    """Runs concurrent batch rounds until the pool is full; yields each question added."""
+    within = QUIZ_BACKGROUND_TIMEOUT if background else QUIZ_BATCH_TIMEOUT
+    for _ in range(rounds):
+        missing = num_questions - len(pool)
+        if missing <= 0:
+            break
+        sizes = _batch_sizes(missing, difficulty, within)
+        if not sizes:
+            print(f"Quiz short by {missing}: LLM rate limit has no capacity for more batches.")
+            break
+        contexts = doc_index.sections(len(sizes), QUIZ_BATCH_TOKEN_BUDGET, offset)
+        avoid = pool.known() or None
+        for batch in _run_batches(contexts, sizes, difficulty, avoid, background):
+            for q in batch:
+                if len(pool) < num_questions and pool.add(q):
+                    yield q
+        offset += 1
+
+def generate_quiz_from_index(doc_index, num_questions=5, difficulty="Medium", background=False):
+    """
+    Map-reduce quiz generation over the whole document.
+    The request is split into batches of QUIZ_BATCH_SIZE, each generated concurrently from a
+    different region of the notes; results are merged, de-duplicated and topped up if short.
+    Batches are sized to what the LLM rate limit allows, so a large request may return
+    fewer questions than asked for instead of failing.
+    background=True runs the batches at low priority (see RequestScheduler).
+    """
+    if doc_index is None or len(doc_index) == 0:
+        return []
+
+    pool = QuestionSet()
+    for _ in _top_up(pool, doc_index, num_questions, difficulty, 0, 1 + QUIZ_TOP_UP_ROUNDS, background):
+        pass
+    return pool.questions
+
+def stream_quiz_from_index(doc_index, num_questions=5, difficulty="Medium", avoid=None):
+    """
+    Streaming variant of generate_quiz_from_index.
+    Batches are streamed concurrently and each valid, non-duplicate question is
+    yielded the moment its JSON object closes. Anything still missing at the end
+    (truncated batches, duplicates) is topped up with regular batch rounds.
+    Questions in `avoid` (already on the quiz) are neither requested nor yielded again.
+    May yield fewer than num_questions when the LLM rate limit runs out.
+    """
+    if doc_index is None or len(doc_index) == 0:
+        return
+
+    sizes = _batch_sizes(num_questions, difficulty)
+    if not sizes:
+        print("Quiz not started: LLM rate limit has no capacity right now.")
+        return
+    contexts = doc_index.sections(len(sizes), QUIZ_BATCH_TOKEN_BUDGET)
+    results = queue.Queue()
+    finished = object()
+    pool = QuestionSet(exclude=avoid)
+    known = pool.known() or None
+
+    def run_batch(ctx, size):
+        try:
+            messages = _quiz_messages(ctx, size, difficulty, known)
+            stream = _chat(messages, temperature=0.3, max_tokens=_batch_max_tokens(size),
+                           timeout=QUIZ_BATCH_TIMEOUT, stream=True)
+            for q in iter_quiz_stream(stream):
+                results.put(q)
+        except LLMError as e:
+            # Questions parsed before the failure have already been delivered
+            print(f"Quiz batch failed: {e}")
+        finally:
+            results.put(finished)
+
+    with ThreadPoolExecutor(max_workers=min(len(sizes), LLM_MAX_CONCURRENCY)) as executor:
+        for ctx, size in zip(contexts, sizes):
+            executor.submit(run_batch, ctx, size)
+        pending = len(sizes)
+        while pending:
+            item = results.get()
+            if item is finished:
+                pending -= 1
+            elif len(pool) < num_questions and pool.add(item):
+                yield item
+
+    yield from _top_up(pool, doc_index, num_questions, difficulty, 1, QUIZ_TOP_UP_ROUNDS)
@@ -0,0 +1,247 @@
+import re
+import math
+from collections.abc import Sequence
+import numpy as np
+
+# Chunking defaults (characters). Overlap keeps sentences that straddle a
+# boundary retrievable from either side.
+CHUNK_SIZE = 1200
+CHUNK_OVERLAP = 200
+
+# Rough chars-per-token ratio for Llama-style tokenizers
+CHARS_PER_TOKEN = 4
+DEFAULT_TOKEN_BUDGET = 750
+
+# BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for",
+    "from", "how", "i", "in", "is", "it", "of", "on", "or", "that", "the", "this",
+    "to", "was", "what", "when", "where", "which", "who", "why", "with", "you",
+}
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def tokenize(text: str):
+    """Lowercase word tokens without stopwords."""
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+
+def _cut(text: str, start: int, chunk_size: int) -> int:
+    """End of the chunk starting at `start`; prefers a natural break in the last third of the window."""
+    n = len(text)
+    end = min(start + chunk_size, n)
+    if end < n:
+        window = text[start + chunk_size * 2 // 3:end]
+        for sep in ("\n\n", "\n", ". "):
+            cut = window.rfind(sep)
+            if cut != -1:
+                return start + chunk_size * 2 // 3 + cut + len(sep)
+    return end
+
+
+def chunk_spans(text: str, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    """
+    (start, end) character offsets of overlapping chunks within `text`.
+    Cuts on a paragraph or sentence boundary near the end of each window when possible;
+    each span is trimmed of surrounding whitespace.
+    """
+    base = len(text) - len(text.lstrip())
+    body = text.strip()
+    spans = []
+    start = 0
+    n = len(body)
+    while start < n:
+        end = _cut(body, start, chunk_size)
+        chunk = body[start:end]
+        lead = len(chunk) - len(chunk.lstrip())
+        trail = len(chunk) - len(chunk.rstrip())
+        if lead < len(chunk):
+            spans.append((base + start + lead, base + end - trail))
+        if end >= n:
+            break
+        start = max(end - overlap, start + 1)
+    return spans
+
+
+def chunk_text(text: str, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    """Splits text into overlapping chunks (see chunk_spans)."""
+    return [text[start:end] for start, end in chunk_spans(text, chunk_size, overlap)]
+
+
+def byte_spans(text: str, spans):
+    """Character spans of `text` -> spans of its UTF-8 encoding, in one pass."""
+    if text.isascii():
+        return spans
+    at, pos, offset = {}, 0, 0
+    for point in sorted({p for span in spans for p in span}):
+        offset += len(text[pos:point].encode("utf-8"))
+        pos = point
+        at[point] = offset
+    return [(at[start], at[end]) for start, end in spans]
+
+
+class TextSlices(Sequence):
+    """
+    Chunks as (start, end) byte offsets into one shared UTF-8 buffer.
+    Each lookup decodes just its slice, so an index over it holds no second copy of the text.
+    """
+
+    def __init__(self, data, spans):
+        self.data = data
+        self.spans = np.asarray(spans, dtype=np.int64).reshape(-1, 2)
+
+    def __len__(self):
+        return len(self.spans)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        start, end = self.spans[i]
+        return str(memoryview(self.data)[start:end], "utf-8")
+
+
+def iter_chunks(sections, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    """
+    Streaming chunk_text over sections (e.g. PDF pages) joined by newlines.
+    Only about one page plus one chunk of text is held at a time.
+    """
+    buf = ""
+    for section in sections:
+        buf = f"{buf}\n{section}" if buf else section.lstrip()
+        while len(buf) > chunk_size:
+            end = _cut(buf, 0, chunk_size)
+            chunk = buf[:end].strip()
+            if chunk:
+                yield chunk
+            buf = buf[max(end - overlap, 1):]
+    yield from chunk_text(buf, chunk_size, overlap)
+
+
+class DocumentIndex:
+    """
+    In-process BM25 index over document chunks.
+    Postings are stored per term as NumPy arrays so scoring a query is a few vector ops.
+    """
+
+    def __init__(self, chunks):
+        # Any sequence works (e.g. a memory-mapped ChunkFile); only read chunks get loaded
+        self.chunks = chunks if isinstance(chunks, Sequence) else list(chunks)
+        self.doc_len = np.zeros(len(self.chunks), dtype=np.float32)
+        self.chunk_chars = np.zeros(len(self.chunks), dtype=np.int64)
+        postings = {}
+
+        for doc_id, chunk in enumerate(self.chunks):
+            tokens = tokenize(chunk)
+            self.doc_len[doc_id] = len(tokens)
+            self.chunk_chars[doc_id] = len(chunk)
+            counts = {}
+            for tok in tokens:
+                counts[tok] = counts.get(tok, 0) + 1
+            for tok, tf in counts.items():
+                postings.setdefault(tok, ([], []))
+                postings[tok][0].append(doc_id)
+                postings[tok][1].append(tf)
+
+        n_docs = len(self.chunks)
+        self.avg_len = float(self.doc_len.mean()) if n_docs else 0.0
+        self.postings = {}
+        for tok, (ids, tfs) in postings.items():
+            df = len(ids)
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            self.postings[tok] = (np.asarray(ids, dtype=np.int32), np.asarray(tfs, dtype=np.float32), idf)
+
+        # Length normalisation is query-independent, so compute it once
+        if n_docs:
+            self._norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_len / max(self.avg_len, 1.0))
+        else:
+            self._norm = np.zeros(0, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def score(self, query: str):
+        scores = np.zeros(len(self.chunks), dtype=np.float32)
+        for tok in set(tokenize(query)):
+            entry = self.postings.get(tok)
+            if entry is None:
+                continue
+            ids, tfs, idf = entry
+            scores[ids] += idf * tfs * (BM25_K1 + 1) / (tfs + self._norm[ids])
+        return scores
+
+    def search(self, query: str, k=4):
+        """Returns [(chunk_id, score)] for the top-k matching chunks."""
+        if not self.chunks:
+            return []
+        scores = self.score(query)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top if scores[i] > 0]
+
+    def _tokens(self, cid):
+        return max(1, int(self.chunk_chars[cid]) // CHARS_PER_TOKEN)
+
+    def _pack(self, chunk_ids, token_budget):
+        """Joins chunks (in document order) until the token budget is spent."""
+        picked, used = [], 0
+        for cid in chunk_ids:
+            cost = self._tokens(cid)
+            if picked and used + cost > token_budget:
+                continue
+            picked.append(cid)
+            used += cost
+        return "\n\n...\n\n".join(self.chunks[cid] for cid in sorted(picked))
+
+    def retrieve(self, query: str, k=4, token_budget=DEFAULT_TOKEN_BUDGET):
+        """
+        Context for a question: the top-k chunks that fit in the token budget.
+        Falls back to the start of the document when nothing matches.
+        """
+        hits = [cid for cid, _ in self.search(query, k)]
+        if not hits:
+            return self.overview(token_budget)
+        return self._pack(hits, token_budget)
+
+    def _spread(self, ids, token_budget, offset=0):
+        """Evenly spaced chunks from `ids` that fit the budget; offset shifts the sample."""
+        per_chunk = max(1, int(np.median(self.chunk_chars[np.asarray(ids)])) // CHARS_PER_TOKEN)
+        count = max(1, min(len(ids), token_budget // per_chunk))
+        ids = np.roll(np.asarray(ids), -offset)
+        picks = np.unique(np.linspace(0, len(ids) - 1, count).round().astype(int))
+        return self._pack([int(ids[p]) for p in picks], token_budget)
+
+    def overview(self, token_budget=DEFAULT_TOKEN_BUDGET):
+        """Evenly spaced chunks across the whole document (for summaries/quizzes)."""
+        if not self.chunks:
+            return ""
+        return self._spread(range(len(self.chunks)), token_budget)
+
+    def sections(self, count, token_budget=DEFAULT_TOKEN_BUDGET, offset=0):
+        """
+        One context per contiguous region of the document, `count` regions in order.
+        Small documents repeat regions; `offset` samples different chunks within each.
+        """
+        if not self.chunks or count < 1:
+            return []
+        n = len(self.chunks)
+        groups = np.array_split(np.arange(n), min(count, n))
+        return [self._spread(groups[i % len(groups)], token_budget, offset + i // len(groups))
+                for i in range(count)]
+
+
+def build_index(text: str, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    return DocumentIndex(chunk_text(text, chunk_size, overlap))
+
+
+def build_index_utf8(data: bytes, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    """Index whose chunks are slices of the UTF-8 buffer `data` (nothing is copied)."""
+    text = str(data, "utf-8")
+    return DocumentIndex(TextSlices(data, byte_spans(text, chunk_spans(text, chunk_size, overlap))))
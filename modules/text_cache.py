@@ -0,0 +1,121 @@
+import os
+import sqlite3
+import threading
+import time
+import zlib
+import hashlib
+from contextlib import contextmanager
+from pathlib import Path
+
+# On-disk cache of extracted document text, keyed by content hash.
+CACHE_DIR = Path(os.getenv("AURALEARN_CACHE_DIR", ".cache"))
+MAX_CACHE_BYTES = int(os.getenv("TEXT_CACHE_MAX_MB", "512")) * 1024 * 1024
+
+_lock = threading.Lock()
+
+
+@contextmanager
+def sqlite_connection(path):
+    """
+    Short-lived WAL connection: commits (or rolls back) on exit and is always closed.
+    sqlite3's own context manager only ends the transaction, leaking the connection.
+    """
+    conn = sqlite3.connect(path, timeout=10)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def content_key(data: bytes, *parts) -> str:
+    """SHA-256 of the raw bytes plus any extra parts (extension, extractor version)."""
+    h = hashlib.sha256(data)
+    for part in parts:
+        h.update(b"\0" + str(part).encode("utf-8"))
+    return h.hexdigest()
+
+
+def file_content_key(path, *parts) -> str:
+    """content_key for a file on disk, hashed in blocks instead of read whole."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    for part in parts:
+        h.update(b"\0" + str(part).encode("utf-8"))
+    return h.hexdigest()
+
+
+class TextCache:
+    """
+    SQLite store of zlib-compressed text with size-bounded LRU eviction.
+    Each call opens its own connection so it is safe across Streamlit threads.
+    """
+
+    def __init__(self, path=None, max_bytes=MAX_CACHE_BYTES):
+        self.path = Path(path) if path else CACHE_DIR / "text_cache.sqlite3"
+        self.max_bytes = max_bytes
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS texts ("
+                " key TEXT PRIMARY KEY,"
+                " data BLOB NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_texts_access ON texts(last_access)")
+
+    def _connect(self):
+        return sqlite_connection(self.path)
+
+    def get(self, key):
+        with _lock, self._connect() as conn:
+            row = conn.execute("SELECT data FROM texts WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE texts SET last_access = ? WHERE key = ?", (time.time(), key))
+        return zlib.decompress(row[0]).decode("utf-8")
+
+    def put(self, key, text: str):
+        blob = zlib.compress(text.encode("utf-8"), 6)
+        if len(blob) > self.max_bytes:
+            return
+        with _lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO texts (key, data, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, blob, len(blob), time.time()),
+            )
+            self._evict(conn)
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM texts").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used entries until we are back under budget
+        for key, size in conn.execute("SELECT key, size FROM texts ORDER BY last_access ASC").fetchall():
+            conn.execute("DELETE FROM texts WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def clear(self):
+        with _lock, self._connect() as conn:
+            conn.execute("DELETE FROM texts")
+
+
+_cache = None
+
+
+def get_text_cache():
+    """Process-wide cache instance (None if the cache dir is not writable)."""
+    global _cache
+    if _cache is None:
+        try:
+            _cache = TextCache()
+        except Exception as e:
+            print(f"Text cache disabled: {e}")
+            return None
+    return _cache
@@ -0,0 +1,222 @@
+import io
+import os
+import re
+import time
+import wave
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from modules.voice_handler import text_to_audio_bytes
+from modules.audio_cache import audio_mime
+
+# Sentences are synthesized in parallel; tiny fragments are merged into the next sentence
+TTS_WORKERS = int(os.getenv("TTS_WORKERS", "4"))
+MIN_SENTENCE_CHARS = 40
+# gTTS writes constant-bitrate MP3 at this rate; used when a clip's header can't be read
+MP3_FALLBACK_KBPS = 32
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+|\n{2,}|\n(?=\s*[-*•\d])")
+_MARKDOWN_RE = re.compile(r"[*_#`>]+")
+
+_executor = ThreadPoolExecutor(max_workers=TTS_WORKERS, thread_name_prefix="tts")
+
+
+def clean_for_speech(text: str) -> str:
+    """Drops markdown markers that a TTS engine would read out loud."""
+    return " ".join(_MARKDOWN_RE.sub("", text).split())
+
+
+class SentenceSplitter:
+    """Turns a stream of text deltas into complete sentences."""
+
+    def __init__(self, min_chars=MIN_SENTENCE_CHARS):
+        self.min_chars = min_chars
+        self._buf = ""
+
+    def feed(self, delta):
+        self._buf += delta
+        sentences = []
+        start = 0
+        for match in _SENTENCE_END_RE.finditer(self._buf):
+            candidate = self._buf[start:match.start()]
+            if len(candidate.strip()) >= self.min_chars:
+                sentences.append(candidate.strip())
+                start = match.end()
+        self._buf = self._buf[start:]
+        return sentences
+
+    def flush(self):
+        rest, self._buf = self._buf.strip(), ""
+        return [rest] if rest else []
+
+
+def join_wav(segments):
+    """Concatenates WAV clips that share one format into a single WAV file."""
+    out = io.BytesIO()
+    with wave.open(out, "wb") as writer:
+        for i, data in enumerate(segments):
+            with wave.open(io.BytesIO(data), "rb") as reader:
+                if i == 0:
+                    writer.setparams(reader.getparams())
+                writer.writeframes(reader.readframes(reader.getnframes()))
+    return out.getvalue()
+
+
+def join_audio(parts):
+    """
+    One playable clip from same-format segments: MP3 frames concatenate cleanly
+    and WAV clips are merged. Returns None if the formats are mixed.
+    """
+    formats = {audio_mime(p) for p in parts}
+    if formats == {"audio/mp3"}:
+        return b"".join(parts)
+    if formats == {"audio/wav"}:
+        try:
+            return join_wav(parts)
+        except (wave.Error, EOFError):
+            pass
+    return None
+
+
+# Layer III bitrates (kbps) for MPEG-1 and MPEG-2/2.5, by header index
+_MP3_KBPS = {
+    3: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+
+
+def _mp3_kbps(data):
+    """Bitrate from the first frame header (after any ID3 tag), or None."""
+    start = 0
+    if data[:3] == b"ID3" and len(data) >= 10:
+        start = 10 + ((data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9])
+    for i in range(start, min(len(data) - 2, start + 4096)):
+        if data[i] == 0xFF and data[i + 1] & 0xE0 == 0xE0:
+            version, layer = (data[i + 1] >> 3) & 3, (data[i + 1] >> 1) & 3
+            index = data[i + 2] >> 4
+            if layer == 1 and version != 1 and 0 < index < 15:
+                return _MP3_KBPS[3 if version == 3 else 2][index]
+    return None
+
+
+def clip_seconds(data):
+    """Playback length of a WAV or (constant-bitrate) MP3 clip."""
+    if audio_mime(data) == "audio/wav":
+        try:
+            with wave.open(io.BytesIO(data), "rb") as reader:
+                return reader.getnframes() / float(reader.getframerate())
+        except (wave.Error, EOFError):
+            return 0.0
+    kbps = _mp3_kbps(data) or MP3_FALLBACK_KBPS
+    return len(data) * 8 / (kbps * 1000.0)
+
+
+def split_sentences(text: str, min_chars=MIN_SENTENCE_CHARS):
+    splitter = SentenceSplitter(min_chars)
+    return splitter.feed(text) + splitter.flush()
+
+
+class SpeechStream:
+    """
+    Pipelined TTS.
+    Sentences are submitted to a thread pool as soon as they are complete, so
+    speech for sentence one is being synthesized while the LLM is still writing
+    later ones. Segments come back in order, and next_clip() lets the caller
+    start playing them before the whole answer has been synthesized.
+    """
+
+    def __init__(self, lang="en", slow=False):
+        self.lang = lang
+        self.slow = slow
+        self._splitter = SentenceSplitter()
+        self._pending = deque()
+        self._spoken = []
+        self._done = []
+        self._queued = []
+        self._clip_end = 0.0
+        self._played = 0.0
+
+    def _submit(self, sentence):
+        spoken = clean_for_speech(sentence)
+        if spoken:
+            self._spoken.append(spoken)
+            self._pending.append(_executor.submit(text_to_audio_bytes, spoken, self.lang, self.slow))
+
+    def feed(self, delta):
+        for sentence in self._splitter.feed(delta):
+            self._submit(sentence)
+
+    def close(self):
+        for sentence in self._splitter.flush():
+            self._submit(sentence)
+
+    def tee(self, deltas):
+        """Passes text deltas through unchanged while queueing their sentences for speech."""
+        for delta in deltas:
+            self.feed(delta)
+            yield delta
+        self.close()
+
+    def ready_segments(self):
+        """Audio segments that are finished and next in order (never blocks)."""
+        out = []
+        while self._pending and self._pending[0].done():
+            data = self._pending.popleft().result()
+            if data:
+                out.append(data)
+        self._done.extend(out)
+        return out
+
+    def segments(self):
+        """Every remaining audio segment, in order (blocks until synthesized)."""
+        self.close()
+        while self._pending:
+            data = self._pending.popleft().result()
+            if data:
+                self._done.append(data)
+                yield data
+
+    def next_clip(self):
+        """
+        Progressive playback: once the previous clip has finished playing, returns
+        every ready segment merged into one clip; otherwise None. Never blocks.
+        """
+        self._queued.extend(self.ready_segments())
+        now = time.monotonic()
+        if not self._queued or now < self._clip_end:
+            return None
+        clip = join_audio(self._queued)
+        if clip is None:
+            # Mixed formats (backend fallback): play them one at a time
+            clip = self._queued.pop(0)
+        else:
+            self._queued = []
+        seconds = clip_seconds(clip)
+        self._clip_end = now + seconds
+        self._played += seconds
+        return clip
+
+    def position(self):
+        """Seconds of speech played so far through next_clip(), to resume the full clip from."""
+        return max(0.0, self._played - max(0.0, self._clip_end - time.monotonic()))
+
+    def audio(self):
+        """
+        Every segment (including those already handed out for playback) joined
+        into one clip. If a backend fallback mixed formats mid-answer, the full
+        text is synthesized in one go.
+        """
+        for _ in self.segments():
+            pass
+        if not self._done:
+            return None
+        clip = join_audio(self._done)
+        if clip is not None:
+            return clip
+        return text_to_audio_bytes(" ".join(self._spoken), self.lang, self.slow)
+
+
+def speak(text: str, lang="en", slow=False):
+    """Sentence-parallel version of text_to_audio_bytes for an already complete text."""
+    speech = SpeechStream(lang, slow)
+    speech.feed(text)
+    return speech.audio()
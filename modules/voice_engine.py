@@ -0,0 +1,278 @@
+import io
+import os
+import json
+import time
+import shutil
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+import speech_recognition as sr
+
+# Backend order per deployment, e.g. VOICE_TTS_BACKENDS="espeak,gtts" for offline-first
+VOICE_TTS_BACKENDS = os.getenv("VOICE_TTS_BACKENDS", "gtts,pyttsx3,espeak")
+VOICE_STT_BACKENDS = os.getenv("VOICE_STT_BACKENDS", "google,vosk,whisper")
+# Backends slower than this (moving average) are demoted behind faster ones
+VOICE_LATENCY_BUDGET = float(os.getenv("VOICE_LATENCY_BUDGET", "1.5"))
+# A single attempt is abandoned after this long if another backend is left to try
+VOICE_BACKEND_TIMEOUT = float(os.getenv("VOICE_BACKEND_TIMEOUT", "6"))
+# ...and the last backend after this long, so a hung engine never hangs voice
+VOICE_FINAL_TIMEOUT = float(os.getenv("VOICE_FINAL_TIMEOUT", "30"))
+# Network backends give up on their own after this long, so abandoned calls don't pile up in the pool
+VOICE_REQUEST_TIMEOUT = float(os.getenv("VOICE_REQUEST_TIMEOUT", "10"))
+VOICE_FAILURE_COOLDOWN = 60.0
+VOSK_MODEL_PATH = os.getenv("VOSK_MODEL_PATH", "model")
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "base")
+
+
+class VoiceError(Exception):
+    """Every configured backend failed."""
+
+
+# ==========================
+# TTS backends
+# ==========================
+
+class GTTSBackend:
+    """Google Translate TTS (network, MP3)."""
+    name = "gtts"
+
+    def available(self):
+        return True
+
+    def synthesize(self, text, lang="en", slow=False):
+        from gtts import gTTS
+        buf = io.BytesIO()
+        gTTS(text=text, lang=lang, slow=slow, timeout=VOICE_REQUEST_TIMEOUT).write_to_fp(buf)
+        return buf.getvalue()
+
+
+class Pyttsx3Backend:
+    """Local OS speech engine via pyttsx3 (offline, WAV)."""
+    name = "pyttsx3"
+    _lock = threading.Lock()  # pyttsx3 drivers are not thread-safe
+
+    def available(self):
+        try:
+            import pyttsx3  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    def synthesize(self, text, lang="en", slow=False):
+        import pyttsx3
+        fd, path = tempfile.mkstemp(suffix=".wav")
+        os.close(fd)
+        try:
+            with self._lock:
+                engine = pyttsx3.init()
+                engine.setProperty("rate", 130 if slow else 175)
+                engine.save_to_file(text, path)
+                engine.runAndWait()
+            with open(path, "rb") as f:
+                return f.read()
+        finally:
+            os.remove(path)
+
+
+class EspeakBackend:
+    """espeak / espeak-ng command line (offline, WAV)."""
+    name = "espeak"
+
+    def __init__(self):
+        self.binary = shutil.which("espeak-ng") or shutil.which("espeak")
+
+    def available(self):
+        return self.binary is not None
+
+    def synthesize(self, text, lang="en", slow=False):
+        result = subprocess.run(
+            [self.binary, "-v", lang, "-s", "130" if slow else "170", "--stdout", text],
+            capture_output=True, check=True, timeout=30,
+        )
+        return result.stdout
+
+
+# ==========================
+# STT backends (take sr.AudioData)
+# ==========================
+
+class GoogleSTT:
+    """Google Web Speech API (network)."""
+    name = "google"
+
+    def available(self):
+        return True
+
+    def transcribe(self, recognizer, audio):
+        if recognizer.operation_timeout is None:
+            recognizer.operation_timeout = VOICE_REQUEST_TIMEOUT
+        return recognizer.recognize_google(audio)
+
+
+class VoskSTT:
+    """Vosk/Kaldi on CPU (offline). Model is loaded once per process."""
+    name = "vosk"
+    _model = None
+    _lock = threading.Lock()
+
+    def available(self):
+        try:
+            import vosk  # noqa: F401
+        except ImportError:
+            return False
+        return os.path.isdir(VOSK_MODEL_PATH)
+
+    def transcribe(self, recognizer, audio):
+        from vosk import Model, KaldiRecognizer
+        with self._lock:
+            if VoskSTT._model is None:
+                VoskSTT._model = Model(VOSK_MODEL_PATH)
+        rec = KaldiRecognizer(VoskSTT._model, 16000)
+        rec.AcceptWaveform(audio.get_raw_data(convert_rate=16000, convert_width=2))
+        text = json.loads(rec.FinalResult()).get("text", "")
+        if not text:
+            raise sr.UnknownValueError()
+        return text
+
+
+class WhisperSTT:
+    """faster-whisper on CPU (offline, whisper.cpp-style quantized inference)."""
+    name = "whisper"
+
+    def available(self):
+        try:
+            import faster_whisper  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    def transcribe(self, recognizer, audio):
+        return recognizer.recognize_faster_whisper(audio, model=WHISPER_MODEL)
+
+
+TTS_BACKENDS = {b.name: b for b in (GTTSBackend, Pyttsx3Backend, EspeakBackend)}
+STT_BACKENDS = {b.name: b for b in (GoogleSTT, VoskSTT, WhisperSTT)}
+
+
+# ==========================
+# Engine
+# ==========================
+
+class _Health:
+    def __init__(self):
+        self.latency = None  # exponential moving average, seconds
+        self.failures = 0
+        self.cooldown_until = 0.0
+
+    def record(self, seconds):
+        self.latency = seconds if self.latency is None else 0.7 * self.latency + 0.3 * seconds
+
+
+class VoiceEngine:
+    """
+    Common front for TTS and STT backends.
+    Backends are tried in configured order, except that ones over the latency
+    budget or recently failing are moved to the back. A slow attempt is
+    abandoned after VOICE_BACKEND_TIMEOUT when there is another backend to try,
+    and the last one after VOICE_FINAL_TIMEOUT.
+    """
+
+    def __init__(self, tts_names=VOICE_TTS_BACKENDS, stt_names=VOICE_STT_BACKENDS,
+                 latency_budget=VOICE_LATENCY_BUDGET, timeout=VOICE_BACKEND_TIMEOUT,
+                 final_timeout=VOICE_FINAL_TIMEOUT):
+        self.tts = self._build(tts_names, TTS_BACKENDS)
+        self.stt = self._build(stt_names, STT_BACKENDS)
+        self.latency_budget = latency_budget
+        self.timeout = timeout
+        self.final_timeout = final_timeout
+        self.health = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="voice")
+
+    @staticmethod
+    def _build(names, registry):
+        if isinstance(names, str):
+            names = [n.strip() for n in names.split(",") if n.strip()]
+        backends = []
+        for name in names:
+            backend = registry[name]() if isinstance(name, str) else name
+            if backend.available():
+                backends.append(backend)
+        return backends
+
+    @property
+    def tts_names(self):
+        return [b.name for b in self.tts]
+
+    def _health(self, name):
+        with self._lock:
+            return self.health.setdefault(name, _Health())
+
+    def _ordered(self, backends):
+        now = time.monotonic()
+
+        def rank(item):
+            i, backend = item
+            h = self._health(backend.name)
+            slow = h.latency is not None and h.latency > self.latency_budget
+            return (h.cooldown_until > now, slow, i)
+
+        return [b for _, b in sorted(enumerate(backends), key=rank)]
+
+    def _run(self, backends, call):
+        if not backends:
+            raise VoiceError("No voice backend available.")
+        errors = []
+        ordered = self._ordered(backends)
+        for i, backend in enumerate(ordered):
+            h = self._health(backend.name)
+            last = i == len(ordered) - 1
+            start = time.monotonic()
+            future = self._executor.submit(call, backend)
+            try:
+                result = future.result(timeout=self.final_timeout if last else self.timeout)
+            except FutureTimeout:
+                # Let it finish in the background, but remember it was slow
+                h.record(time.monotonic() - start)
+                errors.append(f"{backend.name}: timed out")
+                continue
+            except sr.UnknownValueError:
+                # Audio was heard but not understood; another engine won't be faster
+                h.record(time.monotonic() - start)
+                return None, backend.name
+            except Exception as e:
+                h.failures += 1
+                h.cooldown_until = time.monotonic() + VOICE_FAILURE_COOLDOWN
+                errors.append(f"{backend.name}: {e}")
+                continue
+            h.record(time.monotonic() - start)
+            h.failures = 0
+            return result, backend.name
+        raise VoiceError("; ".join(errors))
+
+    def synthesize(self, text, lang="en", slow=False):
+        """Returns (audio bytes, backend name). MP3 for gTTS, WAV for local engines."""
+        return self._run(self.tts, lambda b: b.synthesize(text, lang, slow))
+
+    def transcribe(self, recognizer, audio):
+        """Returns (text or None, backend name) for an sr.AudioData clip."""
+        return self._run(self.stt, lambda b: b.transcribe(recognizer, audio))
+
+    def stats(self):
+        return {
+            name: {"latency": h.latency, "failures": h.failures, "cooling_down": h.cooldown_until > time.monotonic()}
+            for name, h in self.health.items()
+        }
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_voice_engine():
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = VoiceEngine()
+    return _engine
@@ -1,44 +1,197 @@
 import speech_recognition as sr
-from gtts import gTTS
 import tempfile
-import os
+import wave
 import io
+import numpy as np
+from modules.audio_cache import get_audio_cache, audio_key, audio_mime
+from modules.voice_engine import get_voice_engine, VoiceError
+from modules.metrics import timed, observe, cache_result
+
+# Recognizers work at 16 kHz; browser recordings usually arrive at 44.1/48 kHz
+TARGET_RATE = 16000
+FRAME_SECONDS = 0.02
+# A frame counts as speech when it is this many times louder than the noise floor
+SPEECH_FACTOR = 3.0
+SILENCE_PADDING = 0.2
+MIN_NOISE_FLOOR = 30.0
+# The session floor follows each new clip's estimate (moving average) and is
+# never allowed above this share of the clip's loudest frame
+NOISE_FLOOR_SMOOTHING = 0.3
+NOISE_FLOOR_PEAK_RATIO = 1 / (2 * SPEECH_FACTOR)
 
 # Text to Speech
-def text_to_audio_file(text):
+@timed("tts_seconds", fn="bytes")
+def text_to_audio_bytes(text, lang='en', slow=False):
+    """
+    Audio bytes for `text` (MP3, or WAV from a local engine), served from the
+    audio cache when any configured backend has spoken it before.
+    """
+    cache = get_audio_cache()
+    engine = get_voice_engine()
     try:
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".mp3")
-        temp_path = temp_file.name
-        temp_file.close() 
-        tts = gTTS(text=text, lang='en', slow=False)
-        tts.save(temp_path)
-        return temp_path
+        if cache:
+            for name in engine.tts_names:
+                data = cache.get_bytes(audio_key(text, lang, slow, name))
+                if data is not None:
+                    cache_result("audio", True)
+                    return data
+            cache_result("audio", False)
+        data, backend = engine.synthesize(text, lang, slow)
+        observe("tts_audio_bytes", len(data), backend=backend)
+        if cache:
+            cache.put(audio_key(text, lang, slow, backend), data)
+        return data
+    except Exception as e:
+        print(f"TTS Error: {e}")
+        return None
+
+@timed("tts_seconds", fn="file")
+def text_to_audio_file(text, lang='en', slow=False):
+    """
+    Path to an audio file of `text` inside the audio cache (no per-call temp files).
+    The path stays valid for at least AUDIO_CACHE_GRACE_SECONDS after this call.
+    """
+    cache = get_audio_cache()
+    engine = get_voice_engine()
+    try:
+        if cache:
+            for name in engine.tts_names:
+                path = cache.get_path(audio_key(text, lang, slow, name))
+                if path:
+                    cache_result("audio", True)
+                    return path
+            cache_result("audio", False)
+            data, backend = engine.synthesize(text, lang, slow)
+            observe("tts_audio_bytes", len(data), backend=backend)
+            return cache.put(audio_key(text, lang, slow, backend), data)
+
+        # No cache dir available: fall back to a temp file
+        data, _ = engine.synthesize(text, lang, slow)
+        suffix = ".wav" if audio_mime(data) == "audio/wav" else ".mp3"
+        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as temp_file:
+            temp_file.write(data)
+            return temp_file.name
     except Exception as e:
         print(f"TTS Error: {e}")
         return None
 
+# ==========================
+# In-memory audio preparation
+# ==========================
+
+def decode_wav(audio_bytes):
+    """WAV bytes -> (mono int16 samples, sample rate), decoded from memory."""
+    with wave.open(io.BytesIO(memoryview(audio_bytes)), "rb") as reader:
+        rate = reader.getframerate()
+        width = reader.getsampwidth()
+        channels = reader.getnchannels()
+        raw = reader.readframes(reader.getnframes())
+    if width == 2:
+        samples = np.frombuffer(raw, dtype="<i2").astype(np.float32)
+    elif width == 1:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128) * 256
+    elif width == 4:
+        samples = np.frombuffer(raw, dtype="<i4").astype(np.float32) / 65536
+    else:
+        raise ValueError(f"Unsupported sample width: {width}")
+    if channels > 1:
+        samples = samples[: len(samples) - len(samples) % channels].reshape(-1, channels).mean(axis=1)
+    return samples, rate
+
+
+def _frame_rms(samples, rate):
+    frame = max(1, int(rate * FRAME_SECONDS))
+    usable = len(samples) - len(samples) % frame
+    if usable == 0:
+        return np.zeros(0, dtype=np.float32), frame
+    frames = samples[:usable].reshape(-1, frame)
+    return np.sqrt(np.mean(frames * frames, axis=1)), frame
+
+
+def _cap_noise_floor(floor, rms):
+    """Keeps the floor well under the clip's loudest frame, so its speech can't be trimmed away."""
+    if len(rms):
+        floor = min(floor, float(rms.max()) * NOISE_FLOOR_PEAK_RATIO)
+    return max(floor, MIN_NOISE_FLOOR)
+
+
+def estimate_noise_floor(samples, rate):
+    """
+    RMS of the quietest frames; a mic clip almost always starts or ends in room noise.
+    A clip without pauses has no noise to measure, hence the cap relative to its peak.
+    """
+    rms, _ = _frame_rms(samples, rate)
+    if not len(rms):
+        return MIN_NOISE_FLOOR
+    return _cap_noise_floor(float(np.percentile(rms, 10)), rms)
+
+
+def trim_silence(samples, rate, noise_floor):
+    """Cuts leading/trailing frames that stay under the noise floor (keeps a little padding)."""
+    rms, frame = _frame_rms(samples, rate)
+    voiced = np.flatnonzero(rms > noise_floor * SPEECH_FACTOR)
+    if not len(voiced):
+        return samples[:0]
+    pad = int(SILENCE_PADDING / FRAME_SECONDS)
+    start = max(0, voiced[0] - pad) * frame
+    end = min(len(rms), voiced[-1] + 1 + pad) * frame
+    return samples[start:end]
+
+
+def resample(samples, rate, target=TARGET_RATE):
+    if rate <= target or not len(samples):
+        return samples, rate
+    if rate % target == 0:
+        step = rate // target
+        usable = len(samples) - len(samples) % step
+        return samples[:usable].reshape(-1, step).mean(axis=1), target
+    length = int(len(samples) * target / rate)
+    positions = np.linspace(0, len(samples) - 1, length)
+    return np.interp(positions, np.arange(len(samples)), samples), target
+
+
+def prepare_audio(audio_bytes, session=None):
+    """
+    Decoded, downsampled, silence-trimmed sr.AudioData (None if the clip is silent).
+    `session` is any mapping (e.g. st.session_state) that keeps a moving average
+    of the noise floor across clips, so one odd clip doesn't skew the rest.
+    """
+    samples, rate = decode_wav(audio_bytes)
+    samples, rate = resample(samples, rate)
+    floor = estimate_noise_floor(samples, rate)
+    if session is not None:
+        previous = session.get("noise_floor")
+        if previous is not None:
+            rms, _ = _frame_rms(samples, rate)
+            floor = _cap_noise_floor(previous + NOISE_FLOOR_SMOOTHING * (floor - previous), rms)
+        session["noise_floor"] = floor
+    samples = trim_silence(samples, rate, floor)
+    if not len(samples):
+        return None
+    pcm = np.clip(samples, -32768, 32767).astype("<i2").tobytes()
+    return sr.AudioData(pcm, rate, 2)
+
+
 # Cloud Transcriber (Fast)
-def transcribe_audio_bytes(audio_bytes):
+@timed("stt_seconds")
+def transcribe_audio_bytes(audio_bytes, session=None):
+    """Transcribes mic_recorder WAV bytes without touching the disk."""
+    observe("stt_input_bytes", len(audio_bytes))
+    try:
+        audio_data = prepare_audio(audio_bytes, session)
+    except (wave.Error, EOFError, ValueError) as e:
+        print(f"Audio decode error: {e}")
+        return None
+    if audio_data is None:
+        return None
+
     r = sr.Recognizer()
-    # Improve accuracy for technical terms
-    r.energy_threshold = 300
-    r.dynamic_energy_threshold = True
-    
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp_file:
-            tmp_file.write(audio_bytes)
-            tmp_path = tmp_file.name
-        
-        with sr.AudioFile(tmp_path) as source:
-            # Adjust for noise first
-            r.adjust_for_ambient_noise(source, duration=0.5)
-            audio_data = r.record(source) # Read whole file
-            # Use Google's better recognition model if available (default uses it)
-            text = r.recognize_google(audio_data)
-            
-        os.remove(tmp_path)
+        # Configured STT backends, fastest healthy one first
+        text, _ = get_voice_engine().transcribe(r, audio_data)
         return text
-    except:
+    except VoiceError as e:
+        print(f"STT Error: {e}")
         return None
 
 # Local Transcriber (Fallback)
@@ -50,6 +203,10 @@ def listen_to_user():
         try:
             # Short timeout for faster response
             audio = r.listen(source, timeout=3, phrase_time_limit=4)
-            text = r.recognize_google(audio)
+            text, _ = get_voice_engine().transcribe(r, audio)
             return text
-        except: return None
\ No newline at end of file
+        except sr.WaitTimeoutError:
+            return None
+        except VoiceError as e:
+            print(f"STT Error: {e}")
+            return None
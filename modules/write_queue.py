@@ -0,0 +1,254 @@
+import os
+import json
+import time
+import random
+import threading
+from pathlib import Path
+from modules.text_cache import CACHE_DIR, sqlite_connection
+from modules.metrics import timer, observe, count
+
+# Writes are held this long so several can share one multi-path update
+WRITE_FLUSH_INTERVAL = float(os.getenv("WRITE_FLUSH_INTERVAL", "1.0"))
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", "100"))
+WRITE_MAX_BACKOFF = 300.0
+# After this many failed attempts a write is moved to the `failed` table (kept, and reported)
+WRITE_MAX_ATTEMPTS = int(os.getenv("WRITE_MAX_ATTEMPTS", "50"))
+# Firebase answers these when the auth token has expired or been revoked
+AUTH_ERROR_CODES = (401, 403)
+
+
+def _status_code(error):
+    """HTTP status behind a requests/pyrebase error (pyrebase wraps the original HTTPError)."""
+    for candidate in (error, *getattr(error, "args", ())):
+        response = getattr(candidate, "response", None)
+        if response is not None and getattr(response, "status_code", None) is not None:
+            return response.status_code
+    return None
+
+
+class WriteQueue:
+    """
+    Write-behind queue for Firebase writes.
+    enqueue() journals the write to SQLite and returns at once. A background
+    thread groups pending writes per user into one multi-path update
+    (PATCH /users/<uid> with {"history/<key>": ...}) and deletes them from the
+    journal only after the update succeeds. Failed batches are retried with
+    backoff; anything still journaled at startup is replayed.
+
+    Auth tokens are kept in memory only. Writes that need one wait, without
+    using up attempts, until authorize() or enqueue() supplies a fresh token
+    for that user (after a restart, or once Firebase rejects the old one).
+    """
+
+    def __init__(self, db_factory, path=None, interval=WRITE_FLUSH_INTERVAL, batch_size=WRITE_BATCH_SIZE):
+        self.db_factory = db_factory
+        self.path = Path(path) if path else CACHE_DIR / "write_journal.sqlite3"
+        self.interval = interval
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._idle = threading.Event()
+        self._tokens = {}  # user_id -> freshest auth token seen (never journaled)
+        self._keygen = None
+        self.written = 0
+        self.batches = 0
+        self.failures = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS pending ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " user_id TEXT NOT NULL, path TEXT NOT NULL, data TEXT NOT NULL,"
+                " auth INTEGER NOT NULL DEFAULT 0,"
+                " attempts INTEGER NOT NULL DEFAULT 0, next_at REAL NOT NULL DEFAULT 0)"
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(pending)")}
+            if "auth" not in columns:
+                conn.execute("ALTER TABLE pending ADD COLUMN auth INTEGER NOT NULL DEFAULT 0")
+            if "token" in columns:
+                # Journals from older versions stored tokens in plain text: keep the flag, scrub the token
+                conn.execute("UPDATE pending SET auth = 1, token = NULL WHERE token IS NOT NULL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS failed ("
+                " id INTEGER PRIMARY KEY,"
+                " user_id TEXT NOT NULL, path TEXT NOT NULL, data TEXT NOT NULL,"
+                " attempts INTEGER NOT NULL, error TEXT, failed_at REAL NOT NULL)"
+            )
+        self._thread = threading.Thread(target=self._run, name="write-queue", daemon=True)
+        self._thread.start()
+
+    def _connect(self):
+        return sqlite_connection(self.path)
+
+    def new_key(self):
+        """Firebase push key generated locally (chronological, like push())."""
+        with self._lock:
+            if self._keygen is None:
+                self._keygen = self.db_factory()
+            if self._keygen is None:
+                return None
+            return self._keygen.generate_key()
+
+    def authorize(self, user_id, token):
+        """Supplies a fresh token (e.g. at sign-in) so that user's waiting writes can go out."""
+        if not token:
+            return
+        with self._lock:
+            self._tokens[user_id] = token
+        self._idle.clear()
+        self._wake.set()
+
+    def enqueue(self, user_id, path, data, token=None):
+        """Journals a write of `data` to users/<user_id>/<path>."""
+        with self._lock:
+            if token:
+                self._tokens[user_id] = token
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT INTO pending (user_id, path, data, auth) VALUES (?, ?, ?, ?)",
+                    (user_id, path, json.dumps(data), 1 if token else 0),
+                )
+                backlog = conn.execute("SELECT COUNT(*) FROM pending").fetchone()[0]
+        self._idle.clear()
+        if backlog >= self.batch_size:
+            self._wake.set()
+
+    def _sendable(self):
+        """SQL condition and parameters for rows that have the token they need."""
+        with self._lock:
+            users = list(self._tokens)
+        marks = ",".join("?" * len(users))
+        return (f"(auth = 0 OR user_id IN ({marks}))" if users else "auth = 0"), users
+
+    def pending(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM pending").fetchone()[0]
+
+    def waiting(self):
+        """Journaled writes held back until their user signs in again."""
+        condition, params = self._sendable()
+        with self._connect() as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM pending WHERE NOT {condition}", params).fetchone()[0]
+
+    def failed(self, user_id=None):
+        """Writes given up on after WRITE_MAX_ATTEMPTS (kept in the journal's `failed` table)."""
+        with self._connect() as conn:
+            if user_id is None:
+                return conn.execute("SELECT COUNT(*) FROM failed").fetchone()[0]
+            return conn.execute("SELECT COUNT(*) FROM failed WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+    def flush(self, timeout=None):
+        """
+        Asks for an immediate flush and waits until every write that can be sent
+        has been (or timeout). Writes waiting for a token don't hold this up.
+        """
+        self._wake.set()
+        return self._idle.wait(timeout)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                while self._flush_due():
+                    pass
+            except Exception as e:
+                print(f"Write queue error: {e}")
+
+    def _flush_due(self):
+        """Sends one round of due writes. Returns True if more may be waiting."""
+        now = time.time()
+        condition, params = self._sendable()
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, user_id, path, data, attempts FROM pending"
+                f" WHERE next_at <= ? AND {condition} ORDER BY id LIMIT ?",
+                (now, *params, self.batch_size),
+            ).fetchall()
+            if not rows:
+                if not conn.execute(f"SELECT COUNT(*) FROM pending WHERE {condition}", params).fetchone()[0]:
+                    self._idle.set()
+                return False
+
+        by_user = {}
+        for row in rows:
+            by_user.setdefault(row[1], []).append(row)
+
+        db = self.db_factory()
+        for user_id, group in by_user.items():
+            # Later writes to the same path win, as they would with separate pushes
+            update = {path: json.loads(data) for _, _, path, data, _ in group}
+            with self._lock:
+                token = self._tokens.get(user_id)
+            ids = [row[0] for row in group]
+            try:
+                if db is None:
+                    raise RuntimeError("Firebase is not configured")
+                with timer("db_batch_write_seconds"):
+                    db.child("users").child(user_id).update(update, token=token)
+                observe("db_batch_write_size", len(update))
+            except Exception as e:
+                if token and _status_code(e) in AUTH_ERROR_CODES:
+                    self._await_token(user_id, token, len(group))
+                else:
+                    self._retry_later(group, e)
+                continue
+            with self._connect() as conn:
+                conn.executemany("DELETE FROM pending WHERE id = ?", [(i,) for i in ids])
+            self.written += len(ids)
+            self.batches += 1
+        return len(rows) == self.batch_size
+
+    def _await_token(self, user_id, token, n):
+        """The token was rejected: hold the user's writes (no attempt used) until a new one arrives."""
+        with self._lock:
+            if self._tokens.get(user_id) == token:
+                del self._tokens[user_id]
+        count("db_writes_awaiting_auth_total", n)
+        print(f"Write queue: auth token for {user_id} rejected, holding {n} write(s) until next sign-in")
+
+    def _retry_later(self, group, error):
+        self.failures += 1
+        print(f"Write queue: batch of {len(group)} failed, will retry ({error})")
+        # One delay for the whole group so it is retried as a single batch again
+        worst = max(row[4] for row in group) + 1
+        retry_at = time.time() + random.uniform(0, min(WRITE_MAX_BACKOFF, 2.0 ** worst))
+        with self._connect() as conn:
+            for row_id, user_id, path, data, attempts in group:
+                attempts += 1
+                if attempts >= WRITE_MAX_ATTEMPTS:
+                    # Not dropped: parked in `failed`, counted, and reported to the user via failed()
+                    print(f"Write queue: giving up on {path} for {user_id} after {attempts} attempts ({error})")
+                    count("db_writes_failed_total")
+                    conn.execute(
+                        "INSERT OR REPLACE INTO failed VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (row_id, user_id, path, data, attempts, str(error), time.time()),
+                    )
+                    conn.execute("DELETE FROM pending WHERE id = ?", (row_id,))
+                    continue
+                conn.execute(
+                    "UPDATE pending SET attempts = ?, next_at = ? WHERE id = ?", (attempts, retry_at, row_id)
+                )
+
+    def stats(self):
+        return {
+            "pending": self.pending(), "waiting": self.waiting(), "failed": self.failed(),
+            "written": self.written, "batches": self.batches, "failures": self.failures,
+        }
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_write_queue(db_factory):
+    """Process-wide write queue (None if the journal cannot be created)."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            try:
+                _queue = WriteQueue(db_factory)
+            except Exception as e:
+                print(f"Write queue disabled: {e}")
+                return None
+    return _queue